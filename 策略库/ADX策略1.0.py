@@ -3,6 +3,12 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars
+from optimizer import parameter_optimization
+from signal_pipeline import SignalPipeline, vectorizable
+from indicator_engine import wilder
 from itertools import product
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -10,62 +16,93 @@ import seaborn as sns
 import numpy as np
 
 
-def ADX(target_assets, paths,window_1=28):
-    #信号结果字典
-    results = {}
-    #全数据字典，包含计算指标用于检查
-    full_info={}
+def ADX_prepare(code, paths):
+    """
+    与参数无关的部分：读取数据，计算 TR、+DM、-DM
+    """
+    # 读取数据
+    daily_data = load_bars(code, 'daily', paths)
+    df=daily_data.copy()
+    #
+    df['high_low'] = df['high'] - df['low']
+    df['high_close'] = np.abs(df['high'] - df['close'].shift())
+    df['low_close'] = np.abs(df['low'] - df['close'].shift())
+    df['TR'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
     
-    #编写策略主体部分
-    for code in target_assets:
-        # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
-        df=daily_data.copy()
-        #
-        df['high_low'] = df['high'] - df['low']
-        df['high_close'] = np.abs(df['high'] - df['close'].shift())
-        df['low_close'] = np.abs(df['low'] - df['close'].shift())
-        df['TR'] = df[['high_low', 'high_close', 'low_close']].max(axis=1)
-        
-        # 计算 Directional Movement (+DM 和 -DM)
-        df['+DM'] = np.where((df['high'] > df['high'].shift()) & 
-                            (df['high'] - df['high'].shift() > df['low'].shift() - df['low']), 
-                            df['high'] - df['high'].shift(), 0)
-        df['-DM'] = np.where((df['low'].shift() > df['low']) & 
-                            (df['low'].shift() - df['low'] > df['high'] - df['high'].shift()), 
-                            df['low'].shift() - df['low'], 0)
-        
-        # 平滑 +DM, -DM 和 TR
-        df['smoothed+DM'] = df['+DM'].ewm(alpha=1/window_1, adjust=False).mean()
-        df['smoothed-DM'] = df['-DM'].ewm(alpha=1/window_1, adjust=False).mean()
-        df['smoothed_TR'] = df['TR'].ewm(alpha=1/window_1, adjust=False).mean()
-        
-        # 计算 +DI 和 -DI，衡量正向和负向运动的强度
-        df['+DI'] = 100 * (df['smoothed+DM'] / df['smoothed_TR'])
-        df['-DI'] = 100 * (df['smoothed-DM'] / df['smoothed_TR'])
-        
-        # 计算 DX 和 ADX，ADX 表示趋势的强度，不考虑趋势的方向
-        
-        df['DX'] = 100 * np.abs(df['+DI'] - df['-DI']) / (df['+DI'] + df['-DI'])
-        df['ADX'] = df['DX'].ewm(alpha=1/window_1, adjust=False).mean()
-        df['signal'] = 0
-
-        #看多为1，看空为-1
-        df.loc[df['+DI'] > df['-DI'], 'signal'] = 1
-        df.loc[df['+DI'] < df['-DI'], 'signal'] = -1
-        result=df
-
-        # 将信号合并回每日数据
-        daily_data = daily_data.join(result[['signal']], how='left')
-        daily_data[['signal']].fillna(0, inplace=True)
-        daily_data=daily_data.dropna()
-
-        # 存储结果
-        results[code] = daily_data
-        full_info[code]=result
-
-    return results,full_info
+    # 计算 Directional Movement (+DM 和 -DM)
+    df['+DM'] = np.where((df['high'] > df['high'].shift()) & 
+                        (df['high'] - df['high'].shift() > df['low'].shift() - df['low']), 
+                        df['high'] - df['high'].shift(), 0)
+    df['-DM'] = np.where((df['low'].shift() > df['low']) & 
+                        (df['low'].shift() - df['low'] > df['high'] - df['high'].shift()), 
+                        df['low'].shift() - df['low'], 0)
+    return daily_data, df
+
+def ADX_lines_batch(prepared, window_1):
+    """
+    依赖 window_1 的指标部分，一次计算一组 window_1：平滑 +DM、-DM、TR，计算 DI、DX 与 ADX
+
+    返回：
+    - {(window_1,): (daily_data, df)}
+    """
+    daily_data, df = prepared
+    windows = list(window_1)
+
+    # 平滑 +DM, -DM 和 TR，每列对应一个窗口
+    smoothed_pdm = wilder(df['+DM'], windows)
+    smoothed_mdm = wilder(df['-DM'], windows)
+    smoothed_tr = wilder(df['TR'], windows)
+
+    # 计算 +DI 和 -DI，衡量正向和负向运动的强度
+    pdi = 100 * (smoothed_pdm / smoothed_tr)
+    mdi = 100 * (smoothed_mdm / smoothed_tr)
+
+    # 计算 DX 和 ADX，ADX 表示趋势的强度，不考虑趋势的方向
+    dx = 100 * np.abs(pdi - mdi) / (pdi + mdi)
+    adx = wilder(dx, windows)
+
+    outputs = {}
+    for j, window in enumerate(windows):
+        lines = df.copy()
+        lines['smoothed+DM'] = smoothed_pdm[:, j]
+        lines['smoothed-DM'] = smoothed_mdm[:, j]
+        lines['smoothed_TR'] = smoothed_tr[:, j]
+        lines['+DI'] = pdi[:, j]
+        lines['-DI'] = mdi[:, j]
+        lines['DX'] = dx[:, j]
+        lines['ADX'] = adx[:, j]
+        outputs[(window,)] = (daily_data, lines)
+    return outputs
+
+@vectorizable(ADX_lines_batch, 'window_1')
+def ADX_lines(prepared, window_1=28):
+    """
+    依赖 window_1 的指标部分，参数扫描时由 ADX_lines_batch 一次算出全部窗口
+    """
+    return ADX_lines_batch(prepared, [window_1])[(window_1,)]
+
+def ADX_signal(lines):
+    """
+    根据 DI 生成信号并合并回每日数据
+    """
+    daily_data, df = lines
+    df=df.copy()
+    df['signal'] = 0
+
+    #看多为1，看空为-1
+    df.loc[df['+DI'] > df['-DI'], 'signal'] = 1
+    df.loc[df['+DI'] < df['-DI'], 'signal'] = -1
+    result=df
+
+    # 将信号合并回每日数据
+    daily_data = daily_data.join(result[['signal']], how='left')
+    daily_data[['signal']].fillna(0, inplace=True)
+    daily_data=daily_data.dropna()
+
+    return daily_data, result
+
+#信号函数，调用方式与其他策略的信号函数相同：ADX(target_assets, paths, window_1=28)
+ADX = SignalPipeline(ADX_prepare, ADX_lines, ADX_signal, name='ADX')
 
 # 自定义数据类，包含 'signal'
 class PandasDataPlusSignal(bt.feeds.PandasData):
@@ -75,17 +112,17 @@ class PandasDataPlusSignal(bt.feeds.PandasData):
     )
 
 # 策略类，包含资产仓位设置、调试信息和导出方法
-class ADX_Strategy(bt.Strategy):
+class ADX_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.16),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -97,8 +134,9 @@ class ADX_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -114,22 +152,26 @@ class ADX_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -150,19 +192,11 @@ class ADX_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
@@ -194,147 +228,70 @@ def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commi
 
 
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'D:\数据库\同花顺ETF跟踪指数量价数据\1d',
-    'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
-    'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'D:\数据库\同花顺ETF跟踪指数量价数据\1d',
+        'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
+        'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
+    }
 
-# 资产列表
-target_assets = [
-    "000016.SH",
-    "000300.SH",
-    "000852.SH",
-    "000905.SH",
-    "399006.SZ",
-    "399303.SZ"
-]
+    # 资产列表
+    target_assets = [
+        "000016.SH",
+        "000300.SH",
+        "000852.SH",
+        "000905.SH",
+        "399006.SZ",
+        "399303.SZ"
+    ]
 
 
 
-# 生成信号
-strategy_results,full_info = ADX(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = ADX(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(ADX_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
+    # 获取策略实例
+    strat = run_backtest(ADX_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-index_price_path=paths['daily']
-AT.plot_results('000906.SH',index_price_path, portfolio_value, drawdown_ts, returns, metrics)
+    # 获取净值序列
+    index_price_path=paths['daily']
+    AT.plot_results('000906.SH',index_price_path, portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
-#蒙特卡洛测试
+    #蒙特卡洛测试
 
-AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
+    AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
 
 
 
-#定义参数优化函数
-def parameter_optimization(parameter_grid, strategy_function, strategy_class, target_assets, paths, cash=100000.0, commission=0.0002, slippage_perc=0.0005, metric='sharpe_ratio'):   
-    """
-    执行参数优化，支持一个或两个参数。
-
-    参数：
-    - parameter_grid: 字典，包含参数名称和要测试的取值列表。例如：{'window_1': [30, 34, 38]}
-    - strategy_function: 生成信号的策略函数，例如 UDVD
-    - strategy_class: Backtrader 策略类，例如 UDVD_Strategy
-    - target_assets: 资产列表
-    - paths: 数据路径字典
-    - cash: 初始资金
-    - commission: 佣金
-    - slippage_perc: 滑点百分比
-    - metric: 选择用于评估的绩效指标，默认为 'sharpe_ratio'
-    """
+    # 定义参数网格
+    parameter_grid = {
+        'window_1': range(10, 100, 2),
+    }
 
-    #加载数据类
-
-    # 获取参数名称和取值列表
-    param_names = list(parameter_grid.keys())
-    param_values = [parameter_grid[key] for key in param_names]
-
-    # 生成所有参数组合
-    param_combinations = [dict(zip(param_names, values)) for values in product(*param_values)]
-
-    results = []
-
-    for params in param_combinations:
-        print(f"正在测试参数组合：{params}")
-        # 生成当前参数下的信号
-        strategy_results, full_info = strategy_function(target_assets, paths, **params)
-
-        # 运行回测
-        strat = run_backtest(strategy_class, target_assets, strategy_results, cash, commission, slippage_perc)
-
-        # 获取净值序列
-        pv = strat.get_net_value_series()
-
-        # 计算绩效指标
-        portfolio_value, returns, drawdown_ts, metrics =AT.performance_analysis(pv)
-
-        # 收集指标和参数
-        result_entry = {k: v for k, v in params.items()}
-        result_entry.update(metrics)
-        results.append(result_entry)
-
-    # 将结果转换为 DataFrame
-    results_df = pd.DataFrame(results)
-
-    # 可视化结果
-    if len(param_names) == 1:
-        # 绘制参数与绩效指标的关系曲线
-        param = param_names[0]
-        plt.figure(figsize=(10, 6))
-        plt.plot(results_df[param], results_df[metric], marker='o')
-        plt.xlabel(param)
-        plt.ylabel(metric)
-        plt.title(f'{metric} vs {param}')
-        plt.grid(True)
-        plt.show()
-    elif len(param_names) == 2:
-        # 绘制热力图
-        param1 = param_names[0]
-        param2 = param_names[1]
-        pivot_table = results_df.pivot(index=param1, columns=param2, values=metric)
-
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(pivot_table, annot=True, fmt=".4f", cmap='viridis')
-        plt.title(f'{metric} Heatmap')
-        plt.ylabel(param1)
-        plt.xlabel(param2)
-        plt.show()
-    else:
-        print("无法可视化超过两个参数的结果，请减少参数数量。")
-
-    # 返回结果 DataFrame
-    return results_df
-
-
-# 定义参数网格
-parameter_grid = {
-    'window_1': range(10, 100, 2),
-}
-
-# 运行参数优化
-# results_df = parameter_optimization(
-#     parameter_grid=parameter_grid,
-#     strategy_function=ADX,
-#     strategy_class=ADX_Strategy,
-#     target_assets=target_assets,
-#     paths=paths,
-#     cash=10000000,
-#     commission=0.0002,
-#     slippage_perc=0.0005,
-#     metric='sharpe_ratio'
-# )
+    # 运行参数优化
+    # results_df = parameter_optimization(
+    #     parameter_grid=parameter_grid,
+    #     strategy_function=ADX,
+    #     strategy_class=ADX_Strategy,
+    #     target_assets=target_assets,
+    #     paths=paths,
+    #     run_backtest_func=run_backtest,
+    #     cash=10000000,
+    #     commission=0.0002,
+    #     slippage_perc=0.0005,
+    #     metric='sharpe_ratio'
+    # )
@@ -3,65 +3,96 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars, register_dataset
+from signal_tools import sign_signal
+from optimizer import parameter_optimization
+from signal_pipeline import SignalPipeline, vectorizable
+from indicator_engine import sma, rolling_std
 from itertools import product
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-def BBS(target_assets, paths,window_1=174):
-    #信号结果字典
-    results = {}
-    #全数据字典，包含计算指标用于检查
-    full_info={}
-    free_turn_path=paths['free_turn_path']
-
-    #编写策略主体部分
-    for code in target_assets:
-        # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
-
-        df=daily_data.copy()
-        code=df.iloc[0,0]
-
-        def get_free_turn_data(code,free_turn_path):
-            file = r"D:\数据库\同花顺指数自由流通换手率"
+# 同花顺指数自由流通换手率，每个指数一个文件，读取后转为小数；paths['free_turn_path'] 指定目录
+FREE_TURN = register_dataset(
+    'free_turn', r"D:\数据库\同花顺指数自由流通换手率", path_key='free_turn_path', per_asset=True,
+    columns=["ths_free_turnover_ratio_index"], rename={"ths_free_turnover_ratio_index": "换手率（基于自由流通市值）"},
+    divisor=100)
 
-            filename = file + '\\' + code + '.csv'
+def get_free_turn_data(code,free_turn_path):
+    # 经辅助数据集缓存读取，同一指数的文件在一个进程内只解析一次
+    return FREE_TURN.load({'free_turn_path': free_turn_path}, code=code)
 
-            data = pd.read_csv(filename, index_col=[0])
+def BBS_prepare(code, paths):
+    """
+    与参数无关的部分：读取数据，合并自由流通换手率，计算涨跌幅
+    """
+    free_turn_path=paths['free_turn_path']
+    # 读取数据
+    daily_data = load_bars(code, 'daily', paths)
 
-            data.index=pd.to_datetime(data.index)
+    df=daily_data.copy()
+    code=df.iloc[0,0]
 
-            data=data[["ths_free_turnover_ratio_index"]]
+    free_turn=get_free_turn_data(code,free_turn_path).dropna()
+    free_turn.index=pd.to_datetime(free_turn.index)
+    total=pd.merge(df,free_turn,right_index=True,left_index=True)
+    total.loc[:,"pct"]=total['close'].pct_change()
+    return daily_data, total
 
-            data.columns=["换手率（基于自由流通市值）"]
+def BBS_lines_batch(prepared, window_1):
+    """
+    依赖 window_1 的指标部分，一次计算一组 window_1：换手率均线、波动率、牛熊指标及其 20/60 日均线
 
-            data = data / 100
+    返回：
+    - {(window_1,): (daily_data, total)}
+    """
+    daily_data, total = prepared
+    windows = list(window_1)
+    free_turn_ma = sma(total['换手率（基于自由流通市值）'], windows)
+    std = rolling_std(total['pct'], windows)
+    bull_bear = std / free_turn_ma
+    # 牛熊指标每列对应一个窗口，20/60 日均线逐列计算
+    short_ma = sma(bull_bear, 20)
+    long_ma = sma(bull_bear, 60)
+
+    outputs = {}
+    for j, window in enumerate(windows):
+        lines = total.copy()
+        lines.loc[:,"free_turn_ma"]=free_turn_ma[:, j]
+        lines.loc[:,"std"]=std[:, j]
+        lines['bull_bear']=bull_bear[:, j]
+        lines['short_MA']=short_ma[:, j]
+        lines['long_MA']=long_ma[:, j]
+        lines['diff']=lines['short_MA']-lines['long_MA']
+        outputs[(window,)] = (daily_data, lines)
+    return outputs
+
+@vectorizable(BBS_lines_batch, 'window_1')
+def BBS_lines(prepared, window_1=174):
+    """
+    依赖 window_1 的指标部分，参数扫描时由 BBS_lines_batch 一次算出全部窗口
+    """
+    return BBS_lines_batch(prepared, [window_1])[(window_1,)]
 
-            return data
-        
-        free_turn=get_free_turn_data(code,free_turn_path).dropna()
-        free_turn.index=pd.to_datetime(free_turn.index)
-        total=pd.merge(df,free_turn,right_index=True,left_index=True)
-        total.loc[:,"free_turn_ma"]=total['换手率（基于自由流通市值）'].rolling(window_1).mean()
-        total.loc[:,"pct"]=total['close'].pct_change()
-        total.loc[:,"std"]=total['pct'].rolling(window_1).std()
-        total['bull_bear']=total['std']/total['free_turn_ma']
-        total['short_MA']=total['bull_bear'].rolling(20).mean()
-        total['long_MA']=total['bull_bear'].rolling(60).mean()
-        total['diff']=total['short_MA']-total['long_MA']
-        # 添加signal列，使用apply函数
-        total['signal'] = total['diff'].apply(lambda x: -1 if x > 0 else 1)
-        # 将信号合并回每日数据
-        daily_data = daily_data.join(total[['signal']], how='left')
-        daily_data[['signal']].fillna(0, inplace=True)
-        daily_data=daily_data.dropna()
+def BBS_signal(lines):
+    """
+    根据牛熊指标均线差生成信号并合并回每日数据
+    """
+    daily_data, total = lines
+    total=total.copy()
+    # 添加signal列
+    total['signal'] = sign_signal(total['diff'], above=-1, below=1)
+    # 将信号合并回每日数据
+    daily_data = daily_data.join(total[['signal']], how='left')
+    daily_data[['signal']].fillna(0, inplace=True)
+    daily_data=daily_data.dropna()
 
-        # 存储结果
-        results[code] = daily_data
-        full_info[code]=total
+    return daily_data, total
 
-    return results,full_info
+#信号函数，调用方式不变：BBS(target_assets, paths, window_1=174)
+BBS = SignalPipeline(BBS_prepare, BBS_lines, BBS_signal, name='BBS')
 
 # 自定义数据类，包含 'signal'
 class PandasDataPlusSignal(bt.feeds.PandasData):
@@ -71,17 +102,17 @@ class PandasDataPlusSignal(bt.feeds.PandasData):
     )
 
 # 策略类，包含调试信息和导出方法
-class BBS_Strategy(bt.Strategy):
+class BBS_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.166),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -93,8 +124,9 @@ class BBS_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -110,22 +142,26 @@ class BBS_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -146,19 +182,11 @@ class BBS_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
@@ -190,164 +218,76 @@ def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commi
 
 
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'D:\数据库\同花顺ETF跟踪指数量价数据\1d',
-    'free_turn_path':r"D:\数据库\同花顺指数自由流通换手率",
-    'pv_export':r"D:\量化交易构建\私募基金研究\股票策略研究\策略净值序列"
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'D:\数据库\同花顺ETF跟踪指数量价数据\1d',
+        'free_turn_path':r"D:\数据库\同花顺指数自由流通换手率",
+        'pv_export':r"D:\量化交易构建\私募基金研究\股票策略研究\策略净值序列"
+    }
 
 
-# 资产列表
-target_assets = [
-    "000016.SH",
-    "000300.SH",
-    "000852.SH",
-    "000905.SH",
-    "399006.SZ",
-    "399303.SZ"
-]
+    # 资产列表
+    target_assets = [
+        "000016.SH",
+        "000300.SH",
+        "000852.SH",
+        "000905.SH",
+        "399006.SZ",
+        "399303.SZ"
+    ]
 
 
 
-# 生成信号
-strategy_results,full_info = BBS(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = BBS(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(BBS_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
+    # 获取策略实例
+    strat = run_backtest(BBS_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-strtegy_name='BBS_Strategy'
+    strtegy_name='BBS_Strategy'
 
-#输出策略净值
-pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
+    #输出策略净值
+    pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-index_price_path=paths['daily']
+    # 获取净值序列
+    index_price_path=paths['daily']
 
-AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
+    AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
-#蒙特卡洛分析
+    #蒙特卡洛分析
 
-AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
+    AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
 
 
-#定义参数优化函数
-def parameter_optimization(parameter_grid, strategy_function, strategy_class, target_assets, paths, cash=100000.0, commission=0.0002, slippage_perc=0.0005, metric='sharpe_ratio'):   
-    """
-    执行参数优化，支持一个或两个参数。
-
-    参数：
-    - parameter_grid: 字典，包含参数名称和要测试的取值列表。例如：{'window_1': [30, 34, 38]}
-    - strategy_function: 生成信号的策略函数，例如 UDVD
-    - strategy_class: Backtrader 策略类，例如 UDVD_Strategy
-    - target_assets: 资产列表
-    - paths: 数据路径字典
-    - cash: 初始资金
-    - commission: 佣金
-    - slippage_perc: 滑点百分比
-    - metric: 选择用于评估的绩效指标，默认为 'sharpe_ratio'
-    """
+    # 定义参数网格
+    parameter_grid = {
+        'window_1': range(10, 251,2),
+    }
 
-    #加载数据类
-
-    # 获取参数名称和取值列表
-    param_names = list(parameter_grid.keys())
-    param_values = [parameter_grid[key] for key in param_names]
-
-    # 生成所有参数组合
-    param_combinations = [dict(zip(param_names, values)) for values in product(*param_values)]
-
-    results = []
-
-    for params in param_combinations:
-        try:
-            print(f"正在测试参数组合：{params}")
-            # 生成当前参数下的信号
-            strategy_results, full_info = strategy_function(target_assets, paths, **params)
-
-            # 运行回测
-            strat = run_backtest(strategy_class, target_assets, strategy_results, cash, commission, slippage_perc)
-
-            # 获取净值序列
-            pv = strat.get_net_value_series()
-
-            # 计算绩效指标
-            portfolio_value, returns, drawdown_ts, metrics =AT.performance_analysis(pv)
-
-            # 收集指标和参数
-            result_entry = {k: v for k, v in params.items()}
-            result_entry.update(metrics)
-            result_entry=pd.DataFrame(result_entry)
-            results.append(result_entry)
-
-        except:
-
-            printprint(f"参数组合出现错误：{params}")
-
-    # 将结果转换为 DataFrame
-    results_df = pd.concat(results,axis=0)
-    results_df=results_df.dropna()
-
-    # 可视化结果
-    if len(param_names) == 1:
-        # 绘制参数与绩效指标的关系曲线
-        param = param_names[0]
-        plt.figure(figsize=(10, 6))
-        plt.plot(results_df[param], results_df[metric], marker='o')
-        plt.xlabel(param)
-        plt.ylabel(metric)
-        plt.title(f'{metric} vs {param}')
-        plt.grid(True)
-        plt.show()
-    elif len(param_names) == 2:
-        # 绘制热力图
-        param1 = param_names[0]
-        param2 = param_names[1]
-        pivot_table = results_df.pivot(index=param1, columns=param2, values=metric)
-
-        plt.figure(figsize=(15, 12))  # 调整图像大小
-        sns.heatmap(pivot_table, annot=True, fmt=".4f", cmap='viridis',
-                    annot_kws={"size": 8}, linewidths=0.5, linecolor='white')
-        plt.title(f'{metric} Heatmap', fontsize=16)
-        plt.ylabel(param1, fontsize=14)
-        plt.xlabel(param2, fontsize=14)
-        plt.xticks(rotation=45)
-        plt.yticks(rotation=0)
-        plt.tight_layout()  # 自动调整布局
-        plt.show()
-    else:
-        print("无法可视化超过两个参数的结果，请减少参数数量。")
-
-    # 返回结果 DataFrame
-    return results_df
-
-
-# 定义参数网格
-parameter_grid = {
-    'window_1': range(10, 251,2),
-}
-
-# # 运行参数优化
-# results_df = parameter_optimization(
-#     parameter_grid=parameter_grid,
-#     strategy_function=BBS,
-#     strategy_class=BBS_Strategy,
-#     target_assets=target_assets,
-#     paths=paths,
-#     cash=10000000,
-#     commission=0.0005,
-#     slippage_perc=0.0005,
-#     metric='sharpe_ratio'
-# )
+    # # 运行参数优化
+    # results_df = parameter_optimization(
+    #     parameter_grid=parameter_grid,
+    #     strategy_function=BBS,
+    #     strategy_class=BBS_Strategy,
+    #     target_assets=target_assets,
+    #     paths=paths,
+    #     run_backtest_func=run_backtest,
+    #     cash=10000000,
+    #     commission=0.0005,
+    #     slippage_perc=0.0005,
+    #     metric='sharpe_ratio'
+    # )
@@ -3,41 +3,71 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars
+from signal_tools import sign_signal
+from optimizer import parameter_optimization
+from signal_pipeline import SignalPipeline, vectorizable
+from indicator_engine import ewm_mean
 from itertools import product
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-def EMA(target_assets, paths,window_1=20,window_2=40):
-    #信号结果字典
-    results = {}
-    #全数据字典，包含计算指标用于检查
-    full_info={}
-    
-    #编写策略主体部分
-    for code in target_assets:
-        # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
-
-        df=daily_data.copy()
-        # 计算
-        df["short"] = df['close'].ewm(window_1, adjust=False).mean()
-        df["long"] = df['close'].ewm(window_2, adjust=False).mean()
-        # 添加信号列
-        df['diff']=df['short']-df['long']
-        # 添加signal列，使用apply函数
-        df['signal'] = df['diff'].apply(lambda x: 1 if x > 0 else -1)
-        result=df
-        # 将信号合并回每日数据
-        daily_data = daily_data.join(result[['signal']], how='left')
-        daily_data[['signal']].fillna(0, inplace=True)
-        daily_data=daily_data.dropna()
-
-        # 存储结果
-        results[code] = daily_data
-        full_info[code]=result
-
-    return results,full_info
+def EMA_prepare(code, paths):
+    """
+    读取数据
+    """
+    daily_data = load_bars(code, 'daily', paths)
+    return daily_data, daily_data.copy()
+
+def EMA_lines_batch(prepared, window_1, window_2):
+    """
+    一次计算所有 window_1、window_2 组合的长短均线，所有窗口的均线只递推一遍。
+    各组合只引用同一个均线矩阵的列，不复制数据，两列在 EMA_signal 中再拼入，缓存占用与窗口数成正比而不是与组合数成正比
+
+    返回：
+    - {(window_1, window_2): (daily_data, df, 短均线, 长均线)}
+    """
+    daily_data, df = prepared
+    windows = sorted(set(window_1) | set(window_2))
+    lines = ewm_mean(df['close'], com=windows)
+    column = {window: j for j, window in enumerate(windows)}
+
+    outputs = {}
+    for w1, w2 in product(window_1, window_2):
+        outputs[(w1, w2)] = (daily_data, df, lines[:, column[w1]], lines[:, column[w2]])
+    return outputs
+
+@vectorizable(EMA_lines_batch, 'window_1', 'window_2')
+def EMA_lines(prepared, window_1=20, window_2=40):
+    """
+    计算长短均线，参数扫描时由 EMA_lines_batch 一次算出全部组合
+    """
+    return EMA_lines_batch(prepared, [window_1], [window_2])[(window_1, window_2)]
+
+def EMA_signal(lines):
+    """
+    根据长短均线差生成信号并合并回每日数据
+    """
+    daily_data, df, short, long = lines
+    df=df.copy()
+    df["short"] = short
+    df["long"] = long
+    # 添加信号列
+    df['diff']=df['short']-df['long']
+    # 添加signal列
+    df['signal'] = sign_signal(df['diff'])
+    result=df
+    # 将信号合并回每日数据
+    daily_data = daily_data.join(result[['signal']], how='left')
+    daily_data[['signal']].fillna(0, inplace=True)
+    daily_data=daily_data.dropna()
+
+    return daily_data, result
+
+#信号函数，调用方式不变：EMA(target_assets, paths, window_1=20, window_2=40)
+EMA = SignalPipeline(EMA_prepare, EMA_lines, EMA_signal, name='EMA')
 
 # 自定义数据类，包含 'signal'
 class PandasDataPlusSignal(bt.feeds.PandasData):
@@ -47,17 +77,17 @@ class PandasDataPlusSignal(bt.feeds.PandasData):
     )
 
 # 策略类，包含调试信息和导出方法
-class EMA_Strategy(bt.Strategy):
+class EMA_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.166),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -69,8 +99,9 @@ class EMA_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -86,22 +117,26 @@ class EMA_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -122,19 +157,11 @@ class EMA_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
@@ -166,152 +193,69 @@ def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commi
 
 
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'D:\1.工作文件\0.数据库\同花顺ETF跟踪指数量价数据',
-    'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
-    'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'D:\1.工作文件\0.数据库\同花顺ETF跟踪指数量价数据',
+        'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
+        'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
+    }
 
-# 资产列表
-target_assets = [
-    "000016.SH",
-    "000300.SH",
-    "000852.SH",
-    "000905.SH",
-    "399006.SZ",
-    "399303.SZ"
-]
+    # 资产列表
+    target_assets = [
+        "000016.SH",
+        "000300.SH",
+        "000852.SH",
+        "000905.SH",
+        "399006.SZ",
+        "399303.SZ"
+    ]
 
 
 
-# 生成信号
-strategy_results,full_info = EMA(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = EMA(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(EMA_Strategy,target_assets,strategy_results,10000000,0,0)
+    # 获取策略实例
+    strat = run_backtest(EMA_Strategy,target_assets,strategy_results,10000000,0,0)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-AT.plot_results('000906.SH',portfolio_value, drawdown_ts, returns, metrics)
+    # 获取净值序列
+    AT.plot_results('000906.SH',portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
-#蒙特卡洛分析
+    #蒙特卡洛分析
 
-AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
+    AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
 
 
-#定义参数优化函数
-def parameter_optimization(parameter_grid, strategy_function, strategy_class, target_assets, paths, cash=100000.0, commission=0.0002, slippage_perc=0.0005, metric='sharpe_ratio'):   
-    """
-    执行参数优化，支持一个或两个参数。
-
-    参数：
-    - parameter_grid: 字典，包含参数名称和要测试的取值列表。例如：{'window_1': [30, 34, 38]}
-    - strategy_function: 生成信号的策略函数，例如 UDVD
-    - strategy_class: Backtrader 策略类，例如 UDVD_Strategy
-    - target_assets: 资产列表
-    - paths: 数据路径字典
-    - cash: 初始资金
-    - commission: 佣金
-    - slippage_perc: 滑点百分比
-    - metric: 选择用于评估的绩效指标，默认为 'sharpe_ratio'
-    """
+    # 定义参数网格
+    parameter_grid = {
+        'window_1': range(5, 30,2),
+        'window_2':range(20,50,2),
+    }
 
-    #加载数据类
-
-    # 获取参数名称和取值列表
-    param_names = list(parameter_grid.keys())
-    param_values = [parameter_grid[key] for key in param_names]
-
-    # 生成所有参数组合
-    param_combinations = [dict(zip(param_names, values)) for values in product(*param_values)]
-
-    results = []
-
-    for params in param_combinations:
-        print(f"正在测试参数组合：{params}")
-        # 生成当前参数下的信号
-        strategy_results, full_info = strategy_function(target_assets, paths, **params)
-
-        # 运行回测
-        strat = run_backtest(strategy_class, target_assets, strategy_results, cash, commission, slippage_perc)
-
-        # 获取净值序列
-        pv = strat.get_net_value_series()
-
-        # 计算绩效指标
-        portfolio_value, returns, drawdown_ts, metrics =AT.performance_analysis(pv)
-
-        # 收集指标和参数
-        result_entry = {k: v for k, v in params.items()}
-        result_entry.update(metrics)
-        result_entry=pd.DataFrame(result_entry)
-        results.append(result_entry)
-
-    # 将结果转换为 DataFrame
-    results_df = pd.concat(results,axis=0)
-    results_df=results_df.dropna()
-
-    # 可视化结果
-    if len(param_names) == 1:
-        # 绘制参数与绩效指标的关系曲线
-        param = param_names[0]
-        plt.figure(figsize=(10, 6))
-        plt.plot(results_df[param], results_df[metric], marker='o')
-        plt.xlabel(param)
-        plt.ylabel(metric)
-        plt.title(f'{metric} vs {param}')
-        plt.grid(True)
-        plt.show()
-    elif len(param_names) == 2:
-        # 绘制热力图
-        param1 = param_names[0]
-        param2 = param_names[1]
-        pivot_table = results_df.pivot(index=param1, columns=param2, values=metric)
-
-        plt.figure(figsize=(15, 12))  # 调整图像大小
-        sns.heatmap(pivot_table, annot=True, fmt=".4f", cmap='viridis',
-                    annot_kws={"size": 8}, linewidths=0.5, linecolor='white')
-        plt.title(f'{metric} Heatmap', fontsize=16)
-        plt.ylabel(param1, fontsize=14)
-        plt.xlabel(param2, fontsize=14)
-        plt.xticks(rotation=45)
-        plt.yticks(rotation=0)
-        plt.tight_layout()  # 自动调整布局
-        plt.show()
-    else:
-        print("无法可视化超过两个参数的结果，请减少参数数量。")
-
-    # 返回结果 DataFrame
-    return results_df
-
-
-# 定义参数网格
-parameter_grid = {
-    'window_1': range(5, 30,2),
-    'window_2':range(20,50,2),
-}
-
-# # # 运行参数优化
-results_df = parameter_optimization(
-    parameter_grid=parameter_grid,
-    strategy_function=EMA,
-    strategy_class=EMA_Strategy,
-    target_assets=target_assets,
-    paths=paths,
-    cash=10000000,
-    commission=0.0005,
-    slippage_perc=0.0005,
-    metric='sharpe_ratio'
-)
+    # # # 运行参数优化
+    results_df = parameter_optimization(
+        parameter_grid=parameter_grid,
+        strategy_function=EMA,
+        strategy_class=EMA_Strategy,
+        target_assets=target_assets,
+        paths=paths,
+        run_backtest_func=run_backtest,
+        cash=10000000,
+        commission=0.0005,
+        slippage_perc=0.0005,
+        metric='sharpe_ratio'
+    )
@@ -3,45 +3,73 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars
+from signal_tools import cross_above, cross_below, crossover_signal
+from optimizer import parameter_optimization
+from signal_pipeline import SignalPipeline, vectorizable
+from indicator_engine import kama
 from itertools import product
 import matplotlib.pyplot as plt
 import seaborn as sns
-import talib
 
-def KAMA(target_assets,paths,window_1=10,window_2=120):
-    #信号结果字典
-    results = {}
-    #全数据字典，包含计算指标用于检查
-    full_info={}
-    
-    #编写策略主体部分
-    for code in target_assets:
-        # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
+def KAMA_prepare(code, paths):
+    """
+    读取数据
+    """
+    daily_data = load_bars(code, 'daily', paths)
+    return daily_data, daily_data.copy()
 
-        df=daily_data.copy()
-        # 计算
+def KAMA_lines_batch(prepared, window_1, window_2):
+    """
+    一次计算所有 window_1、window_2 组合的快慢 KAMA，所有窗口只递推一遍。
+    各组合只引用同一个 KAMA 矩阵的列，不复制数据，两列在 KAMA_signal 中再拼入，缓存占用与窗口数成正比而不是与组合数成正比
 
-        df["var_1"] = talib.KAMA(df['close'],window_1)
-        df["var_2"] = talib.KAMA(df['close'],window_2)
-        df.loc[(df["var_1"].shift(1) <= df["var_2"].shift(1)) & (df["var_1"] > df["var_2"]) , 'signal'] = 1
-        df.loc[(df["var_1"].shift(1) > df["var_2"].shift(1)) & (df["var_1"] <= df["var_2"]) , 'signal'] = -1
+    返回：
+    - {(window_1, window_2): (daily_data, df, 快线, 慢线)}
+    """
+    daily_data, df = prepared
+    windows = sorted(set(window_1) | set(window_2))
+    lines = kama(df['close'], windows)
+    column = {window: j for j, window in enumerate(windows)}
+
+    outputs = {}
+    for w1, w2 in product(window_1, window_2):
+        outputs[(w1, w2)] = (daily_data, df, lines[:, column[w1]], lines[:, column[w2]])
+    return outputs
+
+@vectorizable(KAMA_lines_batch, 'window_1', 'window_2')
+def KAMA_lines(prepared, window_1=10, window_2=120):
+    """
+    计算快慢 KAMA，参数扫描时由 KAMA_lines_batch 一次算出全部组合；单次运行同样走 KAMA_lines_batch，
+    保证扫描得到的最优参数单独运行时结果完全一致
+    """
+    return KAMA_lines_batch(prepared, [window_1], [window_2])[(window_1, window_2)]
 
-        # pos为空的，向上填充数字
-        df['signal'].fillna(method='ffill', inplace=True)
+def KAMA_signal(lines):
+    """
+    快线上穿慢线看多，下穿看空，并合并回每日数据
+    """
+    daily_data, df, fast, slow = lines
+    df=df.copy()
+    df["var_1"] = fast
+    df["var_2"] = slow
+    df['signal'] = crossover_signal(cross_above(df["var_1"], df["var_2"]), cross_below(df["var_1"], df["var_2"]))
+
+    # pos为空的，向上填充数字
+    df['signal'].fillna(method='ffill', inplace=True)
 
-        result=df
-        # 将信号合并回每日数据
-        daily_data = daily_data.join(result[['signal']], how='left')
-        daily_data[['signal']].fillna(0, inplace=True)
-        daily_data=daily_data.dropna()
+    result=df
+    # 将信号合并回每日数据
+    daily_data = daily_data.join(result[['signal']], how='left')
+    daily_data[['signal']].fillna(0, inplace=True)
+    daily_data=daily_data.dropna()
 
-        # 存储结果
-        results[code] = daily_data
-        full_info[code]=result
+    return daily_data, result
 
-    return results,full_info
+#信号函数，调用方式不变：KAMA(target_assets, paths, window_1=10, window_2=120)
+KAMA = SignalPipeline(KAMA_prepare, KAMA_lines, KAMA_signal, name='KAMA')
 
 # 自定义数据类，包含 'signal'
 class PandasDataPlusSignal(bt.feeds.PandasData):
@@ -51,17 +79,17 @@ class PandasDataPlusSignal(bt.feeds.PandasData):
     )
 
 # 策略类，包含调试信息和导出方法
-class KAMA_Strategy(bt.Strategy):
+class KAMA_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.166),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -73,8 +101,9 @@ class KAMA_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -90,22 +119,26 @@ class KAMA_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -126,19 +159,11 @@ class KAMA_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
@@ -170,166 +195,78 @@ def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commi
 
 
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'D:\1.工作文件\0.数据库\同花顺ETF跟踪指数量价数据',
-    'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
-    'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
-    'pv_export':r"D:\1.工作文件\程序\3.策略净值序列"
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'D:\1.工作文件\0.数据库\同花顺ETF跟踪指数量价数据',
+        'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
+        'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
+        'pv_export':r"D:\1.工作文件\程序\3.策略净值序列"
+    }
 
 
-# 资产列表
-target_assets = [
-    "000016.SH",
-    "000300.SH",
-    "000852.SH",
-    "000905.SH",
-    "399006.SZ",
-    "399303.SZ"
-]
+    # 资产列表
+    target_assets = [
+        "000016.SH",
+        "000300.SH",
+        "000852.SH",
+        "000905.SH",
+        "399006.SZ",
+        "399303.SZ"
+    ]
 
 
 
-# 生成信号
-strategy_results,full_info = KAMA(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = KAMA(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(KAMA_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
+    # 获取策略实例
+    strat = run_backtest(KAMA_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-strtegy_name='MOM_Strategy'
+    strtegy_name='MOM_Strategy'
 
-#输出策略净值
-pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
+    #输出策略净值
+    pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-index_price_path=paths['daily']
+    # 获取净值序列
+    index_price_path=paths['daily']
 
-AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
+    AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
-#蒙特卡洛分析
+    #蒙特卡洛分析
 
-AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
+    AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
 
 
-#定义参数优化函数
-def parameter_optimization(parameter_grid, strategy_function, strategy_class, target_assets, paths, cash=100000.0, commission=0.0002, slippage_perc=0.0005, metric='sharpe_ratio'):   
-    """
-    执行参数优化，支持一个或两个参数。
-
-    参数：
-    - parameter_grid: 字典，包含参数名称和要测试的取值列表。例如：{'window_1': [30, 34, 38]}
-    - strategy_function: 生成信号的策略函数，例如 UDVD
-    - strategy_class: Backtrader 策略类，例如 UDVD_Strategy
-    - target_assets: 资产列表
-    - paths: 数据路径字典
-    - cash: 初始资金
-    - commission: 佣金
-    - slippage_perc: 滑点百分比
-    - metric: 选择用于评估的绩效指标，默认为 'sharpe_ratio'
-    """
+    # 定义参数网格
+    parameter_grid = {
+        'window_1': range(10, 20,10),
+        'window_2':range(10,150,10),
+    }
 
-    #加载数据类
-
-    # 获取参数名称和取值列表
-    param_names = list(parameter_grid.keys())
-    param_values = [parameter_grid[key] for key in param_names]
-
-    # 生成所有参数组合
-    param_combinations = [dict(zip(param_names, values)) for values in product(*param_values)]
-
-    results = []
-
-    for params in param_combinations:
-        try:
-            print(f"正在测试参数组合：{params}")
-            # 生成当前参数下的信号
-            strategy_results, full_info = strategy_function(target_assets, paths, **params)
-
-            # 运行回测
-            strat = run_backtest(strategy_class, target_assets, strategy_results, cash, commission, slippage_perc)
-
-            # 获取净值序列
-            pv = strat.get_net_value_series()
-
-            # 计算绩效指标
-            portfolio_value, returns, drawdown_ts, metrics =AT.performance_analysis(pv)
-
-            # 收集指标和参数
-            result_entry = {k: v for k, v in params.items()}
-            result_entry.update(metrics)
-            result_entry=pd.DataFrame(result_entry)
-            results.append(result_entry)
-
-        except:
-
-            print(f"参数组合出现错误：{params}")
-
-    # 将结果转换为 DataFrame
-    results_df = pd.concat(results,axis=0)
-    results_df=results_df.dropna()
-
-    # 可视化结果
-    if len(param_names) == 1:
-        # 绘制参数与绩效指标的关系曲线
-        param = param_names[0]
-        plt.figure(figsize=(10, 6))
-        plt.plot(results_df[param], results_df[metric], marker='o')
-        plt.xlabel(param)
-        plt.ylabel(metric)
-        plt.title(f'{metric} vs {param}')
-        plt.grid(True)
-        plt.show()
-    elif len(param_names) == 2:
-        # 绘制热力图
-        param1 = param_names[0]
-        param2 = param_names[1]
-        pivot_table = results_df.pivot(index=param1, columns=param2, values=metric)
-
-        plt.figure(figsize=(15, 12))  # 调整图像大小
-        sns.heatmap(pivot_table, annot=True, fmt=".4f", cmap='viridis',
-                    annot_kws={"size": 8}, linewidths=0.5, linecolor='white')
-        plt.title(f'{metric} Heatmap', fontsize=16)
-        plt.ylabel(param1, fontsize=14)
-        plt.xlabel(param2, fontsize=14)
-        plt.xticks(rotation=45)
-        plt.yticks(rotation=0)
-        plt.tight_layout()  # 自动调整布局
-        plt.show()
-    else:
-        print("无法可视化超过两个参数的结果，请减少参数数量。")
-
-    # 返回结果 DataFrame
-    return results_df
-
-
-# 定义参数网格
-parameter_grid = {
-    'window_1': range(10, 20,10),
-    'window_2':range(10,150,10),
-}
-
-# # # 运行参数优化
-# results_df = parameter_optimization(
-#     parameter_grid=parameter_grid,
-#     strategy_function=KAMA,
-#     strategy_class=KAMA_Strategy,
-#     target_assets=target_assets,
-#     paths=paths,
-#     cash=10000000,
-#     commission=0.0005,
-#     slippage_perc=0.0005,
-#     metric='sharpe_ratio'
-# )
+    # # # 运行参数优化
+    # results_df = parameter_optimization(
+    #     parameter_grid=parameter_grid,
+    #     strategy_function=KAMA,
+    #     strategy_class=KAMA_Strategy,
+    #     target_assets=target_assets,
+    #     paths=paths,
+    #     run_backtest_func=run_backtest,
+    #     cash=10000000,
+    #     commission=0.0005,
+    #     slippage_perc=0.0005,
+    #     metric='sharpe_ratio'
+    # )
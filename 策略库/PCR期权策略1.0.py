@@ -3,67 +3,90 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars, register_dataset
+from signal_tools import cross_above, cross_below, crossover_signal
+from optimizer import parameter_optimization
+from signal_pipeline import SignalPipeline, vectorizable
+from indicator_engine import rolling_percentile
 from itertools import product
 import matplotlib.pyplot as plt
 import seaborn as sns
 import talib
 import numpy as np
 
-def PCR(target_assets,paths,window_1=62):
-    #信号结果字典
-    results = {}
-    #全数据字典，包含计算指标用于检查
-    full_info={}
-    
-    #编写策略主体部分
-    for code in target_assets:
-        # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
-
-        df=daily_data.copy()
-
-        data = pd.read_csv(r'D:\1.工作文件\0.数据库\sz50ETF期权数据.csv')
-        data['p02872_f001'] = pd.to_datetime(data['p02872_f001'])
-        
-        #按照时间升序排列
-        data= data.sort_values(by='p02872_f001')
-        data.set_index('p02872_f001', inplace=True)
-        #和指数数据合并
-        merged_df = pd.merge(df, data[['p02872_f005', 'p02872_f006']], left_index=True, right_index=True, how='left')        
-        # 向下填充'value'列的NaN值
-        #merged_df['p02872_f007'].fillna(method='ffill', inplace=True)
-        #计算PCR滚动五天的均值
-        merged_df['PCR']= merged_df['p02872_f006'].rolling(5).mean()/merged_df['p02872_f005'].rolling(5).mean()
-        # 定义一个函数来计算从小到大排列后排名第 70% 的值
-        def calc_70th_percentile(x):
-            return np.percentile(x, 70)
-
-        # 使用 rolling 方法计算过去六十日从小到大排列后第 70 个百分位数
-        merged_df['rolloing_70%'] = merged_df['PCR'].rolling(window_1).apply(calc_70th_percentile, raw=True)
-
-        df['var_1'] = merged_df['PCR']
-        df['var_2'] = merged_df['rolloing_70%']
-
-
-        # 信号触发条件
-        df.loc[(df["var_1"].shift(1) <= df["var_2"].shift(1)) & (df["var_1"] > df["var_2"]) , 'signal'] = 1
-        df.loc[(df["var_1"].shift(1) > df["var_2"].shift(1)) & (df["var_1"] <= df["var_2"]), 'signal'] = -1
-
-        # pos为空的，向上填充数字
-        df['signal'].fillna(method='ffill', inplace=True)
-
-        result=df
-        # 将信号合并回每日数据
-        daily_data = daily_data.join(result[['signal']], how='left')
-        daily_data[['signal']].fillna(0, inplace=True)
-        daily_data=daily_data.dropna()
-
-        # 存储结果
-        results[code] = daily_data
-        full_info[code]=result
-
-    return results,full_info
+# 50ETF 期权认购、认沽成交量，整个进程只读取、整理一次，可在 paths 中用 'sz50etf_option' 指定文件
+SZ50ETF_OPTION = register_dataset(
+    'sz50etf_option', r'D:\1.工作文件\0.数据库\sz50ETF期权数据.csv', path_key='sz50etf_option',
+    date_column='p02872_f001', columns=['p02872_f005', 'p02872_f006'])
+
+def PCR_prepare(code, paths):
+    """
+    与参数无关的部分：读取数据，合并期权成交量，计算 PCR 的 5 日均值
+    """
+    # 读取数据
+    daily_data = load_bars(code, 'daily', paths)
+
+    df=daily_data.copy()
+
+    #和指数数据合并，期权数据按指数日期对齐
+    merged_df = df.join(SZ50ETF_OPTION.load(paths, index=df.index))
+    # 向下填充'value'列的NaN值
+    #merged_df['p02872_f007'].fillna(method='ffill', inplace=True)
+    #计算PCR滚动五天的均值
+    merged_df['PCR']= merged_df['p02872_f006'].rolling(5).mean()/merged_df['p02872_f005'].rolling(5).mean()
+    return daily_data, df, merged_df
+
+def PCR_lines_batch(prepared, window_1):
+    """
+    依赖 window_1 的部分，一次计算一组 window_1：PCR 过去 window_1 日从小到大排列后第 70 个百分位数
+
+    返回：
+    - {(window_1,): (daily_data, df)}
+    """
+    daily_data, df, merged_df = prepared
+    windows = list(window_1)
+    percentile_70 = rolling_percentile(merged_df['PCR'], windows, 70)
+
+    outputs = {}
+    for j, window in enumerate(windows):
+        lines = df.copy()
+        lines['var_1'] = merged_df['PCR']
+        lines['var_2'] = percentile_70[:, j]
+        outputs[(window,)] = (daily_data, lines)
+    return outputs
+
+@vectorizable(PCR_lines_batch, 'window_1')
+def PCR_lines(prepared, window_1=62):
+    """
+    依赖 window_1 的部分，参数扫描时由 PCR_lines_batch 一次算出全部窗口
+    """
+    return PCR_lines_batch(prepared, [window_1])[(window_1,)]
+
+def PCR_signal(lines):
+    """
+    PCR 上穿滚动 70% 分位数看多，下穿看空，并合并回每日数据
+    """
+    daily_data, df = lines
+    df=df.copy()
+
+    # 信号触发条件
+    df['signal'] = crossover_signal(cross_above(df["var_1"], df["var_2"]), cross_below(df["var_1"], df["var_2"]))
+
+    # pos为空的，向上填充数字
+    df['signal'].fillna(method='ffill', inplace=True)
+
+    result=df
+    # 将信号合并回每日数据
+    daily_data = daily_data.join(result[['signal']], how='left')
+    daily_data[['signal']].fillna(0, inplace=True)
+    daily_data=daily_data.dropna()
+
+    return daily_data, result
+
+#信号函数，调用方式不变：PCR(target_assets, paths, window_1=62)
+PCR = SignalPipeline(PCR_prepare, PCR_lines, PCR_signal, name='PCR')
 
 # 自定义数据类，包含 'signal'
 class PandasDataPlusSignal(bt.feeds.PandasData):
@@ -73,17 +96,17 @@ class PandasDataPlusSignal(bt.feeds.PandasData):
     )
 
 # 策略类，包含调试信息和导出方法
-class PCR_Strategy(bt.Strategy):
+class PCR_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.166),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -95,8 +118,9 @@ class PCR_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -112,22 +136,26 @@ class PCR_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -148,19 +176,11 @@ class PCR_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
@@ -192,166 +212,78 @@ def run_backtest(strategy, target_assets, strategy_results, cash=100000.0, commi
 
 
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'D:\1.工作文件\0.数据库\同花顺ETF跟踪指数量价数据',
-    'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
-    'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
-    'pv_export':r"D:\1.工作文件\程序\3.策略净值序列"
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'D:\1.工作文件\0.数据库\同花顺ETF跟踪指数量价数据',
+        'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
+        'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
+        'pv_export':r"D:\1.工作文件\程序\3.策略净值序列"
+    }
 
 
-# 资产列表
-target_assets = [
-    "000016.SH",
-    "000300.SH",
-    "000852.SH",
-    "000905.SH",
-    "399006.SZ",
-    "399303.SZ"
-]
+    # 资产列表
+    target_assets = [
+        "000016.SH",
+        "000300.SH",
+        "000852.SH",
+        "000905.SH",
+        "399006.SZ",
+        "399303.SZ"
+    ]
 
 
 
-# 生成信号
-strategy_results,full_info = PCR(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = PCR(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(PCR_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
+    # 获取策略实例
+    strat = run_backtest(PCR_Strategy,target_assets,strategy_results,10000000,0.0005,0.0005)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-strtegy_name='PCR_Strategy'
+    strtegy_name='PCR_Strategy'
 
-#输出策略净值
-pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
+    #输出策略净值
+    pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-index_price_path=paths['daily']
+    # 获取净值序列
+    index_price_path=paths['daily']
 
-AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
+    AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
-#蒙特卡洛分析
+    #蒙特卡洛分析
 
-AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
+    AT.monte_carlo_analysis(strat,num_simulations=10000,num_days=252,freq='D')
 
 
-#定义参数优化函数
-def parameter_optimization(parameter_grid, strategy_function, strategy_class, target_assets, paths, cash=100000.0, commission=0.0002, slippage_perc=0.0005, metric='sharpe_ratio'):   
-    """
-    执行参数优化，支持一个或两个参数。
-
-    参数：
-    - parameter_grid: 字典，包含参数名称和要测试的取值列表。例如：{'window_1': [30, 34, 38]}
-    - strategy_function: 生成信号的策略函数，例如 UDVD
-    - strategy_class: Backtrader 策略类，例如 UDVD_Strategy
-    - target_assets: 资产列表
-    - paths: 数据路径字典
-    - cash: 初始资金
-    - commission: 佣金
-    - slippage_perc: 滑点百分比
-    - metric: 选择用于评估的绩效指标，默认为 'sharpe_ratio'
-    """
+    # 定义参数网格
+    parameter_grid = {
+        'window_1': range(50, 120,1),
+        #'window_2':range(10,200,10),
+    }
 
-    #加载数据类
-
-    # 获取参数名称和取值列表
-    param_names = list(parameter_grid.keys())
-    param_values = [parameter_grid[key] for key in param_names]
-
-    # 生成所有参数组合
-    param_combinations = [dict(zip(param_names, values)) for values in product(*param_values)]
-
-    results = []
-
-    for params in param_combinations:
-        try:
-            print(f"正在测试参数组合：{params}")
-            # 生成当前参数下的信号
-            strategy_results, full_info = strategy_function(target_assets, paths, **params)
-
-            # 运行回测
-            strat = run_backtest(strategy_class, target_assets, strategy_results, cash, commission, slippage_perc)
-
-            # 获取净值序列
-            pv = strat.get_net_value_series()
-
-            # 计算绩效指标
-            portfolio_value, returns, drawdown_ts, metrics =AT.performance_analysis(pv)
-
-            # 收集指标和参数
-            result_entry = {k: v for k, v in params.items()}
-            result_entry.update(metrics)
-            result_entry=pd.DataFrame(result_entry)
-            results.append(result_entry)
-
-        except:
-
-            print(f"参数组合出现错误：{params}")
-
-    # 将结果转换为 DataFrame
-    results_df = pd.concat(results,axis=0)
-    results_df=results_df.dropna()
-
-    # 可视化结果
-    if len(param_names) == 1:
-        # 绘制参数与绩效指标的关系曲线
-        param = param_names[0]
-        plt.figure(figsize=(10, 6))
-        plt.plot(results_df[param], results_df[metric], marker='o')
-        plt.xlabel(param)
-        plt.ylabel(metric)
-        plt.title(f'{metric} vs {param}')
-        plt.grid(True)
-        plt.show()
-    elif len(param_names) == 2:
-        # 绘制热力图
-        param1 = param_names[0]
-        param2 = param_names[1]
-        pivot_table = results_df.pivot(index=param1, columns=param2, values=metric)
-
-        plt.figure(figsize=(15, 12))  # 调整图像大小
-        sns.heatmap(pivot_table, annot=True, fmt=".4f", cmap='viridis',
-                    annot_kws={"size": 8}, linewidths=0.5, linecolor='white')
-        plt.title(f'{metric} Heatmap', fontsize=16)
-        plt.ylabel(param1, fontsize=14)
-        plt.xlabel(param2, fontsize=14)
-        plt.xticks(rotation=45)
-        plt.yticks(rotation=0)
-        plt.tight_layout()  # 自动调整布局
-        plt.show()
-    else:
-        print("无法可视化超过两个参数的结果，请减少参数数量。")
-
-    # 返回结果 DataFrame
-    return results_df
-
-
-# 定义参数网格
-parameter_grid = {
-    'window_1': range(50, 120,1),
-    #'window_2':range(10,200,10),
-}
-
-# # # 运行参数优化
-# results_df = parameter_optimization(
-#     parameter_grid=parameter_grid,
-#     strategy_function=PCR,
-#     strategy_class=PCR_Strategy,
-#     target_assets=target_assets,
-#     paths=paths,
-#     cash=10000000,
-#     commission=0.0005,
-#     slippage_perc=0.0005,
-#     metric='sharpe_ratio'
-# )
+    # # # 运行参数优化
+    # results_df = parameter_optimization(
+    #     parameter_grid=parameter_grid,
+    #     strategy_function=PCR,
+    #     strategy_class=PCR_Strategy,
+    #     target_assets=target_assets,
+    #     paths=paths,
+    #     run_backtest_func=run_backtest,
+    #     cash=10000000,
+    #     commission=0.0005,
+    #     slippage_perc=0.0005,
+    #     metric='sharpe_ratio'
+    # )
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
-from bokeh.plotting import figure, show, output_file
+from bokeh.plotting import figure, show, save, output_file
+from bokeh.resources import CDN
 from bokeh.layouts import  gridplot, column
 from bokeh.models import ColumnDataSource, HoverTool,Div
 import empyrical as ep
@@ -12,12 +13,173 @@ from tqdm import tqdm
 import seaborn as sns
 from scipy.stats import norm
 from bokeh.models import Span
+from bar_store import AuxDataset, csv_columns, get_bar_cache
+from benchmark import DEFAULT_BENCHMARK, load_benchmark, relative_metrics
+from decimate import DEFAULT_MAX_POINTS, decimate
+from rolling_analytics import rolling_performance
+from frequency import get_annual_factor
+from monte_carlo import METRICS, MonteCarloResult, simulate, simulate_streaming
+
+
+# 蒙特卡洛模拟次数达到该值时默认改用流式汇总
+STREAMING_MIN_SIMULATIONS = 1000000
+
+# 'time' 不在第一列的行情文件：按 'time' 列建立索引，不去重、不排序，与 pd.read_csv(parse_dates=['time'], index_col='time') 一致
+TIME_INDEXED = AuxDataset('time_indexed', None, date_column='time', dedupe=False, sort=False)
+
+
+def drawdown_episodes(drawdown_ts):
+    """
+    从回撤序列中提取所有回撤区间：回撤 < 0 的连续区间为一次回撤，回撤回到 0 的第一根K线为恢复日。
+    按游程分组一次性计算，不逐日循环。
+
+    参数：
+    - drawdown_ts: 回撤序列（Series，或取第一列的 DataFrame），索引为日期
+
+    返回：
+    - max_time_to_recovery: 已恢复的回撤中最长的恢复天数，没有已恢复的回撤时为 0
+    - episodes: 回撤区间表，列为 start（开始）、trough（谷底）、recovery（恢复，未恢复为 NaT）、
+      depth（最大回撤深度）、duration（恢复天数，未恢复为 NaN）、periods（持续的K线数）
+    """
+    if isinstance(drawdown_ts, pd.DataFrame):
+        drawdown_ts = drawdown_ts.iloc[:, 0]
+    dd = np.asarray(drawdown_ts, dtype=float)
+    index = drawdown_ts.index
+    n = len(dd)
+
+    in_dd = dd < 0
+    edges = np.diff(np.concatenate([[0], in_dd.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)          # 回撤结束后的第一根K线，即恢复日
+    recovered = ends < n
+
+    if len(starts):
+        # 回撤区间之外置为 inf，按区间起点分段求最小值即为各区间的最大回撤
+        work = np.where(in_dd, dd, np.inf)
+        depth = np.minimum.reduceat(work, starts)
+        segment = np.cumsum(edges[:-1] == 1) - 1
+        at_trough = np.flatnonzero(in_dd & (work == depth[np.clip(segment, 0, None)]))
+        _, first = np.unique(segment[at_trough], return_index=True)
+        troughs = at_trough[first]
+    else:
+        depth = np.empty(0)
+        troughs = np.empty(0, dtype=int)
+
+    recovery = index[np.minimum(ends, n - 1)].where(recovered)
+    duration = np.where(recovered, np.asarray((recovery - index[starts]).days, dtype=float), np.nan)
+
+    episodes = pd.DataFrame({
+        'start': index[starts],
+        'trough': index[troughs],
+        'recovery': recovery,
+        'depth': depth,
+        'duration': duration,
+        'periods': ends - starts,
+    })
+    max_time_to_recovery = int(np.max(duration[recovered])) if recovered.any() else 0
+    return max_time_to_recovery, episodes
+
+
+def batch_performance_metrics(values_matrix, freq='D', index=None):
+    """
+    一次计算多条净值曲线的绩效指标，所有指标按列向量化计算，结果与逐条调用 performance_analysis 一致（浮点误差以内）。
+
+    参数：
+    - values_matrix: (时间 x 曲线) 的净值矩阵，可以是 ndarray 或 DataFrame；长度不同的曲线用 NaN 补齐
+    - freq: 数据频率，见 frequency 模块；为 None 时由日期推断
+    - index: 日期序列，用于计算最大恢复天数；values_matrix 为 DataFrame 时默认取其索引，没有日期时恢复天数为 NaN
+
+    返回：
+    - DataFrame，每行一条曲线（行索引为 DataFrame 的列名或曲线序号），列为各项绩效指标
+    """
+    labels = None
+    if isinstance(values_matrix, pd.Series):
+        values_matrix = values_matrix.to_frame()
+    if isinstance(values_matrix, pd.DataFrame):
+        labels = values_matrix.columns
+        if index is None:
+            index = values_matrix.index
+        values_matrix = values_matrix.to_numpy(dtype=float)
+    values = np.asarray(values_matrix, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    if labels is None:
+        labels = pd.RangeIndex(values.shape[1])
+    annual_factor = get_annual_factor(freq, index)
+
+    # 收益率，缺失值（曲线之外的部分）不参与计算，相当于 pct_change().dropna()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = values[1:] / values[:-1] - 1
+    valid = ~np.isnan(returns)
+    filled = np.where(valid, returns, 0.0)
+    periods = valid.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        growth = np.cumprod(1 + filled, axis=0)
+        total_return = growth[-1] - 1 if len(growth) else np.full(values.shape[1], np.nan)
+
+        mean = filled.sum(axis=0) / periods
+        deviation = np.where(valid, returns - mean, 0.0)
+        annual_volatility = np.sqrt((deviation ** 2).sum(axis=0) / (periods - 1)) * np.sqrt(annual_factor)
+        annual_return = (1 + total_return) ** (annual_factor / periods) - 1
+
+        # 回撤以初始净值 1 为起点
+        wealth = np.vstack([np.ones((1, values.shape[1])), growth])
+        running_max = np.fmax.accumulate(wealth, axis=0)
+        drawdown = (wealth - running_max) / running_max
+        max_drawdown = drawdown.min(axis=0)
 
+        calmar_ratio = annual_return / np.abs(max_drawdown)
+        sharpe_ratio = annual_return / annual_volatility
+        win_rate = (valid & (filled >= 0)).sum(axis=0) / periods
+
+        # 下行标准差，只考虑负收益
+        negative = valid & (filled < 0)
+        n_negative = negative.sum(axis=0)
+        negative_mean = np.where(negative, filled, 0.0).sum(axis=0) / n_negative
+        negative_dev = np.where(negative, filled - negative_mean, 0.0)
+        downside_std = np.sqrt((negative_dev ** 2).sum(axis=0) / (n_negative - 1)) * np.sqrt(annual_factor)
+        downside_std = np.where(n_negative > 1, downside_std, np.nan)
+        sortino_ratio = annual_return / downside_std
+
+    # 最大恢复天数：与 performance_analysis 一致，回撤序列从第一个收益率开始累计（不含初始净值 1）。
+    # 回撤开始与恢复成对出现，按 (曲线, 时间) 展平后用二分查找配对
+    max_time_to_recovery = np.full(values.shape[1], np.nan)
+    if index is not None and len(returns):
+        dates = np.asarray(pd.DatetimeIndex(index)[1:], dtype='datetime64[ns]')
+        started = np.cumsum(valid, axis=0) > 0
+        cumulative = np.where(started, growth, np.nan)
+        with np.errstate(invalid='ignore'):
+            peak = np.fmax.accumulate(cumulative, axis=0)
+            in_dd = ((cumulative - peak) / peak < 0).T
+        prev = np.hstack([np.zeros((in_dd.shape[0], 1), dtype=bool), in_dd[:, :-1]])
+        T = in_dd.shape[1]
+        start_flat = np.flatnonzero(in_dd & ~prev)
+        recover_flat = np.flatnonzero(~in_dd & prev)
+        max_time_to_recovery[:] = 0
+        if len(recover_flat):
+            matched = start_flat[np.searchsorted(start_flat, recover_flat) - 1]
+            days = (dates[recover_flat % T] - dates[matched % T]) // np.timedelta64(1, 'D')
+            np.maximum.at(max_time_to_recovery, recover_flat // T, days)
+        max_time_to_recovery = max_time_to_recovery.astype(np.int64)
+
+    return pd.DataFrame({
+        'total_return': total_return,
+        'periods': periods,
+        'annual_volatility': annual_volatility,
+        'annual_return': annual_return,
+        'sharpe_ratio': sharpe_ratio,
+        'calmar_ratio': calmar_ratio,
+        'sortino_ratio': sortino_ratio,
+        'max_drawdown': max_drawdown,
+        'win_rate': win_rate,
+        'max_time_to_recovery': max_time_to_recovery,
+    }, index=labels)
 
 
 class Analyzing_Tools():
 
-    def plot_results(self,data, strat, portfolio_value, drawdown_ts, returns, perf_metrics):
+    def plot_results(self,data, strat, portfolio_value, drawdown_ts, returns, perf_metrics, max_points=DEFAULT_MAX_POINTS):
         # 计算比特币价格的标准化值（归一化处理）
         btc_normalized = data['close'] / data['close'].iloc[0]
 
@@ -27,11 +189,13 @@ class Analyzing_Tools():
 
         # 将数据转换为ColumnDataSource类型
         source = ColumnDataSource(data)
-        p_comparison.line(data.index, btc_normalized, color='blue', legend_label='标准化价格')
+        btc_line = decimate(btc_normalized, max_points)
+        p_comparison.line(btc_line.index, btc_line, color='blue', legend_label='标准化价格')
 
         # 计算组合价值的标准化值
         portfolio_normalized = portfolio_value / portfolio_value.iloc[0]
-        p_comparison.line(portfolio_normalized.index, portfolio_normalized, color='green', legend_label='策略组合价值')
+        portfolio_line = decimate(portfolio_normalized, max_points)
+        p_comparison.line(portfolio_line.index, portfolio_line, color='green', legend_label='策略组合价值')
 
         # 设置图例位置和点击策略
         p_comparison.legend.location = "top_left"
@@ -42,7 +206,8 @@ class Analyzing_Tools():
         p.grid.grid_line_alpha = 0.3
 
         # 添加收盘价线
-        p.line(data.index, data['close'], color='blue', legend_label='收盘价')
+        close_line = decimate(data['close'], max_points)
+        p.line(close_line.index, close_line, color='blue', legend_label='收盘价')
 
         # 获取买入和卖出信号的数据
         buy_signals = pd.DataFrame(strat.buy_signals, columns=['timestamp', 'price'])
@@ -74,12 +239,14 @@ class Analyzing_Tools():
 
         # 创建一个图表，用于显示组合价值
         p_value = figure(x_axis_type="datetime", title="组合价值", height=300, width=1000)
-        p_value.line(portfolio_value.index, portfolio_value, color='navy', legend_label='组合价值')
+        value_line = decimate(portfolio_value, max_points)
+        p_value.line(value_line.index, value_line, color='navy', legend_label='组合价值')
         p_value.grid.grid_line_alpha = 0.3
 
         # 创建一个图表，用于显示回撤
         p_drawdown = figure(x_axis_type="datetime", title="回撤", height=300, width=1000)
-        p_drawdown.line(drawdown_ts.index, drawdown_ts, color='red', legend_label='回撤')
+        drawdown_line = decimate(drawdown_ts, max_points, method='minmax')
+        p_drawdown.line(drawdown_line.index, drawdown_line, color='red', legend_label='回撤')
         p_drawdown.grid.grid_line_alpha = 0.3
 
         # 创建一个图表，用于显示每日收益分布
@@ -102,7 +269,8 @@ class Analyzing_Tools():
         # 计算累计收益并创建相应的图表
         cumulative_returns = (1 + returns).cumprod() - 1
         p_cum_returns = figure(x_axis_type="datetime", title="累计收益", height=300, width=1000)
-        p_cum_returns.line(cumulative_returns.index, cumulative_returns, color='green', legend_label='累计收益')
+        cumulative_line = decimate(cumulative_returns, max_points)
+        p_cum_returns.line(cumulative_line.index, cumulative_line, color='green', legend_label='累计收益')
         p_cum_returns.grid.grid_line_alpha = 0.3
 
         # 创建一个Div对象，用于显示绩效分析结果
@@ -161,7 +329,7 @@ class Analyzing_Tools():
         
         参数:
         strat: Backtrader 策略实例
-        freq: 数据频率，'D' 表示每日，'H' 表示每小时，支持 '30m', '15m', '5m', '1m', '2H', '4H' 等。
+        freq: 数据频率，'D' 表示每日，'H' 表示每小时，支持 '30m', '15m', '5m', '1m', '2H', '4H' 等，为 None 时由日期推断。
         
         返回:
         portfolio_value: 组合的净值序列
@@ -177,26 +345,7 @@ class Analyzing_Tools():
         returns = portfolio_value.pct_change().dropna()
         
         # 确定年化系数
-        if freq == 'D':
-            annual_factor = 365  # 你可以调整为252，如果更适合你的数据
-        elif freq == 'H' or freq == '1H':
-            annual_factor = 365 * 4  # 每天4小时
-        elif freq == '30m':
-            annual_factor = 365 * 4 * 2  # 每小时2个30分钟
-        elif freq == '15m':
-            annual_factor = 365 * 4 * 4  # 每小时4个15分钟
-        elif freq == '5m':
-            annual_factor = 365 * 4 * 12  # 每小时12个5分钟
-        elif freq == '1m':
-            annual_factor = 365 * 4 * 60  # 每小时60个1分钟
-        elif freq == '2H':
-            annual_factor = 365 * 2  # 每天12个2小时
-        elif freq == '4H':
-            annual_factor = 365 * 1  # 每天6个4小时
-        elif freq=='8H':
-            annual_factor=365*3 # 每天3个8小时
-        else:
-            raise ValueError("Unsupported frequency")
+        annual_factor = get_annual_factor(freq, portfolio_value.index)
         
         # 计算各项绩效指标
         total_return = ep.cum_returns_final(returns)  # 总收益率
@@ -217,19 +366,7 @@ class Analyzing_Tools():
         drawdown_ts = (cumulative_returns - running_max) / running_max
         
         # 计算最大恢复时间
-        max_time_to_recovery = 0
-        recovery_start = None
-        for date in drawdown_ts.index:
-            value = drawdown_ts.loc[date]  # 获取可能的标量值
-            if isinstance(value, pd.Series):
-                value = value.iloc[0]  # 如果是Series，取第一个元素
-            if value < 0:  # 现在的 value 是一个单一标量值
-                if recovery_start is None:
-                    recovery_start = date
-            elif recovery_start is not None:
-                recovery_time = (date - recovery_start).days
-                max_time_to_recovery = max(max_time_to_recovery, recovery_time)
-                recovery_start = None
+        max_time_to_recovery, episodes = drawdown_episodes(drawdown_ts)
         metrics = {
             'total_return': total_return,
             'annual_volatility': annual_volatility,
@@ -244,7 +381,7 @@ class Analyzing_Tools():
         
         return portfolio_value, returns, drawdown_ts, metrics
 
-    def plot_multi_asset_results(self,portfolio_value, drawdown_ts, returns, perf_metrics):
+    def plot_multi_asset_results(self,portfolio_value, drawdown_ts, returns, perf_metrics, render=True, path=None, max_points=DEFAULT_MAX_POINTS):
         """
         用于分析多资产组合净值的数据画图函数。
 
@@ -253,16 +390,23 @@ class Analyzing_Tools():
         drawdown_ts: 回撤时间序列
         returns: 收益率序列
         perf_metrics: 绩效分析指标字典
+        render: 是否在浏览器中展示，为 False 且未指定 path 时不构建图表
+        path: 指定时写成静态 HTML 文件，不打开浏览器
+        max_points: 各曲线画图前降采样到的最大点数（回撤曲线保留每段的极值），为 None 时画出全部数据点
         """
+        if not render and path is None:
+            return None
 
         # 创建一个图表，用于显示组合价值
         p_value = figure(x_axis_type="datetime", title="组合价值", height=400, width=1000)
-        p_value.line(portfolio_value.index, portfolio_value, color='navy', legend_label='组合价值')
+        value_line = decimate(portfolio_value, max_points)
+        p_value.line(value_line.index, value_line, color='navy', legend_label='组合价值')
         p_value.grid.grid_line_alpha = 0.3
 
         # 创建一个图表，用于显示回撤
         p_drawdown = figure(x_axis_type="datetime", title="回撤", height=300, width=1000)
-        p_drawdown.line(drawdown_ts.index, drawdown_ts, color='red', legend_label='回撤')
+        drawdown_line = decimate(drawdown_ts, max_points, method='minmax')
+        p_drawdown.line(drawdown_line.index, drawdown_line, color='red', legend_label='回撤')
         p_drawdown.grid.grid_line_alpha = 0.3
 
         # 创建一个图表，用于显示每日收益分布
@@ -285,7 +429,8 @@ class Analyzing_Tools():
         # 计算累计收益并创建相应的图表
         cumulative_returns = (1 + returns).cumprod() - 1
         p_cum_returns = figure(x_axis_type="datetime", title="累计收益", height=300, width=1000)
-        p_cum_returns.line(cumulative_returns.index, cumulative_returns, color='green', legend_label='累计收益')
+        cumulative_line = decimate(cumulative_returns, max_points)
+        p_cum_returns.line(cumulative_line.index, cumulative_line, color='green', legend_label='累计收益')
         p_cum_returns.grid.grid_line_alpha = 0.3
 
         # 创建一个Div对象，用于显示绩效分析结果
@@ -331,7 +476,8 @@ class Analyzing_Tools():
         perf_div = Div(text=perf_text, width=1000, height=200)
 
         # 显示所有图表和绩效分析结果
-        show(column(p_value, p_drawdown, p_returns_hist, p_weekly_returns_hist, p_monthly_returns_hist, p_cum_returns, perf_div))
+        layout = column(p_value, p_drawdown, p_returns_hist, p_weekly_returns_hist, p_monthly_returns_hist, p_cum_returns, perf_div)
+        return self._output_layout(layout, render, path, title="多资产组合绩效分析")
     
     def performance_analysis(self,portfolio_value,freq='D'):
         
@@ -339,25 +485,7 @@ class Analyzing_Tools():
         returns = portfolio_value.pct_change().dropna()
 
         # 确定年化系数
-        if freq == 'D':
-            annual_factor = 252  # 你可以调整为252，如果更适合你的数据
-        elif freq == 'H' or freq == '1H':
-            annual_factor = 252 * 4  # 每天4小时
-        elif freq == '30m':
-            annual_factor = 252 * 4 * 2  # 每小时2个30分钟
-        elif freq == '15m':
-            annual_factor = 252 * 4 * 4  # 每小时4个15分钟
-        elif freq == '5m':
-            annual_factor = 252 * 4 * 12  # 每小时12个5分钟
-        elif freq == '1m':
-            annual_factor = 252 * 4 * 60  # 每小时60个1分钟
-        elif freq == '2H':
-            annual_factor = 252 * 2  # 每天12个2小时
-        elif freq == '4H':
-            annual_factor = 252 * 1  # 每天6个4小时
-
-        else:
-            raise ValueError("Unsupported frequency")
+        annual_factor = get_annual_factor(freq, portfolio_value.index)
 
         # 计算各项绩效指标
         total_return = ep.cum_returns_final(returns)  # 总收益率
@@ -392,18 +520,7 @@ class Analyzing_Tools():
         drawdown_ts = (cumulative_returns - running_max) / running_max
 
         # 计算最大恢复时间
-        max_time_to_recovery = 0
-        recovery_start = None
-
-        for date in drawdown_ts.index:
-            drawdown_value = drawdown_ts.get(date, None)  # 使用 .get() 安全访问
-            if drawdown_value is not None and drawdown_value < 0:
-                if recovery_start is None:
-                    recovery_start = date
-            elif recovery_start is not None:
-                recovery_time = (date - recovery_start).days
-                max_time_to_recovery = max(max_time_to_recovery, recovery_time)
-                recovery_start = None
+        max_time_to_recovery, episodes = drawdown_episodes(drawdown_ts)
 
         # 验证返回值的类型
         metrics = {
@@ -421,18 +538,24 @@ class Analyzing_Tools():
 
         return portfolio_value, returns, drawdown_ts, metrics
     
-    def plot_results(self,benchmark_code, index_price_path, portfolio_value, drawdown_ts, returns, perf_metrics):
+    def plot_results(self,benchmark_code, index_price_path, portfolio_value, drawdown_ts, returns, perf_metrics, render=True, path=None, max_points=DEFAULT_MAX_POINTS):
+        """
+        绘制策略净值报告。render 为 False 且未指定 path 时直接返回，不构建任何图表；
+        指定 path 时写成静态 HTML 文件，不打开浏览器。
+        各曲线画图前降采样到最多 max_points 个点（回撤曲线保留每段的极值），为 None 时画出全部数据点。
+        基准行情经进程内行情缓存读取，报告中同时列出相对基准的 alpha、beta、跟踪误差等指标（见 benchmark 模块）。
+        """
+        if not render and path is None:
+            return None
         # 假设 drawdown_ts 和 returns 是 DataFrame，转换为 Series
         drawdown_ts = drawdown_ts[drawdown_ts.columns[0]]
         returns = returns[returns.columns[0]]
         # 读取基准指数价格数据
-        benchmark_data = pd.read_csv(index_price_path + '\\' + benchmark_code + '.csv', index_col=[0])
-
-        # 确保时间列是 datetime 格式
-        benchmark_data.index = pd.to_datetime(benchmark_data.index)
+        benchmark = load_benchmark(benchmark_code, index_price_path)
+        relative = relative_metrics(portfolio_value, benchmark, freq=None).iloc[0]
 
         # 合并组合价值数据
-        benchmark_data = pd.merge(benchmark_data, portfolio_value, right_index=True, left_index=True)
+        benchmark_data = pd.merge(benchmark.close.rename('close'), portfolio_value, right_index=True, left_index=True)
 
         # 计算标准化的价格
         benchmark_data_normalized = benchmark_data['close'] / benchmark_data['close'].iloc[0]
@@ -442,13 +565,15 @@ class Analyzing_Tools():
         p_comparison.grid.grid_line_alpha = 0.3
 
         # 标准化的基准价格曲线
-        p_comparison.line(x=benchmark_data.index, y=benchmark_data_normalized, color='blue', legend_label='标准化价格')
+        benchmark_line = decimate(benchmark_data_normalized, max_points)
+        p_comparison.line(x=benchmark_line.index, y=benchmark_line, color='blue', legend_label='标准化价格')
 
         # 计算组合价值的标准化值
         portfolio_value_series = portfolio_value[portfolio_value.columns[0]]
         portfolio_value_series.index = pd.to_datetime(portfolio_value_series.index)
         portfolio_normalized = portfolio_value_series / portfolio_value_series.iloc[0]
-        p_comparison.line(portfolio_normalized.index, portfolio_normalized, color='green', legend_label='策略组合价值')
+        portfolio_line = decimate(portfolio_normalized, max_points)
+        p_comparison.line(portfolio_line.index, portfolio_line, color='green', legend_label='策略组合价值')
 
         # 设置图例位置和点击策略
         p_comparison.legend.location = "top_left"
@@ -456,7 +581,8 @@ class Analyzing_Tools():
 
         # 创建一个图表，用于显示组合价值
         p_value = figure(x_axis_type="datetime", title="组合价值", height=300, width=1000)
-        p_value.line(portfolio_value_series.index, portfolio_value_series, color='navy', legend_label='组合价值')
+        value_line = decimate(portfolio_value_series, max_points)
+        p_value.line(value_line.index, value_line, color='navy', legend_label='组合价值')
         p_value.grid.grid_line_alpha = 0.3
 
         # 增加悬停工具到 p_value 图表
@@ -474,7 +600,8 @@ class Analyzing_Tools():
 
         # 创建一个图表，用于显示回撤
         p_drawdown = figure(x_axis_type="datetime", title="回撤", height=300, width=1000)
-        p_drawdown.line(drawdown_ts.index, drawdown_ts, color='red', legend_label='回撤')
+        drawdown_line = decimate(drawdown_ts, max_points, method='minmax')
+        p_drawdown.line(drawdown_line.index, drawdown_line, color='red', legend_label='回撤')
         p_drawdown.grid.grid_line_alpha = 0.3
 
         # 创建一个图表，用于显示每日收益分布
@@ -497,7 +624,8 @@ class Analyzing_Tools():
         # 计算累计收益并创建相应的图表
         cumulative_returns = (1 + returns).cumprod() - 1
         p_cum_returns = figure(x_axis_type="datetime", title="累计收益", height=300, width=1000)
-        p_cum_returns.line(cumulative_returns.index, cumulative_returns, color='green', legend_label='累计收益')
+        cumulative_line = decimate(cumulative_returns, max_points)
+        p_cum_returns.line(cumulative_line.index, cumulative_line, color='green', legend_label='累计收益')
         p_cum_returns.grid.grid_line_alpha = 0.3
 
         # 创建一个Div对象，用于显示绩效分析结果
@@ -537,6 +665,22 @@ class Analyzing_Tools():
                     <td style="padding: 5px; border-bottom: 1px solid #ddd;"><b>胜率:</b></td>
                     <td style="padding: 5px; border-bottom: 1px solid #ddd;">{perf_metrics['win_rate'].values[0]:.4f}</td>
                 </tr>
+                <tr>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;"><b>Alpha / Beta ({benchmark_code}):</b></td>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;">{relative['alpha']:.4f} / {relative['beta']:.4f}</td>
+                </tr>
+                <tr>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;"><b>跟踪误差 / 信息比率:</b></td>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;">{relative['tracking_error']:.4f} / {relative['information_ratio']:.4f}</td>
+                </tr>
+                <tr>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;"><b>上行 / 下行捕获率:</b></td>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;">{relative['up_capture']:.4f} / {relative['down_capture']:.4f}</td>
+                </tr>
+                <tr>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;"><b>超额收益 / 超额最大回撤:</b></td>
+                    <td style="padding: 5px; border-bottom: 1px solid #ddd;">{relative['excess_return']:.4f} / {relative['excess_max_drawdown']:.4f}</td>
+                </tr>
                 <tr>
                     <td style="padding: 5px;"><b>最大恢复时间:</b></td>
                     <td style="padding: 5px;">{perf_metrics['max_time_to_recovery']}</td>
@@ -547,13 +691,80 @@ class Analyzing_Tools():
         perf_div = Div(text=perf_text, width=1000, height=200)
 
         # 显示所有图表和绩效分析结果，移除 p 图表
-        show(column(p_comparison, p_value, p_drawdown, p_returns_hist, p_weekly_returns_hist, p_monthly_returns_hist, p_cum_returns, perf_div))
+        layout = column(p_comparison, p_value, p_drawdown, p_returns_hist, p_weekly_returns_hist, p_monthly_returns_hist, p_cum_returns, perf_div)
+        return self._output_layout(layout, render, path, title="策略绩效分析")
    
+    def benchmark_analysis(self, portfolio_value, benchmark_code=DEFAULT_BENCHMARK, index_price_path=None, freq='D'):
+        """
+        计算一条或多条净值曲线相对基准的指标，基准经进程内行情缓存读取，多次调用只解析一次
+
+        参数：
+        - portfolio_value: 净值序列，或 (时间 x 曲线) 的净值 DataFrame
+        - benchmark_code: 基准代码
+        - index_price_path: 基准 CSV 所在目录
+        - freq: 数据频率，为 None 时由日期推断
+
+        返回：
+        - DataFrame，每行一条曲线，列为 alpha、beta、tracking_error、information_ratio、
+          up_capture、down_capture、excess_return、excess_max_drawdown
+        """
+        benchmark = load_benchmark(benchmark_code, index_price_path)
+        return relative_metrics(portfolio_value, benchmark, freq)
+
+    def rolling_performance_analysis(self, portfolio_value, window=252, step=1, freq='D', render=False, path=None, max_points=DEFAULT_MAX_POINTS):
+        """
+        滚动窗口绩效分析，观察夏普比率、回撤等指标随时间的变化。所有窗口一次算出（见 rolling_analytics 模块），
+        结果与对每个子区间调用 performance_analysis 相同。
+
+        参数：
+        - portfolio_value: 净值序列（Series 或单列 DataFrame）
+        - window: 窗口长度（收益率个数）
+        - step: 相邻窗口的间隔
+        - freq: 数据频率，为 None 时由日期推断
+        - render: 是否绘图并在浏览器中展示
+        - path: 指定时把图表写成静态 HTML 文件，不打开浏览器
+        - max_points: 各曲线画图前降采样到的最大点数
+
+        返回：
+        - DataFrame，以窗口最后一根K线的日期为索引，列为 start 和各项滚动指标
+        """
+        rolling = rolling_performance(portfolio_value, window, step, freq)
+        if render or path is not None:
+            self.plot_rolling_performance(rolling, render=render, path=path, max_points=max_points)
+        return rolling
+
+    def plot_rolling_performance(self, rolling, render=True, path=None, max_points=DEFAULT_MAX_POINTS):
+        """
+        绘制 rolling_performance_analysis 的结果，各图共用同一个时间轴
+        """
+        def create_line_figure(title, columns, colors, method='lttb', x_range=None):
+            p = figure(x_axis_type="datetime", title=title, height=300, width=1000)
+            if x_range is not None:
+                p.x_range = x_range
+            for column_name, color in zip(columns, colors):
+                line = decimate(rolling[column_name], max_points, method=method)
+                p.line(line.index, line, color=color, legend_label=column_name)
+            p.grid.grid_line_alpha = 0.3
+            p.legend.location = "top_left"
+            p.legend.click_policy = "hide"
+            return p
+
+        p_ratio = create_line_figure("滚动夏普比率 / 索提诺比率", ['sharpe_ratio', 'sortino_ratio'], ['navy', 'orange'])
+        p_return = create_line_figure("滚动年化收益率 / 年化波动率", ['annual_return', 'annual_volatility'], ['green', 'gray'], x_range=p_ratio.x_range)
+        # 回撤曲线保留每段的极值
+        p_drawdown = create_line_figure("滚动最大回撤", ['max_drawdown'], ['red'], method='minmax', x_range=p_ratio.x_range)
+        p_win_rate = create_line_figure("滚动胜率", ['win_rate'], ['purple'], x_range=p_ratio.x_range)
+
+        layout = column(p_ratio, p_return, p_drawdown, p_win_rate)
+        return self._output_layout(layout, render, path, title="滚动绩效分析")
+
     # 加载并调整数据以适应回测
     def load_and_adjust_data(self,file_path, asset_name, price_factor=1):
-        # 读取数据并调整价格
-        data = pd.read_csv(file_path, parse_dates=['time'], index_col='time')
-        data['volume'] *= price_factor  # 对交易量进行调整
+        # 读取数据并调整价格，经过进程内行情缓存，同一文件只解析一次；以 'time' 列为索引，
+        # 'time' 为第一列时与 load_bars 共用同一份缓存，否则按 TIME_INDEXED 规则整理
+        dataset = None if csv_columns(file_path)[0] == 'time' else TIME_INDEXED
+        data = get_bar_cache().get(file_path, dataset=dataset)
+        data['volume'] = data['volume'] * price_factor  # 对交易量进行调整，缓存数据只读，不能原地修改
         return bt.feeds.PandasData(dataname=data, open='open', high='high', low='low', close='close', volume='volume', openinterest=1, name=asset_name)
     # 加载指定的多个品种的数据
     def load_selected_data(self,directory, target_assets, extension=".csv", price_factor=1):
@@ -852,105 +1063,93 @@ class Analyzing_Tools():
         return correlation_matrix
 
     #蒙塔卡罗分析策略业绩
-    def monte_carlo_analysis(self, strat, num_simulations=10000, num_days=252, freq='D'):
+    def monte_carlo_analysis(self, strat, num_simulations=10000, num_days=252, freq='D', seed=None, method='window', block_size=None, n_jobs=1, streaming=None, render=True, path=None):
         """
-        蒙特卡洛模拟分析，支持多种数据频段的分析功(能。
+        蒙特卡洛模拟分析，支持多种数据频段的分析功能。
+        所有模拟一次性向量化计算（见 monte_carlo 模块）。
+
+        参数：
+        - strat: 策略实例（或任何提供 get_net_value_series() 的回测结果）
+        - num_simulations: 模拟次数
+        - num_days: 每次模拟的路径长度（K线数）
+        - freq: 数据频率，为 None 时由日期推断
+        - seed: 随机种子，指定后结果可复现
+        - method: 重抽样方式
+            'window'：从净值曲线中随机截取连续窗口（默认）；
+            'iid'：逐期有放回地抽取收益率；
+            'block'：固定块长的分块自助法；
+            'stationary'：平稳自助法；
+            'trades'：随机重排回测的逐笔交易收益（需要策略实例提供 get_trade_returns()）
+        - block_size: 'block' / 'stationary' 的（平均）块长，默认取样本长度的立方根
+        - n_jobs: 流式模拟的并行进程数，-1 为使用全部 CPU
+        - streaming: 是否分块流式汇总（不保存每次模拟的指标，置信区间来自 t-digest 分位数草图）；
+            为 None 时，模拟次数达到 STREAMING_MIN_SIMULATIONS 或 n_jobs 不为 1 时自动启用
+        - render: 是否绘图并在浏览器中展示；批量运行时设为 False，只计算不绘图
+        - path: 指定时把报告写成静态 HTML 文件，不打开浏览器
+
+        返回：
+        - MonteCarloResult：各次模拟的指标（或流式统计量）、置信区间和概率
         """
-        # 获取策略的净值序列
-        portfolio_value = strat.get_net_value_series()
+        if method == 'trades':
+            # 逐笔交易收益，年化系数为每年的交易笔数
+            returns = strat.get_trade_returns()
+            if len(returns) < 2:
+                raise ValueError("已平仓交易不足两笔，无法按交易重排模拟")
+            years = (returns.index[-1] - returns.index[0]).days / 365.25
+            annual_factor = len(returns) / years if years > 0 else len(returns)
+        else:
+            # 获取策略的净值序列
+            portfolio_value = strat.get_net_value_series()
 
-        portfolio_value=portfolio_value.iloc[:,0].copy()
+            portfolio_value=portfolio_value.iloc[:,0].copy()
 
-        # 计算收益率
-        returns = portfolio_value.pct_change().dropna()
+            # 计算收益率
+            returns = portfolio_value.pct_change().dropna()
 
-        # 确定年化系数
-        annual_factor = self._get_annual_factor(freq)
-
-        # 存储模拟结果
-        annualized_returns = []
-        sharpe_ratios = []
-        max_drawdowns = []
-        annual_volatilities = []
-        sortino_ratios = []
-        calmar_ratios = []
-
-        # 进行蒙特卡洛模拟
-        values = (returns + 1).cumprod().values
-        for _ in range(num_simulations):
-            simulated_values = self._monte_carlo_simulation(values, num_days)
-            simulated_returns = np.diff(simulated_values) / simulated_values[:-1]
-
-            # 计算各项指标
-            total_return = np.cumprod(1 + simulated_returns)[-1] - 1
-            periods = len(simulated_returns)
-            annual_volatility = np.std(simulated_returns, ddof=1) * np.sqrt(annual_factor)
-            annual_return = (1 + total_return) ** (annual_factor / periods) - 1
-            sharpe_ratio = annual_return / annual_volatility if annual_volatility != 0 else np.nan
-            max_drawdown = np.min(simulated_values) / np.max(simulated_values) - 1
-
-            # Sortino比率计算
-            downside_returns = simulated_returns[simulated_returns < 0]
-            downside_deviation = np.std(downside_returns, ddof=1) * np.sqrt(annual_factor) if len(downside_returns) > 0 else np.nan
-            sortino_ratio = annual_return / downside_deviation if downside_deviation != 0 else np.nan
-
-            # Calmar比率计算
-            calmar_ratio = annual_return / abs(max_drawdown) if max_drawdown != 0 else np.nan
-
-            # 保存计算结果
-            annualized_returns.append(annual_return)
-            sharpe_ratios.append(sharpe_ratio)
-            max_drawdowns.append(max_drawdown)
-            annual_volatilities.append(annual_volatility)
-            sortino_ratios.append(sortino_ratio)
-            calmar_ratios.append(calmar_ratio)
+            # 确定年化系数
+            annual_factor = self._get_annual_factor(freq, portfolio_value.index)
+
+        if streaming is None:
+            streaming = num_simulations >= STREAMING_MIN_SIMULATIONS or n_jobs != 1
+        if streaming:
+            stats = simulate_streaming(returns.values, num_simulations, num_days, annual_factor, method=method, block_size=block_size, seed=seed, n_jobs=n_jobs)
+            result = MonteCarloResult(stats=stats, method=method)
+        else:
+            # 进行蒙特卡洛模拟
+            metrics = simulate(returns.values, num_simulations, num_days, annual_factor, method=method, block_size=block_size, seed=seed)
+            result = MonteCarloResult(metrics=metrics, method=method)
 
         # 生成分析报告和可视化
-        self._plot_results(annualized_returns, sharpe_ratios, max_drawdowns, annual_volatilities, sortino_ratios, calmar_ratios)
+        if render or path is not None:
+            self.render_monte_carlo(result, render=render, path=path)
+        return result
 
-    def _get_annual_factor(self, freq):
-        # 根据频率返回年化系数
-        freq_map = {
-            'D': 365, 'H': 365 * 4, '30m': 365 * 4 * 2, '15m': 365 * 4 * 4, 
-            '5m': 365 * 4 * 12, '1m': 365 * 4 * 60, '2H': 365 * 2, '4H': 365 * 1, '8H': 365 * 3
-        }
-        return freq_map.get(freq, 365)
-
-    def _monte_carlo_simulation(self, values, num_days):
-        # 蒙特卡洛模拟函数
-        start_index = np.random.randint(0, len(values) - num_days)
-        return values[start_index:start_index + num_days]
-
-    def _plot_results(self, annualized_returns, sharpe_ratios, max_drawdowns, annual_volatilities, sortino_ratios, calmar_ratios):
-        # 计算分位数置信区间
-        def quantile_confidence_interval(data, lower_quantile=2.5, upper_quantile=97.5):
-            lower_bound = np.percentile(data, lower_quantile)
-            upper_bound = np.percentile(data, upper_quantile)
-            return lower_bound, upper_bound
-
-        # 计算各项指标的分位数置信区间
-        ci_ret = quantile_confidence_interval(annualized_returns, lower_quantile=0.5, upper_quantile=80)  # 99%置信区间
-        ci_sharpe = quantile_confidence_interval(sharpe_ratios, lower_quantile=0.5, upper_quantile=80)
-        ci_mdd = quantile_confidence_interval(max_drawdowns, lower_quantile=0.5, upper_quantile=80)
-        ci_vol = quantile_confidence_interval(annual_volatilities, lower_quantile=0.5, upper_quantile=80)
-        ci_sortino = quantile_confidence_interval(sortino_ratios, lower_quantile=0.5, upper_quantile=80)
-        ci_calmar = quantile_confidence_interval(calmar_ratios, lower_quantile=0.5, upper_quantile=80)
-
-        # 计算概率
-        prob_ret_pos = np.mean(np.array(annualized_returns) > 0)
-        prob_sharpe_gt_1 = np.mean(np.array(sharpe_ratios) > 1)
-        prob_sortino_gt_1 = np.mean(np.array(sortino_ratios) > 1)
-        prob_mdd_lt_neg_0_1 = np.mean(np.array(max_drawdowns) > -0.1)
+    def _get_annual_factor(self, freq, index=None):
+        # 根据频率返回年化系数，未知频率直接报错
+        return get_annual_factor(freq, index)
+
+    def render_monte_carlo(self, result, render=True, path=None):
+        """
+        绘制蒙特卡洛模拟结果（monte_carlo.MonteCarloResult）的分布图和统计信息
+
+        参数：
+        - result: monte_carlo_analysis 返回的结果对象
+        - render: 是否在浏览器中展示
+        - path: 指定时把报告写成静态 HTML 文件，不打开浏览器
 
+        返回：
+        - Bokeh 布局
+        """
         # 创建绘图函数
-        def create_histogram_with_pdf_cdf(data, title, xlabel, ylabel, mu, std, ci):
+        def create_histogram_with_pdf_cdf(name, title, xlabel, ylabel):
+            mu, std, ci = result.mean(name), result.std(name), result.confidence_interval(name)
             p = figure(title=title, x_axis_label=xlabel, y_axis_label=ylabel)
             # 绘制直方图
-            hist, edges = np.histogram(data, bins=50, density=True)
+            hist, edges = result.histogram(name, bins=50)
             p.quad(top=hist, bottom=0, left=edges[:-1], right=edges[1:], fill_color="skyblue", line_color="black")
 
             # 绘制正态分布的PDF
-            x = np.linspace(min(data), max(data), 100)
+            x = np.linspace(*result.bounds(name), 100)
             pdf = norm.pdf(x, mu, std)
             p.line(x, pdf, line_color="black", line_width=2)
 
@@ -966,38 +1165,51 @@ class Analyzing_Tools():
             return p
 
         # 创建图表，包括卡玛比率
-        p1 = create_histogram_with_pdf_cdf(annualized_returns, "年化收益率分布", "年化收益率", "密度", np.mean(annualized_returns), np.std(annualized_returns), ci_ret)
-        p2 = create_histogram_with_pdf_cdf(sharpe_ratios, "夏普比率分布", "夏普比率", "密度", np.mean(sharpe_ratios), np.std(sharpe_ratios), ci_sharpe)
-        p3 = create_histogram_with_pdf_cdf(max_drawdowns, "最大回撤分布", "最大回撤", "密度", np.mean(max_drawdowns), np.std(max_drawdowns), ci_mdd)
-        p4 = create_histogram_with_pdf_cdf(annual_volatilities, "年化波动率分布", "年化波动率", "密度", np.mean(annual_volatilities), np.std(annual_volatilities), ci_vol)
-        p5 = create_histogram_with_pdf_cdf(sortino_ratios, "索提诺比率分布", "索提诺比率", "密度", np.mean(sortino_ratios), np.std(sortino_ratios), ci_sortino)
-        p6 = create_histogram_with_pdf_cdf(calmar_ratios, "卡玛比率分布", "卡玛比率", "密度", np.mean(calmar_ratios), np.std(calmar_ratios), ci_calmar)
+        p1 = create_histogram_with_pdf_cdf('annual_return', "年化收益率分布", "年化收益率", "密度")
+        p2 = create_histogram_with_pdf_cdf('sharpe_ratio', "夏普比率分布", "夏普比率", "密度")
+        p3 = create_histogram_with_pdf_cdf('max_drawdown', "最大回撤分布", "最大回撤", "密度")
+        p4 = create_histogram_with_pdf_cdf('annual_volatility', "年化波动率分布", "年化波动率", "密度")
+        p5 = create_histogram_with_pdf_cdf('sortino_ratio', "索提诺比率分布", "索提诺比率", "密度")
+        p6 = create_histogram_with_pdf_cdf('calmar_ratio', "卡玛比率分布", "卡玛比率", "密度")
 
         # 创建2x3的网格布局
         grid = gridplot([[p1, p2], [p3, p4], [p5, p6]])
 
         # 创建统计信息的Div，增加标准差信息
-        stats = f"""
-        <h2>蒙特卡洛模拟统计结果</h2>
-        <ul>
-            <li>年化收益率的均值: {np.mean(annualized_returns):.4f}, 标准差: {np.std(annualized_returns, ddof=1):.4f}, 置信区间: {ci_ret}</li>
-            <li>夏普比率的均值: {np.mean(sharpe_ratios):.4f}, 标准差: {np.std(sharpe_ratios, ddof=1):.4f}, 置信区间: {ci_sharpe}</li>
-            <li>最大回撤的均值: {np.mean(max_drawdowns):.4f}, 标准差: {np.std(max_drawdowns, ddof=1):.4f}, 置信区间: {ci_mdd}</li>
-            <li>年化波动率的均值: {np.mean(annual_volatilities):.4f}, 标准差: {np.std(annual_volatilities, ddof=1):.4f}, 置信区间: {ci_vol}</li>
-            <li>索提诺比率的均值: {np.mean(sortino_ratios):.4f}, 标准差: {np.std(sortino_ratios, ddof=1):.4f}, 置信区间: {ci_sortino}</li>
-            <li>卡玛比率的均值: {np.mean(calmar_ratios):.4f}, 标准差: {np.std(calmar_ratios, ddof=1):.4f}, 置信区间: {ci_calmar}</li>
-            <li>年化收益率大于0的概率: {prob_ret_pos:.4f}</li>
-            <li>夏普比率大于1的概率: {prob_sharpe_gt_1:.4f}</li>
-            <li>索提诺比率大于1的概率: {prob_sortino_gt_1:.4f}</li>
-            <li>最大回撤大于-0.1的概率: {prob_mdd_lt_neg_0_1:.4f}</li>
-        </ul>
-        """
+        labels = {
+            'annual_return': '年化收益率',
+            'sharpe_ratio': '夏普比率',
+            'max_drawdown': '最大回撤',
+            'annual_volatility': '年化波动率',
+            'sortino_ratio': '索提诺比率',
+            'calmar_ratio': '卡玛比率',
+        }
+        probabilities = result.probabilities
+        items = [f"<li>{labels[name]}的均值: {result.mean(name):.4f}, 标准差: {result.std(name, ddof=1):.4f}, 置信区间: {result.confidence_interval(name)}</li>"
+                 for name in METRICS]
+        items += [
+            f"<li>年化收益率大于0的概率: {probabilities['annual_return']:.4f}</li>",
+            f"<li>夏普比率大于1的概率: {probabilities['sharpe_ratio']:.4f}</li>",
+            f"<li>索提诺比率大于1的概率: {probabilities['sortino_ratio']:.4f}</li>",
+            f"<li>最大回撤大于-0.1的概率: {probabilities['max_drawdown']:.4f}</li>",
+        ]
+        stats = "<h2>蒙特卡洛模拟统计结果</h2>\n<ul>\n" + "\n".join(items) + "\n</ul>"
         div = Div(text=stats, width=800)
 
         layout = column(div, grid)
 
-        # 使用Bokeh的show()函数直接在浏览器中展示图表
-        show(layout)
+        # 使用Bokeh的show()函数直接在浏览器中展示图表，或写成静态 HTML
+        return self._output_layout(layout, render, path, title="蒙特卡洛模拟")
+
+    def _output_layout(self, layout, render=True, path=None, title="Bokeh Plot"):
+        """
+        输出 Bokeh 布局：指定 path 时写成静态 HTML 文件（不打开浏览器），否则 render 为 True 时用 show() 展示
+        """
+        if path is not None:
+            save(layout, filename=path, resources=CDN, title=title)
+        elif render:
+            show(layout)
+        return layout
 
     def optimize_two_parameters(self, run_backtest_func, strategy, datafeeds, param_combinations, cash=100000.0, commission=0.003):
         """
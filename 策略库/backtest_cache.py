@@ -0,0 +1,160 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+from result_store import source_fingerprint
+
+
+# 进程内最多缓存的回测结果数量，每个结果只保存净值序列
+DEFAULT_MAX_ENTRIES = 2000
+
+
+class CachedBacktestResult():
+    """
+    缓存命中时返回的回测结果，只包含净值序列，接口与策略实例的 get_net_value_series() 一致
+    """
+
+    def __init__(self, net_value):
+        self.net_value = net_value
+        self.value = net_value.iloc[:, 0].tolist()
+        self.dates = net_value.index.tolist()
+
+    def get_net_value_series(self):
+        return self.net_value.copy()
+
+
+# 回测函数和策略类的代码指纹，按对象缓存，每个对象只读取一次源代码
+_code_fingerprints = weakref.WeakKeyDictionary()
+_code_lock = threading.Lock()
+
+
+def _code_fingerprint(obj):
+    """
+    函数或类源代码的哈希。脚本在同一解释器中修改后重新运行（如 Spyder 的 runfile）时，
+    新定义的回测函数、策略类得到新的指纹，不会命中修改前的缓存结果
+    """
+    with _code_lock:
+        try:
+            fingerprint = _code_fingerprints.get(obj)
+        except TypeError:
+            fingerprint = None
+    if fingerprint is None:
+        fingerprint = hashlib.sha1(source_fingerprint(obj).encode('utf-8')).hexdigest()
+        with _code_lock:
+            try:
+                _code_fingerprints[obj] = fingerprint
+            except TypeError:
+                pass    # 不支持弱引用的对象每次重新计算
+    return fingerprint
+
+
+def _strategy_params(strategy, kwargs):
+    """
+    策略参数：类中定义的默认值加上运行时传入的覆盖值
+    """
+    params = {}
+    if hasattr(strategy, 'params') and hasattr(strategy.params, '_getitems'):
+        params.update(dict(strategy.params._getitems()))
+    params.update(kwargs)
+    return params
+
+
+def backtest_key(run_backtest_func, strategy, target_assets, strategy_results, cash, commission, slippage_perc, slippage_fixed=None, **kwargs):
+    """
+    回测结果的内容哈希：各资产的日期、开高低收和信号数组，加上回测函数和策略类（名称及源代码）、资金、佣金、滑点和策略参数（如 size_pct）。
+    不同参数生成的信号完全相同时得到同一个键。
+    """
+    h = hashlib.blake2b(digest_size=20)
+    settings = (
+        getattr(run_backtest_func, '__module__', ''), getattr(run_backtest_func, '__qualname__', repr(run_backtest_func)),
+        _code_fingerprint(run_backtest_func),
+        getattr(strategy, '__module__', ''), getattr(strategy, '__qualname__', repr(strategy)),
+        _code_fingerprint(strategy),
+        cash, commission, slippage_perc, slippage_fixed,
+        sorted(_strategy_params(strategy, kwargs).items()),
+    )
+    h.update(repr(settings).encode('utf-8'))
+    for code in target_assets:
+        data = strategy_results[code]
+        h.update(str(code).encode('utf-8'))
+        h.update(data.index.asi8.tobytes())
+        for col in ('open', 'high', 'low', 'close'):
+            h.update(np.ascontiguousarray(data[col].to_numpy(dtype=float)).tobytes())
+        # 与 PandasDataPlusSignal 一致，signal 取最后一列
+        h.update(np.ascontiguousarray(data.iloc[:, -1].to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()
+
+
+class BacktestCache():
+    """
+    按内容寻址的回测结果缓存，放在 run_backtest 之前：
+    信号和价格完全相同、交易设置也相同的回测直接返回保存的净值序列，不再重新撮合。
+    超过数量上限时按最近最少使用（LRU）的顺序淘汰。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._items = OrderedDict()   # key -> 净值序列
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, run_backtest_func, strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
+        """
+        参数与 run_backtest 相同，多出的第一个参数为实际执行回测的函数。
+
+        返回：
+        - 未命中时为回测函数返回的策略实例，命中时为 CachedBacktestResult
+        """
+        key = backtest_key(run_backtest_func, strategy, target_assets, strategy_results, cash, commission, slippage_perc, slippage_fixed, **kwargs)
+        with self._lock:
+            net_value = self._items.get(key)
+            if net_value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return CachedBacktestResult(net_value)
+            self.misses += 1
+
+        strat = run_backtest_func(strategy, target_assets, strategy_results, cash, commission, slippage_perc, slippage_fixed, **kwargs)
+        with self._lock:
+            self._items[key] = strat.get_net_value_series().copy()
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return strat
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        """
+        返回缓存命中统计
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._items),
+            }
+
+    def report(self, hits=None, misses=None):
+        """
+        打印命中统计，hits、misses 为 None 时打印累计值
+        """
+        stats = self.stats()
+        hits = stats['hits'] if hits is None else hits
+        misses = stats['misses'] if misses is None else misses
+        total = hits + misses
+        hit_rate = hits / total if total else 0.0
+        print(f"回测结果缓存：命中 {hits} 次，未命中 {misses} 次，命中率 {hit_rate:.2%}")
+
+
+# 进程内共享的回测结果缓存
+_backtest_cache = BacktestCache()
+
+
+def get_backtest_cache():
+    return _backtest_cache
@@ -0,0 +1,558 @@
+import os
+import json
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+# 列式存储目录名，建立在每个 CSV 数据目录之下
+STORE_DIRNAME = '_bar_store'
+# 时间索引文件名
+INDEX_FILE = '__index__.npy'
+# 元信息文件名，最后写入，存在即代表转换完成
+META_FILE = 'meta.json'
+# 策略中使用的数据频段，与 paths 字典中的键名一致
+FREQS = ('daily', 'hourly', 'min15')
+# 进程内行情缓存的默认内存上限（字节）
+DEFAULT_CACHE_BYTES = 1024 ** 3
+
+
+def _store_path(csv_path, dataset=None):
+    """
+    返回 CSV 文件对应的列式存储目录，辅助数据集按数据集名称单独存放
+    """
+    directory, filename = os.path.split(os.path.abspath(csv_path))
+    stem = os.path.splitext(filename)[0]
+    if dataset is not None:
+        stem = f"{stem}@{dataset.name}"
+    return os.path.join(directory, STORE_DIRNAME, stem)
+
+
+def _read_meta(store_path):
+    meta_file = os.path.join(store_path, META_FILE)
+    if not os.path.exists(meta_file):
+        return None
+    try:
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(csv_path, dataset=None):
+    """
+    判断 CSV 对应的列式存储是否需要重建（不存在，CSV 的修改时间/大小发生变化，或辅助数据集的整理规则发生变化）
+    """
+    meta = _read_meta(_store_path(csv_path, dataset))
+    if meta is None:
+        return True
+    stat = os.stat(csv_path)
+    if dataset is not None and meta.get('dataset') != dataset.spec():
+        return True
+    return meta['source_mtime_ns'] != stat.st_mtime_ns or meta['source_size'] != stat.st_size
+
+
+def convert_csv(csv_path, dataset=None):
+    """
+    将单个 CSV 转换为按列保存的 .npy 文件，时间索引预先解析为 datetime64[ns]。
+
+    参数：
+    - csv_path: CSV 文件路径，第一列为时间
+    - dataset: 辅助数据集，给出时按其规则整理后再保存
+
+    返回：
+    - 列式存储目录
+    """
+    stat = os.stat(csv_path)
+    data = _parse_csv(csv_path, dataset=dataset)
+
+    store_path = _store_path(csv_path, dataset)
+    # 先写入临时目录再整体替换，避免读到转换了一半的数据
+    tmp_path = f"{store_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for i, col in enumerate(data.columns):
+        values = data[col].to_numpy()
+        # 字符串等对象列无法内存映射，单独标记
+        is_object = values.dtype == object
+        filename = f"{i}.npy"
+        np.save(os.path.join(tmp_path, filename), values, allow_pickle=is_object)
+        columns.append({'name': col, 'file': filename, 'object': bool(is_object)})
+    np.save(os.path.join(tmp_path, INDEX_FILE), data.index.values.astype('datetime64[ns]'))
+
+    meta = {
+        'source': os.path.abspath(csv_path),
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_size': stat.st_size,
+        'index_name': data.index.name,
+        'columns': columns,
+        'rows': len(data),
+    }
+    if dataset is not None:
+        meta['dataset'] = dataset.spec()
+    with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    try:
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path, ignore_errors=True)
+        os.replace(tmp_path, store_path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        # 其他进程同时转换同一个 CSV 并已先完成替换时，直接使用它的结果
+        if not is_stale(csv_path, dataset):
+            return store_path
+        raise
+    return store_path
+
+
+def read_store(csv_path, mmap=False, read_only=False, dataset=None):
+    """
+    读取列式存储，返回与 pd.read_csv(index_col=[0]) + pd.to_datetime 相同的 DataFrame。
+
+    参数：
+    - csv_path: 原始 CSV 文件路径
+    - mmap: 是否以只读内存映射方式加载数值列
+    - read_only: 是否将所有列设为只读，原地修改时会直接报错
+    - dataset: 辅助数据集，读取其整理后的存储
+    """
+    store_path = _store_path(csv_path, dataset)
+    meta = _read_meta(store_path)
+    if meta is None:
+        raise FileNotFoundError(f"列式存储不存在或未转换完成：{store_path}")
+    mmap_mode = 'r' if mmap else None
+
+    index = pd.DatetimeIndex(np.load(os.path.join(store_path, INDEX_FILE), mmap_mode=mmap_mode),
+                             name=meta['index_name'])
+    columns = {}
+    for col in meta['columns']:
+        file = os.path.join(store_path, col['file'])
+        if col['object']:
+            values = np.load(file, allow_pickle=True)
+        else:
+            values = np.load(file, mmap_mode=mmap_mode)
+        if read_only:
+            values.flags.writeable = False
+        columns[col['name']] = values
+    # 只读或内存映射时不复制，保持各列直接引用磁盘/缓存中的数组
+    return pd.DataFrame(columns, index=index, copy=not (mmap or read_only))
+
+
+def _parse_csv(csv_path, read_only=False, dataset=None):
+    if dataset is not None:
+        data = dataset.normalize(pd.read_csv(csv_path))
+    else:
+        data = pd.read_csv(csv_path, index_col=[0])
+        data.index = pd.to_datetime(data.index)
+    if read_only:
+        columns = {}
+        for col in data.columns:
+            values = data[col].to_numpy(copy=True)
+            values.flags.writeable = False
+            columns[col] = values
+        data = pd.DataFrame(columns, index=data.index, copy=False)
+    return data
+
+
+def load_csv(csv_path, mmap=False, read_only=False, dataset=None):
+    """
+    读取 CSV 行情数据，优先使用列式存储；存储缺失或过期时先重建。
+    其他进程正在替换同一个存储时读取可能失败（文件已删除或新旧文件混读），此时直接解析 CSV。
+
+    参数：
+    - csv_path: CSV 文件路径
+    - mmap: 是否以只读内存映射方式加载数值列
+    - read_only: 是否将所有列设为只读
+    - dataset: 辅助数据集，给出时读取按其规则整理后的数据
+
+    返回：
+    - 以 DatetimeIndex 为索引的 DataFrame
+    """
+    if is_stale(csv_path, dataset):
+        try:
+            convert_csv(csv_path, dataset)
+        except OSError as e:
+            # 数据目录不可写时退回直接解析 CSV
+            print(f"Warning: 无法写入列式存储 {csv_path}: {e}")
+            return _parse_csv(csv_path, read_only=read_only, dataset=dataset)
+    try:
+        return read_store(csv_path, mmap=mmap, read_only=read_only, dataset=dataset)
+    except (OSError, ValueError):
+        return _parse_csv(csv_path, read_only=read_only, dataset=dataset)
+
+
+def _frame_nbytes(data):
+    """
+    估算 DataFrame 占用的内存字节数，对象列逐个计入 Python 对象大小
+    """
+    nbytes = data.index.nbytes
+    for col in data.columns:
+        values = data[col].to_numpy()
+        nbytes += values.nbytes
+        if values.dtype == object:
+            nbytes += sum(sys.getsizeof(v) for v in values)
+    return nbytes
+
+
+class BarCache():
+    """
+    进程内行情数据缓存，按 (数据目录, 资产代码, 辅助数据集, 文件修改时间) 记忆已加载的 DataFrame，
+    数据目录即对应 paths 中的频段，因此同一文件无论经由 load_bars 还是 Analyzing_Tools 读取都只解析一次；
+    辅助数据集（AuxDataset）整理后的数据同样缓存在这里。
+    缓存中的数据全部只读，取出时返回浅拷贝：新增列不会影响缓存，原地修改已有列会直接报错。
+    超出内存上限时按最近最少使用（LRU）的顺序淘汰。
+    mmap 为 True 时数值列以内存映射方式读取列式存储，多个进程共享操作系统的页缓存。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, mmap=False):
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self._items = OrderedDict()   # key -> (DataFrame, 占用字节数)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, csv_path, dataset=None):
+        """
+        读取一个 CSV 文件对应的行情数据，命中缓存时不再读取磁盘。
+
+        参数：
+        - csv_path: CSV 文件路径
+        - dataset: 辅助数据集，给出时返回按其规则整理后的数据
+
+        返回：
+        - 只读数据的浅拷贝 DataFrame
+        """
+        directory, filename = os.path.split(os.path.abspath(csv_path))
+        code = os.path.splitext(filename)[0]
+        tag = None if dataset is None else dataset.key()
+        key = (directory, code, tag, os.stat(csv_path).st_mtime_ns)
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0].copy(deep=False)
+            self.misses += 1
+
+        data = load_csv(csv_path, mmap=self.mmap, read_only=True, dataset=dataset)
+        nbytes = _frame_nbytes(data)
+
+        with self._lock:
+            # 同一文件修改后旧版本不会再被命中，直接移除
+            for old_key in [k for k in self._items if k[:3] == key[:3] and k != key]:
+                self._discard(old_key)
+            if nbytes <= self.max_bytes and key not in self._items:
+                self._items[key] = (data, nbytes)
+                self.current_bytes += nbytes
+                self._evict()
+        return data.copy(deep=False)
+
+    def _discard(self, key):
+        _, nbytes = self._items.pop(key)
+        self.current_bytes -= nbytes
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._items:
+            oldest = next(iter(self._items))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def set_max_bytes(self, max_bytes):
+        """
+        调整内存上限，超出部分立即淘汰
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """
+        返回缓存命中统计
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._items),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def report(self):
+        stats = self.stats()
+        print(f"行情缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，命中率 {stats['hit_rate']:.2%}，"
+              f"淘汰 {stats['evictions']} 次，缓存 {stats['entries']} 个文件，"
+              f"占用 {stats['bytes'] / 1024 ** 2:.1f}MB / {stats['max_bytes'] / 1024 ** 2:.1f}MB")
+
+
+# 进程内共享的行情缓存，信号函数和 Analyzing_Tools 都通过它读取数据
+_bar_cache = BarCache()
+
+
+def get_bar_cache():
+    return _bar_cache
+
+
+def set_cache_budget(max_bytes):
+    """
+    设置进程内行情缓存的内存上限（字节）
+    """
+    _bar_cache.set_max_bytes(max_bytes)
+
+
+def set_cache_mmap(mmap=True):
+    """
+    设置进程内行情缓存是否以内存映射方式读取列式存储，并行优化的子进程中开启
+    """
+    _bar_cache.mmap = mmap
+    _bar_cache.clear()
+
+
+def load_bars(code, freq, paths, cache=True):
+    """
+    按资产代码和频段读取行情数据，所有策略文件用它代替 pd.read_csv。
+    默认经过进程内缓存，返回的数据只读，需要修改时请先 copy()。
+
+    参数：
+    - code: 资产代码，例如 '000300.SH'
+    - freq: 数据频段，即 paths 中的键名，'daily'、'hourly' 或 'min15'
+    - paths: 数据路径字典
+    - cache: 是否使用进程内缓存，为 False 时每次从列式存储读取可写的副本
+
+    返回：
+    - 以 DatetimeIndex 为索引的 DataFrame
+    """
+    csv_path = os.path.join(paths[freq], f"{code}.csv")
+    if cache:
+        return _bar_cache.get(csv_path)
+    return load_csv(csv_path)
+
+
+def build_store(paths, freqs=FREQS, target_assets=None):
+    """
+    一次性将各频段目录下的 CSV 转换为列式存储，只重建过期的文件。
+
+    参数：
+    - paths: 数据路径字典
+    - freqs: 需要转换的频段
+    - target_assets: 资产列表，为 None 时转换目录下全部 CSV
+
+    返回：
+    - 本次重建的文件数量
+    """
+    rebuilt = 0
+    for freq in freqs:
+        directory = paths.get(freq)
+        if directory is None or not os.path.isdir(directory):
+            continue
+        if target_assets is None:
+            files = [f for f in os.listdir(directory) if f.endswith('.csv')]
+        else:
+            files = [f"{code}.csv" for code in target_assets]
+        for file in files:
+            csv_path = os.path.join(directory, file)
+            if os.path.isfile(csv_path) and is_stale(csv_path):
+                convert_csv(csv_path)
+                rebuilt += 1
+    return rebuilt
+
+
+# 辅助数据集注册表：名称 -> AuxDataset
+_datasets = {}
+
+
+class AuxDataset():
+    """
+    另类数据（期权成交量、自由流通换手率等）的读取与整理规则。
+    首次读取时把原始 CSV 整理为以日期为索引的表并写入列式存储，之后经进程内行情缓存复用，
+    每个文件在一个进程内只解析一次；各资产通过 load 取得与自身行情对齐的切片。
+    """
+
+    def __init__(self, name, path, path_key=None, per_asset=False, date_column=None, columns=None,
+                 rename=None, divisor=None, dedupe=True, sort=True):
+        """
+        参数：
+        - name: 数据集名称
+        - path: 默认路径；per_asset 为 False 时为 CSV 文件，为 True 时为目录，文件名为 {资产代码}.csv
+        - path_key: paths 字典中可覆盖默认路径的键名
+        - per_asset: 是否每个资产一个文件
+        - date_column: 日期列名，为 None 时取第一列
+        - columns: 保留的列，为 None 时保留全部
+        - rename: 列名映射
+        - divisor: 数值列统一除以的系数，如百分数除以 100
+        - dedupe: 是否去掉重复日期（保留最后一条）
+        - sort: 是否按日期升序排列
+        """
+        self.name = name
+        self.path = path
+        self.path_key = path_key
+        self.per_asset = per_asset
+        self.date_column = date_column
+        self.columns = list(columns) if columns is not None else None
+        self.rename = dict(rename) if rename else None
+        self.divisor = divisor
+        self.dedupe = dedupe
+        self.sort = sort
+
+    def spec(self):
+        """
+        整理规则，写入列式存储的元信息，规则变化时重建存储
+        """
+        return {
+            'date_column': self.date_column,
+            'columns': self.columns,
+            'rename': self.rename,
+            'divisor': self.divisor,
+            'dedupe': self.dedupe,
+            'sort': self.sort,
+        }
+
+    def key(self):
+        return f"{self.name}:{json.dumps(self.spec(), sort_keys=True, ensure_ascii=False)}"
+
+    def normalize(self, data):
+        """
+        整理原始 CSV：日期列设为索引并解析，（默认）重复日期保留最后一条、按日期升序排列，再选取列、改名和缩放
+        """
+        date_column = data.columns[0] if self.date_column is None else self.date_column
+        data = data.set_index(date_column)
+        data.index = pd.to_datetime(data.index)
+        if self.dedupe:
+            data = data[~data.index.duplicated(keep='last')]
+        if self.sort:
+            data = data.sort_index(kind='stable')
+        if self.columns is not None:
+            data = data[self.columns]
+        if self.rename:
+            data = data.rename(columns=self.rename)
+        if self.divisor is not None:
+            data = data / self.divisor
+        return data
+
+    def csv_path(self, paths=None, code=None):
+        path = self.path
+        if paths is not None and self.path_key is not None and self.path_key in paths:
+            path = paths[self.path_key]
+        if self.per_asset:
+            if code is None:
+                raise ValueError(f"数据集 {self.name} 按资产存放，需要指定资产代码")
+            return os.path.join(path, f"{code}.csv")
+        return path
+
+    def fingerprint(self, paths=None, target_assets=()):
+        """
+        数据集指纹：整理规则，以及各文件的路径、修改时间和大小，文件更新或规则变化后指纹随之改变
+
+        参数：
+        - paths: 数据路径字典
+        - target_assets: 资产列表，per_asset 为 True 时按资产取文件
+        """
+        codes = target_assets if self.per_asset else [None]
+        files = []
+        for code in codes:
+            csv_path = self.csv_path(paths, code)
+            if csv_path is not None and os.path.isfile(csv_path):
+                stat = os.stat(csv_path)
+                files.append((csv_path, stat.st_mtime_ns, stat.st_size))
+            else:
+                files.append((csv_path, None, None))
+        return {'spec': self.spec(), 'files': files}
+
+    def load(self, paths=None, code=None, index=None, cache=True):
+        """
+        读取数据集
+
+        参数：
+        - paths: 数据路径字典，含 path_key 时覆盖默认路径
+        - code: 资产代码，per_asset 为 True 时必填
+        - index: 对齐的日期索引，给出时按该索引取切片（缺失的日期为 NaN），相当于以行情为左表的左连接
+        - cache: 是否使用进程内缓存
+
+        返回：
+        - 以 DatetimeIndex 为索引的 DataFrame，经缓存读取时数据只读
+        """
+        csv_path = self.csv_path(paths, code)
+        if cache:
+            data = _bar_cache.get(csv_path, dataset=self)
+        else:
+            data = load_csv(csv_path, dataset=self)
+        if index is not None:
+            data = data.reindex(pd.DatetimeIndex(index))
+        return data
+
+
+def csv_columns(csv_path):
+    """
+    只读取表头，返回 CSV 的列名
+    """
+    return pd.read_csv(csv_path, nrows=0).columns
+
+
+def register_dataset(name, path, **kwargs):
+    """
+    注册辅助数据集，参数见 AuxDataset；同名数据集重新注册时覆盖
+
+    返回：
+    - AuxDataset
+    """
+    dataset = AuxDataset(name, path, **kwargs)
+    _datasets[name] = dataset
+    return dataset
+
+
+def registered_datasets():
+    """
+    返回：
+    - 已注册的辅助数据集 {名称: AuxDataset}
+    """
+    return dict(_datasets)
+
+
+def build_dataset_stores(paths=None, target_assets=None):
+    """
+    将已注册的辅助数据集一次性整理并转换为列式存储，只重建过期的文件；
+    按资产存放的数据集对 target_assets 中的每个资产各转换一次。
+
+    参数：
+    - paths: 数据路径字典，含数据集的 path_key 时覆盖默认路径
+    - target_assets: 资产列表
+
+    返回：
+    - 本次重建的文件数量
+    """
+    rebuilt = 0
+    for dataset in _datasets.values():
+        codes = (target_assets or []) if dataset.per_asset else [None]
+        for code in codes:
+            csv_path = dataset.csv_path(paths, code)
+            if csv_path is not None and os.path.isfile(csv_path) and is_stale(csv_path, dataset):
+                convert_csv(csv_path, dataset)
+                rebuilt += 1
+    return rebuilt
+
+
+def load_dataset(name, paths=None, code=None, index=None, cache=True):
+    """
+    按名称读取已注册的辅助数据集，参数见 AuxDataset.load
+    """
+    if name not in _datasets:
+        raise KeyError(f"未注册的数据集：{name}，已注册 {sorted(_datasets)}")
+    return _datasets[name].load(paths, code=code, index=index, cache=cache)
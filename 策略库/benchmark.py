@@ -0,0 +1,178 @@
+"""
+基准相关的绩效分析。
+
+基准行情经进程内行情缓存（bar_store.BarCache）读取，同一基准文件在一个进程内只解析一次；
+相对指标（alpha、beta、跟踪误差、信息比率、上行/下行捕获率、超额收益和超额最大回撤）
+对 (时间 x 曲线) 的净值矩阵按列一次算出，参数优化中每个组合、分析中的多条曲线都对同一个基准打分。
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from bar_store import get_bar_cache
+from frequency import get_annual_factor
+
+
+# 默认基准：中证全指
+DEFAULT_BENCHMARK = '000906.SH'
+
+RELATIVE_COLUMNS = ('alpha', 'beta', 'tracking_error', 'information_ratio', 'up_capture', 'down_capture',
+                    'excess_return', 'excess_max_drawdown')
+
+
+class Benchmark():
+    """
+    基准收盘价序列，提供与任意日期索引对齐的收益率和相对指标计算
+    """
+
+    def __init__(self, close, code=None):
+        """
+        参数：
+        - close: 基准收盘价 Series，索引为日期
+        - code: 基准代码，仅用于显示和指纹
+        """
+        close = pd.Series(close, dtype=float)
+        close.index = pd.DatetimeIndex(close.index)
+        self.close = close[~close.index.duplicated(keep='last')].sort_index()
+        self.code = code
+
+    def aligned_close(self, index):
+        """
+        对齐到给定日期索引的基准收盘价：缺少的日期沿用此前最近的收盘价，基准区间之外为 NaN
+        """
+        index = pd.DatetimeIndex(index)
+        close = self.close
+        aligned = close.reindex(close.index.union(index)).ffill().reindex(index)
+        if len(close):
+            aligned[(index < close.index[0]) | (index > close.index[-1])] = np.nan
+        return aligned
+
+    def relative_metrics(self, values_matrix, freq='D', index=None):
+        """
+        见 relative_metrics
+        """
+        return relative_metrics(values_matrix, self, freq, index)
+
+    def fingerprint(self):
+        """
+        基准内容的哈希，用于参数优化的结果存储
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(str(self.code).encode('utf-8'))
+        h.update(self.close.index.asi8.tobytes())
+        h.update(np.ascontiguousarray(self.close.to_numpy(dtype=float)).tobytes())
+        return h.hexdigest()
+
+
+def load_benchmark(code=DEFAULT_BENCHMARK, path=None, paths=None, freq='daily'):
+    """
+    读取基准行情，经过进程内行情缓存
+
+    参数：
+    - code: 基准代码
+    - path: 基准 CSV 所在目录；为 None 时取 paths[freq]
+    - paths: 数据路径字典
+    - freq: paths 中的频段键名
+
+    返回：
+    - Benchmark
+    """
+    if path is None:
+        path = paths[freq]
+    data = get_bar_cache().get(os.path.join(path, f"{code}.csv"))
+    return Benchmark(data['close'], code=code)
+
+
+def relative_metrics(values_matrix, benchmark, freq='D', index=None):
+    """
+    一次计算多条净值曲线相对基准的指标，与 empyrical 的同名指标定义一致（无风险利率为 0）：
+
+    - alpha: 年化 Jensen alpha，(1 + mean(r - beta * b)) ** 年化系数 - 1
+    - beta: cov(r, b) / var(b)
+    - tracking_error: 超额收益 r - b 的年化标准差
+    - information_ratio: 超额收益的年化均值 / 跟踪误差
+    - up_capture / down_capture: 基准上涨 / 下跌期间策略与基准年化收益率之比
+    - excess_return: 策略净值 / 基准净值 的累计收益
+    - excess_max_drawdown: 策略净值 / 基准净值 这条相对曲线的最大回撤
+
+    参数：
+    - values_matrix: (时间 x 曲线) 的净值矩阵，ndarray、Series 或 DataFrame；长度不同的曲线用 NaN 补齐
+    - benchmark: Benchmark 或基准收盘价 Series
+    - freq: 数据频率，见 frequency 模块；为 None 时由日期推断
+    - index: 日期索引，values_matrix 为 DataFrame 时默认取其索引
+
+    返回：
+    - DataFrame，每行一条曲线，列见 RELATIVE_COLUMNS
+    """
+    labels = None
+    if isinstance(values_matrix, pd.Series):
+        values_matrix = values_matrix.to_frame()
+    if isinstance(values_matrix, pd.DataFrame):
+        labels = values_matrix.columns
+        if index is None:
+            index = values_matrix.index
+        values_matrix = values_matrix.to_numpy(dtype=float)
+    if index is None:
+        raise ValueError("需要日期索引才能与基准对齐")
+    values = np.asarray(values_matrix, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    if labels is None:
+        labels = pd.RangeIndex(values.shape[1])
+    if not isinstance(benchmark, Benchmark):
+        benchmark = Benchmark(benchmark)
+    annual_factor = get_annual_factor(freq, index)
+
+    bench = benchmark.aligned_close(index).to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = values[1:] / values[:-1] - 1
+        bench_returns = (bench[1:] / bench[:-1] - 1)[:, None]
+        # 策略和基准都有收益率的周期才参与计算
+        valid = ~np.isnan(returns) & ~np.isnan(bench_returns)
+        n = valid.sum(axis=0)
+        r = np.where(valid, returns, 0.0)
+        b = np.where(valid, bench_returns, 0.0)
+
+        mean_r = r.sum(axis=0) / n
+        mean_b = b.sum(axis=0) / n
+        dev_r = np.where(valid, r - mean_r, 0.0)
+        dev_b = np.where(valid, b - mean_b, 0.0)
+        beta = (dev_r * dev_b).sum(axis=0) / (dev_b * dev_b).sum(axis=0)
+        alpha = (1 + mean_r - beta * mean_b) ** annual_factor - 1
+
+        active = r - b
+        mean_active = active.sum(axis=0) / n
+        dev_active = np.where(valid, active - mean_active, 0.0)
+        tracking_error = np.sqrt((dev_active ** 2).sum(axis=0) / (n - 1)) * np.sqrt(annual_factor)
+        information_ratio = mean_active * annual_factor / tracking_error
+
+        # 上行/下行捕获率：对应期间的年化收益率之比，用对数收益求和代替逐段连乘
+        log_r = np.log1p(r)
+        log_b = np.log1p(b)
+
+        def capture(mask):
+            count = mask.sum(axis=0)
+            strategy = np.exp((log_r * mask).sum(axis=0) * annual_factor / count) - 1
+            bench_annual = np.exp((log_b * mask).sum(axis=0) * annual_factor / count) - 1
+            return strategy / bench_annual
+
+        up_capture = capture(valid & (b > 0))
+        down_capture = capture(valid & (b < 0))
+
+        # 相对净值曲线：策略净值 / 基准净值，以 1 为起点
+        relative = np.exp(np.cumsum(log_r - log_b, axis=0))
+        relative = np.vstack([np.ones((1, values.shape[1])), relative])
+        excess_return = relative[-1] - 1
+        running_max = np.maximum.accumulate(relative, axis=0)
+        excess_max_drawdown = (relative / running_max - 1).min(axis=0)
+
+    return pd.DataFrame({
+        'alpha': alpha,
+        'beta': beta,
+        'tracking_error': tracking_error,
+        'information_ratio': information_ratio,
+        'up_capture': up_capture,
+        'down_capture': down_capture,
+        'excess_return': excess_return,
+        'excess_max_drawdown': excess_max_drawdown,
+    }, index=labels)
@@ -0,0 +1,117 @@
+"""
+列式调试记录器，替代策略 next() 中每根K线、每个资产追加一个字典的 debug_info 列表。
+
+每个字段预先分配一个 (K线数 x 资产数) 的 NumPy 数组，next() 中只按位置写入数值，
+get_debug_df() 调用时才由数组生成 DataFrame，行顺序与原来的 debug_info 相同（先按K线，再按资产）。
+
+记录级别：
+- 'off'：不记录，参数优化时使用；
+- 'summary'：只记录日期、持仓、信号、净值和交易次数等开销很小的字段；
+- 'full'：记录全部字段，与原来的 debug_info 相同。
+"""
+import numpy as np
+import pandas as pd
+
+
+LEVELS = ('off', 'summary', 'full')
+
+# 信号类策略 debug_info 的字段，顺序与原来的 DataFrame 列一致
+SIGNAL_FIELDS = ('Date', 'Asset', 'Position', 'Signal', 'Size', 'Open', 'High', 'Low',
+                 'Volume', 'Close', 'Cash', 'Value', 'Trades')
+
+# summary 级别保留的字段
+SUMMARY_FIELDS = ('Date', 'Asset', 'Position', 'Signal', 'Value', 'Trades')
+
+# 整数字段，其余数值字段按浮点数保存
+INT_FIELDS = ('Size', 'Trades')
+
+# feed 长度未知（未预加载数据）时的初始容量
+DEFAULT_CAPACITY = 1024
+
+
+class DebugRecorder():
+    """
+    按 (K线, 资产) 位置写入调试信息的列式记录器。
+
+    用法：在策略 __init__ 中创建，next() 开始时调用 next_bar()，
+    然后对第 i 个资产调用 record(i, 字段=数值, ...)；昂贵的字段（如仓位计算、现金）只在 full 为 True 时计算。
+    """
+
+    def __init__(self, strategy, fields=SIGNAL_FIELDS, level='full', summary_fields=SUMMARY_FIELDS):
+        """
+        参数：
+        - strategy: Backtrader 策略实例，用于读取资产名称和 feed 长度
+        - fields: 调试信息的字段，'Date' 和 'Asset' 之外的字段均为数值
+        - level: 记录级别，'off'、'summary' 或 'full'
+        - summary_fields: summary 级别保留的字段
+        """
+        if level not in LEVELS:
+            raise ValueError(f"未知的调试记录级别：{level}，可选 {LEVELS}")
+        self.level = level
+        self.active = level != 'off'
+        self.full = level == 'full'
+        self.assets = [data._name for data in strategy.datas]
+        if self.full:
+            self.fields = tuple(fields)
+        else:
+            self.fields = tuple(f for f in fields if f in summary_fields) if self.active else ()
+
+        self._row = -1
+        self._columns = {}
+        if self.active:
+            # 数据预加载后 buflen 即为 feed 长度；各资产日期不一致时K线数可能更多，不够时再扩容
+            capacity = max([data.buflen() for data in strategy.datas] + [0]) or DEFAULT_CAPACITY
+            for name in self.fields:
+                if name != 'Asset':
+                    self._columns[name] = self._allocate(name, capacity)
+
+    def _allocate(self, name, capacity):
+        shape = (capacity, len(self.assets))
+        if name == 'Date':
+            return np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]')
+        if name in INT_FIELDS:
+            return np.zeros(shape, dtype=np.int64)
+        return np.full(shape, np.nan)
+
+    def next_bar(self):
+        """
+        开始记录新的一根K线
+        """
+        if not self.active:
+            return
+        self._row += 1
+        for name, column in self._columns.items():
+            capacity = len(column)
+            if self._row >= capacity:
+                grown = self._allocate(name, capacity * 2)
+                grown[:capacity] = column
+                self._columns[name] = grown
+
+    def record(self, i, **values):
+        """
+        写入当前K线第 i 个资产的调试信息，当前级别不记录的字段直接忽略
+        """
+        if not self.active:
+            return
+        row = self._row
+        columns = self._columns
+        for name, value in values.items():
+            column = columns.get(name)
+            if column is not None:
+                column[row, i] = value
+
+    def get_debug_df(self):
+        """
+        由列数组生成调试信息 DataFrame，以 Date 为索引
+        """
+        n = self._row + 1
+        data = {}
+        for name in self.fields:
+            if name == 'Asset':
+                data[name] = np.tile(np.asarray(self.assets, dtype=object), n)
+            else:
+                data[name] = self._columns[name][:n].reshape(-1)
+        df = pd.DataFrame(data, columns=list(self.fields))
+        if 'Date' in df:
+            df.set_index('Date', inplace=True)
+        return df
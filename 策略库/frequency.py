@@ -0,0 +1,97 @@
+"""
+数据频率与年化系数的统一登记表，所有绩效分析路径（performance_analysis、multi_asset_combined_performance_analysis、
+batch_performance_metrics、蒙特卡洛分析以及各脚本中的分析函数）都从这里取年化系数，保证同一条净值曲线在不同入口得到相同的指标。
+
+年化系数按交易日历计算：每年 252 个交易日，每个交易日 4 个交易小时（240 分钟）。
+一根K线覆盖整个交易时段（4H 及以上的日内周期）时按每天一根计算。
+"""
+import numpy as np
+import pandas as pd
+
+
+TRADING_DAYS = 252          # 每年交易日数
+TRADING_MINUTES = 240       # 每个交易日的交易分钟数
+
+# 频率 -> 年化系数（每年的K线数）
+_ANNUAL_FACTORS = {
+    'D': TRADING_DAYS,
+    'W': 52,
+    'M': 12,
+}
+
+# 日内频率 -> 每根K线的分钟数
+_INTRADAY_MINUTES = {
+    '1m': 1,
+    '5m': 5,
+    '15m': 15,
+    '30m': 30,
+    'H': 60,
+    '1H': 60,
+    '2H': 120,
+    '4H': 240,
+    '8H': 480,
+}
+
+
+def register_frequency(freq, annual_factor):
+    """
+    登记新的频率或修改已有频率的年化系数
+
+    参数：
+    - freq: 频率名称
+    - annual_factor: 每年的K线数
+    """
+    _ANNUAL_FACTORS[freq] = annual_factor
+
+
+for _freq, _minutes in _INTRADAY_MINUTES.items():
+    register_frequency(_freq, TRADING_DAYS * max(TRADING_MINUTES // _minutes, 1))
+
+
+def infer_frequency(index):
+    """
+    根据日期索引相邻时间间隔的中位数推断数据频率。
+    日内数据的隔夜、周末间隔占少数，不影响中位数。
+
+    返回：
+    - 频率名称，例如 'D'、'H'、'15m'
+    """
+    index = pd.DatetimeIndex(index)
+    if len(index) < 2:
+        raise ValueError("数据太少，无法推断频率")
+    spacing = np.diff(index.asi8)
+    spacing = spacing[spacing > 0]
+    if len(spacing) == 0:
+        raise ValueError("日期索引没有间隔，无法推断频率")
+    minutes = np.median(spacing) / 60e9
+
+    days = minutes / (24 * 60)
+    if days >= 20:
+        return 'M'
+    if days >= 4:
+        return 'W'
+    if minutes >= 20 * 60:
+        return 'D'
+    # 日内数据取对数距离最近的周期
+    candidates = [freq for freq in _INTRADAY_MINUTES if freq != '1H']
+    return min(candidates, key=lambda freq: abs(np.log(_INTRADAY_MINUTES[freq] / minutes)))
+
+
+def get_annual_factor(freq='D', index=None):
+    """
+    返回年化系数
+
+    参数：
+    - freq: 频率名称；为 None 或 'auto' 时由 index 推断
+    - index: 日期索引，仅在需要推断频率时使用
+
+    返回：
+    - 每年的K线数
+    """
+    if freq is None or freq == 'auto':
+        if index is None:
+            raise ValueError("未指定频率时需要传入日期索引用于推断")
+        freq = infer_frequency(index)
+    if freq not in _ANNUAL_FACTORS:
+        raise ValueError(f"Unsupported frequency: {freq}，可用频率 {list(_ANNUAL_FACTORS)}")
+    return _ANNUAL_FACTORS[freq]
@@ -0,0 +1,290 @@
+"""
+多窗口指标引擎：一次传入一组窗口，返回 (时间 x 窗口) 的二维数组，第 j 列对应 windows[j]。
+滚动类指标基于累加和，一次遍历即可得到所有窗口；递推类指标（EMA、Wilder、KAMA）
+按时间递推一次，每一步同时更新所有窗口。递推类指标与 pandas 逐位一致，滚动类指标在浮点误差以内。
+每一列的结果只取决于该列的输入和窗口，与同时计算的其他窗口无关，
+因此无论一次计算哪些窗口（单独调用、整个网格或并行时的部分网格），同一窗口的结果完全相同。
+
+values 可以是一维序列，也可以是 (时间 x 列) 的二维数组；二维时 windows 与列一一对应，
+或者传入单个窗口应用到所有列，便于对上一步得到的指标矩阵再做平滑。
+"""
+from bisect import bisect_left, insort
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# rolling_std 中离差平方和不足 RECENTER_TOLERANCE × eps × 累加平方和的窗口重新中心化计算，保证约 8 位有效数字
+RECENTER_TOLERANCE = 1e8
+
+
+def _prepare(values, windows):
+    """
+    统一输入格式。
+
+    返回：
+    - x: (时间 x 列) 的二维数组
+    - windows: 每个输出列对应的窗口
+    - cols: 每个输出列对应 x 中的列号
+    """
+    x = np.asarray(values, dtype=float)
+    windows = np.atleast_1d(np.asarray(windows))
+    if x.ndim == 1:
+        x = x[:, None]
+        cols = np.zeros(len(windows), dtype=int)
+    else:
+        if len(windows) == 1:
+            windows = np.repeat(windows, x.shape[1])
+        if len(windows) != x.shape[1]:
+            raise ValueError("二维输入时 windows 的数量必须与列数一致")
+        cols = np.arange(x.shape[1])
+    return x, windows, cols
+
+
+def _rolling_sums(x, windows, cols, powers=(1,)):
+    """
+    用累加和计算每个窗口的滚动和，窗口内含 NaN 或数据不足时为 NaN。
+    先减去各列均值再累加，减少长序列累加带来的精度损失。
+
+    返回：
+    - 各次幂的滚动和列表，以及各列的中心化均值
+    """
+    isnan = np.isnan(x)
+    center = np.zeros(x.shape[1])
+    has_value = ~isnan.all(axis=0)
+    center[has_value] = np.nanmean(x[:, has_value], axis=0)
+    centered = np.where(isnan, 0.0, x - center)
+
+    T = len(x)
+    t = np.arange(T)[:, None]
+    end = t + 1
+    start = t + 1 - windows[None, :]
+    valid = start >= 0
+    start = np.clip(start, 0, None)
+
+    nan_cum = np.vstack([np.zeros((1, x.shape[1]), dtype=int), np.cumsum(isnan, axis=0)])
+    valid &= (nan_cum[end, cols] - nan_cum[start, cols]) == 0
+
+    sums = []
+    for p in powers:
+        cum = np.vstack([np.zeros((1, x.shape[1])), np.cumsum(centered ** p, axis=0)])
+        s = cum[end, cols] - cum[start, cols]
+        s[~valid] = np.nan
+        sums.append(s)
+    return sums, center[cols]
+
+
+def sma(values, windows):
+    """
+    简单移动平均，等价于 pd.Series(values).rolling(w).mean()
+    """
+    x, windows, cols = _prepare(values, windows)
+    (s1,), center = _rolling_sums(x, windows, cols)
+    return s1 / windows[None, :] + center[None, :]
+
+
+def _window_variance(x, w, rows, ddof):
+    """
+    对指定位置结尾的窗口，按窗口自身的均值中心化后计算方差（两遍算法）；窗口内数值全部相同时为 0，与 pandas 一致
+    """
+    view = sliding_window_view(x, w)[rows - w + 1]
+    deviation = view - view.mean(axis=1, keepdims=True)
+    var = (deviation * deviation).sum(axis=1) / (w - ddof)
+    return np.where(view.max(axis=1) == view.min(axis=1), 0.0, var)
+
+
+def rolling_std(values, windows, ddof=1):
+    """
+    滚动标准差，等价于 pd.Series(values).rolling(w).std(ddof=ddof)。
+    先用累加和一次算出所有窗口；累加和相减的舍入误差约为 eps × 截至当前的累加平方和，
+    窗口内离差平方和与之相比不够大（接近常数的窗口，如价格停滞的区间）时，该窗口按自身均值重新中心化计算。
+    """
+    x, windows, cols = _prepare(values, windows)
+    (s1, s2), center = _rolling_sums(x, windows, cols, powers=(1, 2))
+    n = windows[None, :].astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sum_squares = s2 - s1 * s1 / n
+        var = sum_squares / (n - ddof)
+    var = np.where(var < 0, 0.0, var)
+
+    centered = x[:, cols] - center[None, :]
+    scale = np.nancumsum(centered * centered, axis=0)
+    suspect = np.abs(sum_squares) <= RECENTER_TOLERANCE * np.finfo(float).eps * scale
+    suspect[:, windows - ddof <= 0] = False
+    for j in np.flatnonzero(suspect.any(axis=0)):
+        rows = np.flatnonzero(suspect[:, j])
+        var[rows, j] = _window_variance(x[:, cols[j]], int(windows[j]), rows, ddof)
+
+    var[:, windows - ddof <= 0] = np.nan
+    return np.sqrt(var)
+
+
+def _order_statistics(x, w, ranks):
+    """
+    有序滑动窗口：每根K线用二分查找插入新值、删除移出窗口的旧值，窗口始终保持有序，
+    第 k 小的值直接按位置读取，每根K线 O(log w) 次比较，不再对每个窗口重新排序。
+
+    参数：
+    - x: 一维数组
+    - w: 窗口长度
+    - ranks: 需要的名次（从 0 开始）
+
+    返回：
+    - (时间 x 名次) 的数组，窗口未满或含 NaN 时为 NaN，与 pandas rolling 的默认 min_periods 一致
+    """
+    values = x.tolist()
+    window = []
+    nan_count = 0
+    positions, rows = [], []
+    for t, value in enumerate(values):
+        if value != value:
+            nan_count += 1
+        else:
+            insort(window, value)
+        if t >= w:
+            old = values[t - w]
+            if old != old:
+                nan_count -= 1
+            else:
+                del window[bisect_left(window, old)]
+        if t >= w - 1 and nan_count == 0:
+            positions.append(t)
+            rows.append([window[r] for r in ranks])
+    out = np.full((len(values), len(ranks)), np.nan)
+    if rows:
+        out[positions] = rows
+    return out
+
+
+def _lerp(a, b, t):
+    # 与 numpy 分位数线性插值的写法一致，结果逐位相同
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def rolling_percentile(values, windows, q):
+    """
+    滚动百分位数，等价于 rolling(w).apply(lambda x: np.percentile(x, q), raw=True)。
+    每个窗口用有序滑动窗口维护窗口内的排序，复杂度 O(n log w)，内存与窗口长度无关；
+    q 传入一组百分位时共用同一个有序窗口，一次得到全部百分位。
+
+    参数：
+    - values: 一维序列或 (时间 x 列) 的二维数组
+    - windows: 窗口或一组窗口
+    - q: 百分位（0~100），可以是单个值或一组值
+
+    返回：
+    - q 为单个值时为 (时间 x 窗口) 的二维数组，为一组值时为 (时间 x 窗口 x 百分位) 的三维数组
+    """
+    x, windows, cols = _prepare(values, windows)
+    quantiles = np.atleast_1d(np.asarray(q, dtype=float)) / 100
+    out = np.full((len(x), len(windows), len(quantiles)), np.nan)
+    for j, (w, col) in enumerate(zip(windows, cols)):
+        w = int(w)
+        if w > len(x) or w < 1:
+            continue
+        # numpy 线性插值：位置 q * (w - 1) 两侧的两个名次
+        virtual = quantiles * (w - 1)
+        lower = np.floor(virtual).astype(int)
+        upper = np.minimum(lower + 1, w - 1)
+        ranks = np.unique(np.concatenate([lower, upper]))
+        stats = _order_statistics(x[:, col], w, ranks.tolist())
+        a = stats[:, np.searchsorted(ranks, lower)]
+        b = stats[:, np.searchsorted(ranks, upper)]
+        out[:, j, :] = _lerp(a, b, virtual - lower)
+    return out[:, :, 0] if np.ndim(q) == 0 else out
+
+
+def ewm_mean(values, com=None, span=None, alpha=None):
+    """
+    指数加权均值，参数含义与 ewm(com=..., span=..., alpha=..., adjust=False).mean() 相同，
+    但每个参数都可以是一组取值，一次递推同时计算全部取值。
+    """
+    # 与 pandas 相同，先统一换算成 com 再得到 alpha，保证结果逐位一致
+    if com is not None:
+        com = np.atleast_1d(np.asarray(com, dtype=float))
+    elif span is not None:
+        com = (np.atleast_1d(np.asarray(span, dtype=float)) - 1) / 2
+    elif alpha is not None:
+        alpha = np.atleast_1d(np.asarray(alpha, dtype=float))
+        com = (1 - alpha) / alpha
+    else:
+        raise ValueError("必须指定 com、span 或 alpha 之一")
+    x, com, cols = _prepare(values, com)
+    if len(com) == 1:
+        return pd.Series(x[:, cols[0]]).ewm(com=com[0], adjust=False).mean().to_numpy()[:, None]
+    alphas = 1 / (1 + com)
+
+    x = x[:, cols]
+    T, W = x.shape
+    out = np.empty((T, W))
+    if T == 0:
+        return out
+    weighted = x[0].copy()
+    old_wt = np.ones(W)
+    out[0] = weighted
+    decay = 1 - alphas
+    # 与 pandas 的递推保持相同的运算顺序：缺失值同样衰减旧权重
+    for t in range(1, T):
+        cur = x[t]
+        is_obs = cur == cur
+        has = weighted == weighted
+        old_wt = np.where(has, old_wt * decay, old_wt)
+        update = has & is_obs & (weighted != cur)
+        new = (old_wt * weighted + alphas * cur) / (old_wt + alphas)
+        weighted = np.where(update, new, weighted)
+        old_wt = np.where(has & is_obs, 1.0, old_wt)
+        weighted = np.where(~has & is_obs, cur, weighted)
+        out[t] = weighted
+    return out
+
+
+def ema(values, spans):
+    """
+    以 span 表示的指数移动平均，alpha = 2 / (span + 1)
+    """
+    return ewm_mean(values, span=spans)
+
+
+def wilder(values, windows):
+    """
+    Wilder 平滑（ADX、ATR、RSI 使用），alpha = 1 / window
+    """
+    windows = np.atleast_1d(np.asarray(windows, dtype=float))
+    return ewm_mean(values, alpha=1 / windows)
+
+
+def kama(values, windows, fast=2, slow=30):
+    """
+    考夫曼自适应均线，与 talib.KAMA(values, timeperiod=w) 一致：
+    第 w 个数据起输出，以第 w-1 个数据为初值。
+    """
+    x = np.asarray(values, dtype=float)
+    windows = np.atleast_1d(np.asarray(windows)).astype(int)
+    T, W = len(x), len(windows)
+    out = np.full((T, W), np.nan)
+    if T == 0:
+        return out
+
+    fastest = 2 / (fast + 1)
+    slowest = 2 / (slow + 1)
+
+    # 效率系数 ER = 区间净变动 / 区间内逐日变动绝对值之和
+    t = np.arange(T)[:, None]
+    start = np.clip(t - windows[None, :], 0, None)
+    abs_diff = np.concatenate([[0.0], np.abs(np.diff(x))])
+    cum = np.cumsum(abs_diff)
+    volatility = cum[t] - cum[start]
+    change = x[t] - x[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        er = np.abs(change / volatility)
+    er = np.where((volatility <= change) | (np.abs(volatility) < 1e-8), 1.0, er)
+    sc = (er * (fastest - slowest) + slowest) ** 2
+
+    prev = np.full(W, np.nan)
+    for i in range(T):
+        prev = np.where(windows - 1 == i, x[i], prev)
+        active = windows <= i
+        prev = np.where(active, (x[i] - prev) * sc[i] + prev, prev)
+        out[i] = np.where(active, prev, np.nan)
+    return out
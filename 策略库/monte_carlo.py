@@ -0,0 +1,412 @@
+"""
+向量化蒙特卡洛引擎。
+
+一次抽取所有模拟的起点，用 sliding_window_view 取出 (窗口数 x 天数) 的净值窗口矩阵，
+六项指标（年化收益率、夏普比率、最大回撤、年化波动率、索提诺比率、卡玛比率）按行一次算出，不再逐次循环。
+连续窗口的起点最多只有 len(values) - num_days 种，每种起点只计算一次，再按抽到的起点取值，
+因此模拟次数再多也只是一次索引。窗口矩阵按块计算，每块大小有上限，内存占用与模拟次数无关。
+
+除连续窗口外还支持以下重抽样方式（simulate 的 method 参数），都按块批量生成 (模拟次数 x 周期数) 的收益率矩阵：
+- 'iid'：逐期有放回地抽取收益率；
+- 'block'：固定长度的分块自助法，保留块内的自相关；
+- 'stationary'：Politis-Romano 平稳自助法，块长服从均值为 block_size 的几何分布，循环取数；
+- 'trades'：把回测的逐笔交易收益随机重排，考察交易顺序对回撤等路径指标的影响。
+随机数统一来自 numpy.random.Generator，种子相同则结果相同。
+
+模拟次数很大（百万次以上）时用 simulate_streaming：模拟按任务分块，可分发到多个进程，
+每个任务只返回各指标的流式统计量（均值、方差、t-digest 分位数、超过阈值的次数），最后合并，
+内存只与任务数有关，与模拟次数无关。各任务的随机数由 SeedSequence.spawn 派生，结果与进程数无关。
+
+两种方式的结果都可以包装成 MonteCarloResult：均值、标准差、置信区间、概率和直方图的统一接口，不依赖任何绘图库，
+绘图（或写出静态 HTML）由 Analyzing_Tools.render_monte_carlo 单独完成。
+"""
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from streaming_stats import StreamingMetric
+
+
+METHODS = ('window', 'iid', 'block', 'stationary', 'trades')
+
+METRICS = ('annual_return', 'sharpe_ratio', 'max_drawdown', 'annual_volatility', 'sortino_ratio', 'calmar_ratio')
+
+# 每块模拟矩阵的元素个数上限（约 32MB 的 float64）
+MAX_CHUNK_ELEMENTS = 1 << 22
+
+# 流式统计中需要计算“大于阈值”概率的指标和阈值
+EXCEEDANCE_THRESHOLDS = {
+    'annual_return': (0.0,),
+    'sharpe_ratio': (1.0,),
+    'sortino_ratio': (1.0,),
+    'max_drawdown': (-0.1,),
+}
+
+# 流式模拟中每个任务的模拟次数
+DEFAULT_TASK_SIZE = 200000
+
+# 置信区间的上下分位数（百分比）
+CONFIDENCE_PERCENTILES = (0.5, 80)
+
+
+def path_metrics(returns, values, annual_factor):
+    """
+    按行计算每条模拟路径的绩效指标
+
+    参数：
+    - returns: (模拟次数 x 周期数) 的收益率矩阵
+    - values: (模拟次数 x 周期数+1) 的净值矩阵，与 returns 对应
+    - annual_factor: 年化系数
+
+    返回：
+    - {指标名: 长度为模拟次数的数组}
+    """
+    periods = returns.shape[1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total_return = values[:, -1] / values[:, 0] - 1
+        annual_return = (1 + total_return) ** (annual_factor / periods) - 1
+
+        # 方差用一阶、二阶矩计算，只遍历矩阵两次
+        s1 = returns.sum(axis=1)
+        s2 = np.einsum('ij,ij->i', returns, returns)
+        variance = np.maximum(s2 - s1 * s1 / periods, 0.0) / (periods - 1)
+        annual_volatility = np.sqrt(variance) * np.sqrt(annual_factor)
+        sharpe_ratio = np.where(annual_volatility != 0, annual_return / annual_volatility, np.nan)
+
+        # 最大回撤：相对路径上此前最高净值的最大跌幅
+        drawdown = np.maximum.accumulate(values, axis=1)
+        np.divide(values, drawdown, out=drawdown)
+        max_drawdown = drawdown.min(axis=1) - 1
+
+        # 下行标准差，只考虑负收益
+        negative = np.minimum(returns, 0.0)
+        n_negative = np.count_nonzero(negative, axis=1)
+        n1 = negative.sum(axis=1)
+        n2 = np.einsum('ij,ij->i', negative, negative)
+        negative_var = np.maximum(n2 - n1 * n1 / n_negative, 0.0) / (n_negative - 1)
+        downside_deviation = np.where(n_negative > 0, np.sqrt(negative_var) * np.sqrt(annual_factor), np.nan)
+        sortino_ratio = np.where(downside_deviation != 0, annual_return / downside_deviation, np.nan)
+
+        calmar_ratio = np.where(max_drawdown != 0, annual_return / np.abs(max_drawdown), np.nan)
+
+    return {
+        'annual_return': annual_return,
+        'sharpe_ratio': sharpe_ratio,
+        'max_drawdown': max_drawdown,
+        'annual_volatility': annual_volatility,
+        'sortino_ratio': sortino_ratio,
+        'calmar_ratio': calmar_ratio,
+    }
+
+
+def _chunk_sizes(num_simulations, num_days, chunk_size=None):
+    """
+    把模拟次数切成若干块，每块矩阵不超过 MAX_CHUNK_ELEMENTS 个元素
+    """
+    if chunk_size is None:
+        chunk_size = max(MAX_CHUNK_ELEMENTS // max(num_days, 1), 1)
+    full, rest = divmod(num_simulations, chunk_size)
+    return [chunk_size] * full + ([rest] if rest else [])
+
+
+def simulate_windows(values, num_simulations=10000, num_days=252, annual_factor=252, seed=None, chunk_size=None):
+    """
+    从净值曲线中随机截取长度为 num_days 的连续窗口，计算每个窗口的绩效指标
+
+    参数：
+    - values: 净值序列（一维数组）
+    - num_simulations: 模拟次数
+    - num_days: 每次模拟的窗口长度（K线数）
+    - annual_factor: 年化系数
+    - seed: 随机种子或 numpy.random.Generator，相同的种子得到相同的结果
+    - chunk_size: 每块计算的窗口数，默认按内存上限自动确定
+
+    返回：
+    - {指标名: 长度为 num_simulations 的数组}
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) <= num_days:
+        raise ValueError(f"净值序列长度 {len(values)} 不足以截取 {num_days} 根K线的窗口")
+    rng = np.random.default_rng(seed)
+
+    # 与原来的 np.random.randint(0, len(values) - num_days) 取值范围相同
+    starts = rng.integers(0, len(values) - num_days, size=num_simulations)
+    unique_starts, inverse = np.unique(starts, return_inverse=True)
+
+    # 逐根K线的收益率只算一次，各窗口共享
+    step_returns = np.diff(values) / values[:-1]
+    value_windows = sliding_window_view(values, num_days)
+    return_windows = sliding_window_view(step_returns, num_days - 1)
+
+    # 每个不同的起点只计算一次
+    window_metrics = {name: np.empty(len(unique_starts)) for name in METRICS}
+    offset = 0
+    for size in _chunk_sizes(len(unique_starts), num_days, chunk_size):
+        chunk = unique_starts[offset:offset + size]
+        metrics = path_metrics(return_windows[chunk], value_windows[chunk], annual_factor)
+        for name in METRICS:
+            window_metrics[name][offset:offset + size] = metrics[name]
+        offset += size
+    return {name: window_metrics[name][inverse] for name in METRICS}
+
+
+def default_block_size(n):
+    """
+    分块自助法的默认块长，取样本长度的立方根
+    """
+    return max(int(round(n ** (1 / 3))), 1)
+
+
+def resample_returns(returns, rng, size, length, method='iid', block_size=None):
+    """
+    从收益率序列重抽样出一批模拟路径
+
+    参数：
+    - returns: 一维收益率数组（method='trades' 时为逐笔交易收益）
+    - rng: numpy.random.Generator
+    - size: 本批模拟次数
+    - length: 每条路径的周期数，method='trades' 时忽略（路径长度为交易笔数）
+    - method: 'iid'、'block'、'stationary' 或 'trades'
+    - block_size: 块长（'block' 为固定块长，'stationary' 为平均块长），默认取样本长度的立方根
+
+    返回：
+    - (size x length) 的收益率矩阵
+    """
+    returns = np.asarray(returns, dtype=float)
+    n = len(returns)
+    if n == 0:
+        raise ValueError("收益率序列为空，无法重抽样")
+    if block_size is None:
+        block_size = default_block_size(n)
+
+    if method == 'iid':
+        index = rng.integers(0, n, size=(size, length))
+    elif method == 'block':
+        block_size = min(int(block_size), n)
+        n_blocks = -(-length // block_size)
+        starts = rng.integers(0, n - block_size + 1, size=(size, n_blocks))
+        index = (starts[:, :, None] + np.arange(block_size)).reshape(size, -1)[:, :length]
+    elif method == 'stationary':
+        # 每期以 1/block_size 的概率开始新块，否则接着上一期的下一个位置（超出末尾时从头循环）。
+        # 两组随机数在一次抽样中按模拟逐行取出（每行前半段决定是否开新块，后半段决定新块起点），
+        # 第 k 条路径只取决于种子和它之前的路径数，与分块大小无关
+        draws = rng.random((size, 2, length))
+        new_block = draws[:, 0] < 1 / block_size
+        new_block[:, 0] = True
+        block_start = np.minimum((draws[:, 1] * n).astype(int), n - 1)
+        t = np.arange(length)
+        last_start = np.maximum.accumulate(np.where(new_block, t, 0), axis=1)
+        index = (np.take_along_axis(block_start, last_start, axis=1) + (t - last_start)) % n
+    elif method == 'trades':
+        return rng.permuted(np.tile(returns, (size, 1)), axis=1)
+    else:
+        raise ValueError(f"未知的重抽样方式：{method}，可选 {METHODS}")
+    return returns[index]
+
+
+def simulate(returns, num_simulations=10000, num_days=252, annual_factor=252, method='window', block_size=None, seed=None, chunk_size=None):
+    """
+    蒙特卡洛模拟的统一入口
+
+    参数：
+    - returns: 一维收益率数组；method='trades' 时为逐笔交易收益
+    - num_simulations: 模拟次数
+    - num_days: 每条路径的净值点数（周期数为 num_days - 1），与连续窗口的长度含义相同；method='trades' 时忽略
+    - annual_factor: 年化系数；method='trades' 时应为每年的交易笔数
+    - method: 重抽样方式，见 METHODS
+    - block_size: 分块自助法的块长
+    - seed: 随机种子或 numpy.random.Generator
+    - chunk_size: 每块的模拟次数，默认按内存上限自动确定
+
+    返回：
+    - {指标名: 长度为 num_simulations 的数组}
+    """
+    returns = np.asarray(returns, dtype=float)
+    if method == 'window':
+        values = np.cumprod(1 + returns)
+        return simulate_windows(values, num_simulations, num_days, annual_factor, seed=seed, chunk_size=chunk_size)
+
+    rng = np.random.default_rng(seed)
+    length = len(returns) if method == 'trades' else num_days - 1
+    if length < 2:
+        raise ValueError("每条模拟路径至少需要两个周期")
+
+    results = {name: [] for name in METRICS}
+    for size in _chunk_sizes(num_simulations, length + 1, chunk_size):
+        sampled = resample_returns(returns, rng, size, length, method, block_size)
+        values = np.empty((size, length + 1))
+        values[:, 0] = 1.0
+        np.cumprod(1 + sampled, axis=1, out=values[:, 1:])
+        metrics = path_metrics(sampled, values, annual_factor)
+        for name in METRICS:
+            results[name].append(metrics[name])
+    return {name: np.concatenate(parts) if parts else np.empty(0) for name, parts in results.items()}
+
+
+class MonteCarloStats():
+    """
+    流式模拟的汇总结果：每个指标一个 StreamingMetric，可逐块 update、跨进程 merge
+    """
+
+    def __init__(self, thresholds=EXCEEDANCE_THRESHOLDS):
+        self.metrics = {name: StreamingMetric(thresholds.get(name, ())) for name in METRICS}
+
+    def update(self, metrics):
+        """
+        加入一批模拟结果，metrics 为 {指标名: 数组}
+        """
+        for name in METRICS:
+            self.metrics[name].update(metrics[name])
+
+    def merge(self, other):
+        for name in METRICS:
+            self.metrics[name].merge(other.metrics[name])
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    @property
+    def count(self):
+        return self.metrics[METRICS[0]].total
+
+
+def _simulate_task(returns, size, num_days, annual_factor, method, block_size, seed_sequence):
+    """
+    单个任务：完成 size 次模拟，只返回流式统计量
+    """
+    stats = MonteCarloStats()
+    rng = np.random.default_rng(seed_sequence)
+    stats.update(simulate(returns, size, num_days, annual_factor, method=method, block_size=block_size, seed=rng))
+    return stats
+
+
+def simulate_streaming(returns, num_simulations=1000000, num_days=252, annual_factor=252, method='window', block_size=None, seed=None, n_jobs=1, task_size=DEFAULT_TASK_SIZE):
+    """
+    分块、可并行的蒙特卡洛模拟，返回合并后的流式统计量
+
+    参数：
+    - returns, num_days, annual_factor, method, block_size: 与 simulate 相同
+    - num_simulations: 模拟次数
+    - seed: 整数随机种子，各任务的随机数由它派生；种子和 task_size 相同则结果相同，与 n_jobs 无关
+    - n_jobs: 并行进程数，1 为串行，-1 为使用全部 CPU
+    - task_size: 每个任务的模拟次数
+
+    返回：
+    - MonteCarloStats
+    """
+    returns = np.asarray(returns, dtype=float)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    full, rest = divmod(num_simulations, task_size)
+    sizes = [task_size] * full + ([rest] if rest else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    stats = MonteCarloStats()
+    if n_jobs == 1 or len(sizes) == 1:
+        for size, seed_sequence in zip(sizes, seeds):
+            stats.merge(_simulate_task(returns, size, num_days, annual_factor, method, block_size, seed_sequence))
+        return stats
+
+    n = len(sizes)
+    with ProcessPoolExecutor(max_workers=min(n_jobs, n)) as executor:
+        # map 按任务顺序返回，合并顺序固定，结果可复现
+        for task_stats in executor.map(_simulate_task, [returns] * n, sizes, [num_days] * n, [annual_factor] * n,
+                                       [method] * n, [block_size] * n, seeds):
+            stats.merge(task_stats)
+    return stats
+
+
+class MonteCarloResult():
+    """
+    蒙特卡洛模拟的结构化结果，不做任何绘图。
+
+    - metrics: {指标名: 每次模拟的数组}，流式模拟时为 None
+    - stats: 流式统计量 MonteCarloStats，非流式模拟时为 None
+    - confidence_intervals: {指标名: (下限, 上限)}，分位数见 CONFIDENCE_PERCENTILES
+    - probabilities: {指标名: 大于阈值的概率}，阈值见 EXCEEDANCE_THRESHOLDS
+    """
+
+    def __init__(self, metrics=None, stats=None, method='window', percentiles=CONFIDENCE_PERCENTILES):
+        if (metrics is None) == (stats is None):
+            raise ValueError("metrics 和 stats 必须且只能提供一个")
+        self.metrics = metrics
+        self.stats = stats
+        self.method = method
+        self.percentiles = percentiles
+
+    @property
+    def num_simulations(self):
+        if self.stats is not None:
+            return self.stats.count
+        return len(self.metrics[METRICS[0]])
+
+    def mean(self, name):
+        if self.stats is not None:
+            return self.stats[name].mean
+        return np.mean(self.metrics[name])
+
+    def std(self, name, ddof=0):
+        if self.stats is not None:
+            return self.stats[name].std(ddof)
+        return np.std(self.metrics[name], ddof=ddof)
+
+    def bounds(self, name):
+        """
+        指标的最小值和最大值
+        """
+        if self.stats is not None:
+            return self.stats[name].digest.min, self.stats[name].digest.max
+        return min(self.metrics[name]), max(self.metrics[name])
+
+    def confidence_interval(self, name):
+        lower, upper = self.percentiles
+        if self.stats is not None:
+            return tuple(self.stats[name].quantile([lower / 100, upper / 100]))
+        return np.percentile(self.metrics[name], lower), np.percentile(self.metrics[name], upper)
+
+    def probability(self, name, threshold=None):
+        """
+        指标大于阈值的概率，threshold 为 None 时取 EXCEEDANCE_THRESHOLDS 中的第一个阈值
+        """
+        if threshold is None:
+            threshold = EXCEEDANCE_THRESHOLDS[name][0]
+        if self.stats is not None:
+            return self.stats[name].probability(threshold)
+        return np.mean(np.asarray(self.metrics[name]) > threshold)
+
+    def histogram(self, name, bins=50):
+        """
+        指标分布的直方图（密度），返回 (hist, edges)
+        """
+        if self.stats is not None:
+            return self.stats[name].histogram(bins)
+        data = self.metrics[name]
+        # 按交易重排时总收益、波动率与顺序无关，各次模拟只差浮点误差，只用一个区间
+        if not np.ptp(data) > 1e-9 * max(np.max(np.abs(data)), 1):
+            bins = 1
+        return np.histogram(data, bins=bins, density=True)
+
+    @property
+    def confidence_intervals(self):
+        return {name: self.confidence_interval(name) for name in METRICS}
+
+    @property
+    def probabilities(self):
+        return {name: self.probability(name) for name in EXCEEDANCE_THRESHOLDS}
+
+    def summary(self):
+        """
+        各指标的均值、标准差、置信区间和概率汇总表
+        """
+        rows = {}
+        for name in METRICS:
+            lower, upper = self.confidence_interval(name)
+            rows[name] = {
+                'mean': self.mean(name),
+                'std': self.std(name, ddof=1),
+                'ci_lower': lower,
+                'ci_upper': upper,
+                'probability': self.probability(name) if name in EXCEEDANCE_THRESHOLDS else np.nan,
+            }
+        return pd.DataFrame.from_dict(rows, orient='index')
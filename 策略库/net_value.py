@@ -0,0 +1,136 @@
+"""
+基于预分配数组的净值记录。
+
+策略在 next() 中照常调用 self.value.append(总资产) 和 self.dates.append(日期)，
+数据写入预先按 feed 长度分配的 float64 / int64（纳秒时间戳）数组，不再为每根K线保存 Python 浮点数和 datetime 对象；
+净值序列直接由数组视图生成，不复制数据。
+"""
+import datetime
+import numpy as np
+import pandas as pd
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# feed 长度未知（未预加载数据）时的初始容量
+DEFAULT_CAPACITY = 1024
+
+
+class ArrayBuffer():
+    """
+    支持 append 的定长数组，容量不够时加倍扩容，用法与列表相同
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, dtype=np.float64):
+        self._data = np.empty(max(int(capacity), 1), dtype=dtype)
+        self._n = 0
+
+    def _convert(self, value):
+        return value
+
+    def append(self, value):
+        if self._n == len(self._data):
+            grown = np.empty(len(self._data) * 2, dtype=self._data.dtype)
+            grown[:self._n] = self._data
+            self._data = grown
+        self._data[self._n] = self._convert(value)
+        self._n += 1
+
+    def to_numpy(self):
+        """
+        已写入部分的数组视图（不复制）
+        """
+        return self._data[:self._n]
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, index):
+        return self.to_numpy()[index]
+
+    def __iter__(self):
+        return iter(self.to_numpy())
+
+    def tolist(self):
+        return self.to_numpy().tolist()
+
+
+class DateBuffer(ArrayBuffer):
+    """
+    以 int64 纳秒时间戳保存日期的 ArrayBuffer，append 接受 datetime
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        super().__init__(capacity, dtype=np.int64)
+
+    def _convert(self, value):
+        delta = value - _EPOCH
+        return ((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds) * 1000
+
+    def to_index(self):
+        """
+        返回 DatetimeIndex，共享底层数组
+        """
+        return pd.DatetimeIndex(self.to_numpy().view('datetime64[ns]'))
+
+    def __getitem__(self, index):
+        return self.to_index()[index]
+
+    def __iter__(self):
+        return iter(self.to_index())
+
+    def tolist(self):
+        return self.to_index().tolist()
+
+
+class NetValueMixin():
+    """
+    策略类的净值记录混入类：
+
+        class ADX_Strategy(NetValueMixin, bt.Strategy):
+            def __init__(self):
+                self.init_net_value()
+
+    之后 next() 中的 self.value.append(...) / self.dates.append(...) 不需要改动，
+    get_net_value_series() 由本类提供。同时记录每笔已平仓交易，供蒙特卡洛分析按交易重排。
+    """
+
+    def init_net_value(self):
+        """
+        按 feed 长度预分配净值和日期数组。数据预加载后 buflen 即为 feed 长度，
+        各资产日期不一致时K线数可能更多，不够时自动扩容
+        """
+        capacity = max([data.buflen() for data in self.datas] + [0]) or DEFAULT_CAPACITY
+        self.value = ArrayBuffer(capacity)     # 存储组合总净值
+        self.dates = DateBuffer(capacity)      # 存储日期序列
+        self.closed_trades = []                # 已平仓交易：(开仓时间, 平仓时间, 扣除佣金后的盈亏, 平仓后组合总资产)
+
+    def notify_trade(self, trade):
+        """
+        记录已平仓的交易
+        """
+        if trade.isclosed:
+            self.closed_trades.append((trade.open_datetime(), trade.close_datetime(), trade.pnlcomm, self.broker.getvalue()))
+
+    def get_trade_returns(self):
+        """
+        返回逐笔交易收益率，以平仓时间为索引：扣除佣金后的盈亏 / 平仓前的组合总资产
+        """
+        if not self.closed_trades:
+            return pd.Series(dtype=float)
+        _, closed, pnl, value = (np.asarray(column) for column in zip(*self.closed_trades))
+        pnl = pnl.astype(float)
+        returns = pnl / (value.astype(float) - pnl)
+        return pd.Series(returns, index=pd.DatetimeIndex(closed)).sort_index(kind='stable')
+
+    def net_value_series(self):
+        """
+        返回净值 Series，数据与日期都是底层数组的视图
+        """
+        return pd.Series(self.value.to_numpy(), index=self.dates.to_index(), copy=False)
+
+    def get_net_value_series(self):
+        """
+        返回净值序列，用于后续分析
+        """
+        return pd.DataFrame(self.value.to_numpy()[:, None], index=self.dates.to_index(), copy=False)
@@ -0,0 +1,360 @@
+import os
+import traceback
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from itertools import product
+from analyzing_tools import batch_performance_metrics
+from backtest_cache import get_backtest_cache
+from benchmark import Benchmark, load_benchmark, relative_metrics
+from bar_store import build_dataset_stores, build_store, set_cache_mmap
+from result_store import OptimizationStore, param_hash, run_fingerprint
+from signal_pipeline import SignalPipeline
+
+
+# 每积累多少条净值曲线放进同一个矩阵计算一次绩效指标，每批算完后结果才写入存储
+SCORE_BATCH_SIZE = 64
+
+# 子进程中的回测上下文，由 _init_worker 在进程启动时设置一次，之后每个任务只传参数组合
+_worker_context = None
+_worker_use_cache = True
+
+
+def _backtest_kwargs(strategy_class):
+    """
+    参数优化时传给回测函数的策略参数：策略支持 debug 参数时关闭调试记录
+    """
+    params = getattr(strategy_class, 'params', None)
+    if params is not None and hasattr(params, '_getkeys') and 'debug' in params._getkeys():
+        return {'debug': 'off'}
+    return {}
+
+
+def _backtest(context, params, use_cache=False):
+    """
+    回测单个参数组合。use_cache 为 True 时经过回测结果缓存，信号与之前某个组合完全相同时直接取已有的净值序列
+
+    返回：
+    - 净值序列
+    """
+    strategy_function, strategy_class, run_backtest_func, target_assets, paths, cash, commission, slippage_perc, benchmark = context
+    # 生成当前参数下的信号
+    strategy_results, full_info = strategy_function(target_assets, paths, **params)
+
+    # 运行回测，不记录调试信息
+    kwargs = _backtest_kwargs(strategy_class)
+    if use_cache:
+        strat = get_backtest_cache().run(run_backtest_func, strategy_class, target_assets, strategy_results, cash, commission, slippage_perc, **kwargs)
+    else:
+        strat = run_backtest_func(strategy_class, target_assets, strategy_results, cash, commission, slippage_perc, **kwargs)
+    return strat.get_net_value_series()
+
+
+def _metrics(values, index, benchmark):
+    """
+    绩效指标与 performance_analysis 一致，频率由日期推断；指定基准时加上相对基准的指标，所有组合共用同一个已加载的基准
+    """
+    metrics = batch_performance_metrics(values, freq=None, index=index)
+    if benchmark is not None:
+        metrics = metrics.join(relative_metrics(values, benchmark, freq=None, index=index))
+    return metrics
+
+
+def _curve_metrics(curves, benchmark):
+    """
+    把一组净值曲线按日期并集对齐成 (时间 x 曲线) 矩阵，一次计算全部绩效指标。
+    只有日期恰好是并集中连续一段的曲线放进矩阵（前后用 NaN 补齐，结果与单独计算相同），
+    其余曲线（日期有重复或中间有其他曲线的日期）单独计算。
+
+    参数：
+    - curves: 净值序列列表
+    - benchmark: Benchmark 或 None
+
+    返回：
+    - 与 curves 一一对应的单行指标 DataFrame 列表
+    """
+    union = curves[0].index
+    for pv in curves[1:]:
+        union = union.union(pv.index)
+    shared, single = [], []
+    for i, pv in enumerate(curves):
+        if union.is_unique and union.is_monotonic_increasing:
+            positions = union.get_indexer(pv.index)
+            if len(positions) and (positions >= 0).all() and (np.diff(positions) == 1).all():
+                shared.append((i, positions))
+                continue
+        single.append(i)
+
+    rows = [None] * len(curves)
+    if shared:
+        matrix = np.full((len(union), len(shared)), np.nan)
+        for j, (i, positions) in enumerate(shared):
+            matrix[positions, j] = curves[i].iloc[:, 0].to_numpy(dtype=float)
+        metrics = _metrics(matrix, union, benchmark)
+        for j, (i, _) in enumerate(shared):
+            rows[i] = metrics.iloc[[j]]
+    for i in single:
+        rows[i] = _metrics(curves[i], None, benchmark)
+    return rows
+
+
+def _score(context, batch):
+    """
+    计算一批已回测组合的绩效指标，异常不向外抛出，记录在 error 列中。
+    整批计算出错时逐条重新计算，只有出错的组合记录 error，其余组合的指标不受影响
+
+    参数：
+    - batch: [(组合序号, 参数字典, 净值序列)]
+
+    返回：
+    - [(组合序号, 单行结果 DataFrame)]，包含参数、绩效指标和 error 列
+    """
+    benchmark = context[-1]
+    try:
+        rows = _curve_metrics([pv for _, _, pv in batch], benchmark)
+        records = [metrics.to_dict('records')[0] for metrics in rows]
+        errors = [None] * len(batch)
+    except Exception:
+        records, errors = [], []
+        for _, _, pv in batch:
+            try:
+                records.append(_curve_metrics([pv], benchmark)[0].to_dict('records')[0])
+                errors.append(None)
+            except Exception as e:
+                records.append({})
+                errors.append(f"{type(e).__name__}: {e}")
+    outputs = []
+    for (index, params, _), record, error in zip(batch, records, errors):
+        # 收集指标和参数
+        result_entry = dict(params, **record)
+        result_entry['error'] = error
+        outputs.append((index, pd.DataFrame(result_entry, index=[0])))
+    return outputs
+
+
+def _run_chunk(context, chunk, verbose=False, on_result=None, use_cache=False):
+    """
+    依次回测一组参数组合。信号函数是 SignalPipeline 时，这组参数共享中间结果缓存，
+    并对其中可批量计算的参数先做一次批量计算。回测得到的净值曲线每 SCORE_BATCH_SIZE 条一起计算绩效指标。
+
+    参数：
+    - context: 回测上下文
+    - chunk: [(组合序号, 参数字典)]
+    - verbose: 是否逐个打印参数组合
+    - on_result: 每完成一个组合调用一次 on_result(组合序号, 结果)
+    - use_cache: 是否使用回测结果缓存
+
+    返回：
+    - [(组合序号, 单行结果 DataFrame)]
+    """
+    strategy_function, target_assets, paths = context[0], context[3], context[4]
+    is_pipeline = isinstance(strategy_function, SignalPipeline)
+    outputs = []
+    with strategy_function.cached() if is_pipeline else nullcontext():
+        if is_pipeline and chunk:
+            # 由本组参数涉及的取值构成子网格
+            sub_grid = {name: list(dict.fromkeys(params[name] for _, params in chunk)) for name in chunk[0][1]}
+            if set(strategy_function.vectorizable_params) & set(sub_grid):
+                if verbose:
+                    print(f"批量计算指标：{[p for p in sub_grid if p in strategy_function.vectorizable_params]}")
+                try:
+                    strategy_function.prefill(target_assets, paths, sub_grid)
+                except Exception as e:
+                    # 批量计算失败时退回逐组计算；逐组计算也失败的组合会在 error 列中体现
+                    print(f"批量计算失败，退回逐组计算：{type(e).__name__}: {e}")
+        batch = []   # 已回测、尚未计算指标的组合：(组合序号, 参数字典, 净值序列)
+        for position, (index, params) in enumerate(chunk):
+            if verbose:
+                print(f"正在测试参数组合：{params}")
+            try:
+                batch.append((index, params, _backtest(context, params, use_cache)))
+                scored = []
+            except Exception as e:
+                scored = [(index, pd.DataFrame(dict(params, error=f"{type(e).__name__}: {e}"), index=[0]))]
+            if batch and (len(batch) >= SCORE_BATCH_SIZE or position == len(chunk) - 1):
+                scored += _score(context, batch)
+                batch = []
+            for index, result_entry in scored:
+                if on_result is not None:
+                    on_result(index, result_entry)
+                outputs.append((index, result_entry))
+        if is_pipeline and verbose:
+            strategy_function.report()
+    return outputs
+
+
+def _init_worker(context, use_cache=True):
+    global _worker_context, _worker_use_cache
+    _worker_context = context
+    _worker_use_cache = use_cache
+    # 子进程以内存映射方式读取列式存储，行情数据通过页缓存在进程间共享，不随任务传递
+    set_cache_mmap(True)
+
+
+def _run_worker_chunk(chunk):
+    """
+    返回：
+    - ([(组合序号, 单行结果 DataFrame)], (本组缓存命中次数, 未命中次数))
+    """
+    cache = get_backtest_cache()
+    before = cache.stats()
+    try:
+        outputs = _run_chunk(_worker_context, chunk, use_cache=_worker_use_cache)
+    except Exception:
+        # 兜底：整组失败时逐个记录错误，保证每个参数组合都有结果
+        message = traceback.format_exc().strip().splitlines()[-1]
+        outputs = [(index, pd.DataFrame(dict(params, error=message), index=[0])) for index, params in chunk]
+    after = cache.stats()
+    return outputs, (after['hits'] - before['hits'], after['misses'] - before['misses'])
+
+
+def parameter_optimization(parameter_grid, strategy_function, strategy_class, target_assets, paths, cash=100000.0, commission=0.0002, slippage_perc=0.0005, metric='sharpe_ratio', *, run_backtest_func, n_jobs=1, checkpoint=None, backtest_cache=True, benchmark=None):
+    """
+    执行参数优化，支持一个或两个参数。
+    若信号函数是 SignalPipeline，扫描期间缓存与参数无关的中间阶段，每组参数只重新计算依赖参数的阶段；
+    网格中含有可批量计算的参数时（见 signal_pipeline.vectorizable），先用多窗口指标引擎一次算出全部取值。
+
+    参数：
+    - parameter_grid: 字典，包含参数名称和要测试的取值列表。例如：{'window_1': [30, 34, 38]}
+    - strategy_function: 生成信号的策略函数，例如 UDVD
+    - strategy_class: Backtrader 策略类，例如 UDVD_Strategy
+    - target_assets: 资产列表
+    - paths: 数据路径字典
+    - cash: 初始资金
+    - commission: 佣金
+    - slippage_perc: 滑点百分比
+    - metric: 选择用于评估的绩效指标，默认为 'sharpe_ratio'
+    - run_backtest_func: 回测函数，即策略文件中的 run_backtest；信号类策略也可传入 vector_backtest.vector_backtest 加速。
+      只能以关键字传入，原有按位置传入 cash 等参数的调用方式不受影响
+    - n_jobs: 并行进程数，1 为串行，-1 为使用全部 CPU。
+      Windows 下子进程会重新导入策略脚本，脚本的顶层代码需放在 if __name__ == '__main__': 之下
+    - checkpoint: 结果存储文件路径（SQLite），每完成一个组合即写入；再次运行时跳过策略代码、数据和交易设置
+      都相同且已完成的组合，中断后重跑或扩大网格只计算新的组合。默认为 None，不保存
+    - backtest_cache: 是否使用回测结果缓存（见 backtest_cache.BacktestCache）。不同参数生成的信号和价格完全相同时，
+      直接返回已有的净值序列，不再重复回测；扫描结束时打印命中统计。并行时每个子进程各有一份缓存
+    - benchmark: 基准代码（从 paths['daily'] 读取）或 benchmark.Benchmark。指定时结果中增加 alpha、beta、
+      信息比率等相对基准的指标（见 benchmark.relative_metrics），metric 也可以选这些指标
+
+    返回：
+    - 结果 DataFrame，按参数组合的顺序排列，与并行时的完成顺序无关；
+      出错的组合保留在结果中，error 列记录异常信息
+    """
+
+    # 获取参数名称和取值列表
+    param_names = list(parameter_grid.keys())
+    param_values = [parameter_grid[key] for key in param_names]
+
+    # 生成所有参数组合
+    param_combinations = [dict(zip(param_names, values)) for values in product(*param_values)]
+    indexed = list(enumerate(param_combinations))
+
+    if benchmark is not None and not isinstance(benchmark, Benchmark):
+        benchmark = load_benchmark(benchmark, paths=paths)
+
+    context = (strategy_function, strategy_class, run_backtest_func, target_assets, paths, cash, commission, slippage_perc, benchmark)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    results = {}
+    save_result = None
+    if checkpoint is not None:
+        store = OptimizationStore(checkpoint)
+        run_key = run_fingerprint(*context[:-1], benchmark=benchmark)
+        saved = store.load(run_key)
+        for index, params in indexed:
+            key = param_hash(params)
+            if key in saved:
+                results[index] = saved[key]
+        if results:
+            print(f"从 {checkpoint} 读取已完成的参数组合 {len(results)}/{len(indexed)} 个")
+        indexed = [(index, params) for index, params in indexed if index not in results]
+
+        def save_result(index, result_entry):
+            # 出错的组合不保存，重跑时再次尝试
+            if result_entry['error'].isna().all():
+                store.save(run_key, param_combinations[index], result_entry)
+
+    cache = get_backtest_cache()
+    cache_hits, cache_misses = 0, 0
+    if indexed and n_jobs == 1:
+        # 串行时整个网格共享一次中间结果缓存
+        before = cache.stats()
+        for index, result_entry in _run_chunk(context, indexed, verbose=True, on_result=save_result, use_cache=backtest_cache):
+            results[index] = result_entry
+        after = cache.stats()
+        cache_hits, cache_misses = after['hits'] - before['hits'], after['misses'] - before['misses']
+    elif indexed:
+        # 先在主进程中生成列式存储（行情和已注册的辅助数据集），避免子进程同时转换同一个 CSV
+        build_store(paths, target_assets=target_assets)
+        build_dataset_stores(paths, target_assets=target_assets)
+        # 连续的参数组合分在同一组，组内可以复用中间结果
+        n_chunks = min(len(indexed), n_jobs * 4)
+        chunk_size = -(-len(indexed) // n_chunks) if n_chunks else 1
+        chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(context, backtest_cache)) as executor:
+            futures = [executor.submit(_run_worker_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                outputs, (hits, misses) = future.result()
+                cache_hits += hits
+                cache_misses += misses
+                for index, result_entry in outputs:
+                    results[index] = result_entry
+                    if save_result is not None:
+                        save_result(index, result_entry)
+                print(f"已完成 {len(results)}/{len(param_combinations)} 个参数组合")
+
+    if checkpoint is not None:
+        store.close()
+    if backtest_cache and indexed:
+        cache.report(cache_hits, cache_misses)
+
+    # 按参数组合的顺序汇总
+    results_df = pd.concat([results[index] for index in sorted(results)], axis=0, ignore_index=True)
+    # 参数列在前、error 列在最后（旧版结果存储按列名排序保存）
+    metric_columns = [c for c in results_df.columns if c not in param_names and c != 'error']
+    results_df = results_df[param_names + metric_columns + ['error']]
+    failed = results_df['error'].notna()
+    for params, error in zip(results_df.loc[failed, param_names].to_dict('records'), results_df.loc[failed, 'error']):
+        print(f"参数组合出现错误：{params}，{error}")
+    # 正常的组合与原来一样去掉含缺失值的行，出错的组合保留
+    complete = results_df.drop(columns='error').notna().all(axis=1)
+    results_df = results_df[failed | complete]
+    plot_df = results_df[results_df['error'].isna()]
+
+    # 可视化结果
+    if plot_df.empty or metric not in plot_df:
+        print("没有可用于可视化的结果。")
+    elif len(param_names) == 1:
+        # 绘制参数与绩效指标的关系曲线
+        param = param_names[0]
+        plt.figure(figsize=(10, 6))
+        plt.plot(plot_df[param], plot_df[metric], marker='o')
+        plt.xlabel(param)
+        plt.ylabel(metric)
+        plt.title(f'{metric} vs {param}')
+        plt.grid(True)
+        plt.show()
+    elif len(param_names) == 2:
+        # 绘制热力图
+        param1 = param_names[0]
+        param2 = param_names[1]
+        pivot_table = plot_df.pivot(index=param1, columns=param2, values=metric)
+
+        plt.figure(figsize=(15, 12))  # 调整图像大小
+        sns.heatmap(pivot_table, annot=True, fmt=".4f", cmap='viridis',
+                    annot_kws={"size": 8}, linewidths=0.5, linecolor='white')
+        plt.title(f'{metric} Heatmap', fontsize=16)
+        plt.ylabel(param1, fontsize=14)
+        plt.xlabel(param2, fontsize=14)
+        plt.xticks(rotation=45)
+        plt.yticks(rotation=0)
+        plt.tight_layout()  # 自动调整布局
+        plt.show()
+    else:
+        print("无法可视化超过两个参数的结果，请减少参数数量。")
+
+    # 返回结果 DataFrame
+    return results_df
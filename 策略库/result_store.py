@@ -0,0 +1,150 @@
+import os
+import json
+import hashlib
+import inspect
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from bar_store import FREQS, registered_datasets
+from signal_pipeline import SignalPipeline
+
+
+def _json_default(value):
+    # numpy 标量转换为 Python 标量，其余对象按字符串保存
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _dumps(value, sort_keys=True):
+    return json.dumps(value, sort_keys=sort_keys, ensure_ascii=False, default=_json_default)
+
+
+def param_hash(params):
+    """
+    参数组合的哈希，参数顺序不影响结果
+    """
+    return hashlib.sha1(_dumps(params).encode('utf-8')).hexdigest()
+
+
+def source_fingerprint(obj):
+    """
+    返回函数或类用于计算指纹的源代码文本，取不到源代码时退回字节码；run_fingerprint 和回测结果缓存共用。
+    SignalPipeline 取各阶段的源代码，声明了 vectorizable 的阶段同时取批量函数的源代码，参数扫描的结果实际由批量函数算出
+    """
+    if isinstance(obj, SignalPipeline):
+        parts = []
+        for stage in obj.stages:
+            parts.append(source_fingerprint(stage))
+            batch = getattr(stage, 'batch', None)
+            if batch is not None:
+                parts.append(source_fingerprint(batch))
+        return '\n'.join(parts)
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        code = getattr(obj, '__code__', None)
+        if code is not None:
+            return code.co_code.hex() + repr(code.co_consts)
+        if isinstance(obj, type):
+            # 取不到源代码的类，按其中各方法的字节码计算
+            return repr(obj) + '\n'.join(name + source_fingerprint(value) for name, value in sorted(vars(obj).items())
+                                          if inspect.isfunction(value))
+        return repr(obj)
+
+
+def data_fingerprint(target_assets, paths):
+    """
+    行情数据指纹：各频段 CSV 的路径、修改时间和大小，以及已注册辅助数据集（期权、换手率等）的整理规则和文件，
+    数据更新后指纹随之改变。辅助数据集注册表是进程级的，同一进程中注册过的数据集都会计入
+    """
+    items = []
+    for freq in FREQS:
+        directory = paths.get(freq)
+        if directory is None:
+            continue
+        for code in target_assets:
+            csv_path = os.path.join(directory, f"{code}.csv")
+            if os.path.isfile(csv_path):
+                stat = os.stat(csv_path)
+                items.append((freq, code, stat.st_mtime_ns, stat.st_size))
+            else:
+                items.append((freq, code, None, None))
+    for name, dataset in sorted(registered_datasets().items()):
+        items.append((name, dataset.fingerprint(paths, target_assets)))
+    return hashlib.sha1(_dumps(items).encode('utf-8')).hexdigest()
+
+
+def run_fingerprint(strategy_function, strategy_class, run_backtest_func, target_assets, paths, cash, commission, slippage_perc, benchmark=None):
+    """
+    一次参数优化的指纹：策略代码、回测函数、资产、数据和交易设置都相同时才视为同一次优化；
+    指定基准时基准数据也计入指纹
+    """
+    parts = {
+        'strategy_function': source_fingerprint(strategy_function),
+        'strategy_class': source_fingerprint(strategy_class),
+        'run_backtest_func': source_fingerprint(run_backtest_func),
+        'target_assets': list(target_assets),
+        'paths': {k: v for k, v in paths.items() if not isinstance(v, (list, dict))},
+        'data': data_fingerprint(target_assets, paths),
+        'cash': cash,
+        'commission': commission,
+        'slippage_perc': slippage_perc,
+    }
+    if benchmark is not None:
+        parts['benchmark'] = benchmark.fingerprint()
+    return hashlib.sha1(_dumps(parts).encode('utf-8')).hexdigest()
+
+
+class OptimizationStore():
+    """
+    参数优化结果的磁盘存储（SQLite），每完成一个参数组合立即写入。
+    结果按 (优化指纹, 参数哈希) 保存，重新运行同一优化时跳过已完成的组合，
+    中断后重跑或扩大参数网格时只需计算新的组合。出错的组合不保存，重跑时会再次尝试。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "run_key TEXT NOT NULL, param_hash TEXT NOT NULL, params TEXT NOT NULL, "
+                "result TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (run_key, param_hash))"
+            )
+
+    def load(self, run_key):
+        """
+        读取某次优化已完成的结果，列的顺序与保存时相同
+
+        返回：
+        - {参数哈希: 单行结果 DataFrame}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT param_hash, result FROM results WHERE run_key = ?", (run_key,)).fetchall()
+        return {key: pd.DataFrame([json.loads(result)]) for key, result in rows}
+
+    def save(self, run_key, params, result_entry):
+        """
+        保存一个参数组合的结果
+
+        参数：
+        - run_key: 优化指纹
+        - params: 参数字典
+        - result_entry: 单行结果 DataFrame
+        """
+        record = result_entry.iloc[0].to_dict()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (run_key, param_hash(params), _dumps(params), _dumps(record, sort_keys=False), time.time()))
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,181 @@
+"""
+滚动窗口绩效分析：一次遍历净值曲线，得到每个窗口的年化收益率、年化波动率、夏普比率、索提诺比率、卡玛比率、最大回撤和胜率，
+不再对每个子区间重复调用 performance_analysis。
+
+- 收益率的一阶、二阶矩，负收益的个数和矩，以及非负收益的个数都用累计和相减得到，每个窗口 O(1)；
+- 窗口内的最大回撤用 van Herk / Gil-Werman 分块法：净值按窗口长度分块，块内分别向前、向后累计最大值、最小值和最大回撤，
+  任意窗口最多跨两块，把前一块的后缀和后一块的前缀合并即可，整体 O(n) 且完全向量化
+  （与单调队列维护滑动最大值的复杂度相同，但不需要逐根K线的 Python 循环）。
+
+各指标的定义与 performance_analysis 相同：回撤以窗口起点的净值为初始值，波动率为样本标准差，
+下行标准差只用负收益，胜率为非负收益的占比。
+收益率全部相同或几乎相同的窗口（如整段空仓）累计和只剩舍入误差，这些窗口按自身均值重新计算方差，
+与 performance_analysis 一样波动率为 0、夏普比率为 NaN。
+"""
+import numpy as np
+import pandas as pd
+from frequency import get_annual_factor
+from indicator_engine import RECENTER_TOLERANCE
+
+
+COLUMNS = ('total_return', 'annual_return', 'annual_volatility', 'sharpe_ratio', 'sortino_ratio',
+           'calmar_ratio', 'max_drawdown', 'win_rate')
+
+
+def _window_sums(x, starts, ends):
+    """
+    用累计和求每个窗口 [start, end) 内 x 的和
+    """
+    cumulative = np.concatenate([[0.0], np.cumsum(x)])
+    return cumulative[ends] - cumulative[starts]
+
+
+def _recentred_variance(x, starts, ends, sum_squares, scale):
+    """
+    累计和相减的舍入误差约为 eps × 截至窗口末尾的累计平方和，窗口内离差平方和与之相比不够大时
+    （收益率全部相同或几乎相同，如整段空仓），按窗口自身的均值两遍重新计算，与 pandas 的 std 一致
+
+    参数：
+    - x: 收益率序列
+    - starts, ends: 各窗口 [start, end) 在 x 中的位置
+    - sum_squares: 累计和得到的离差平方和
+    - scale: 截至各窗口末尾的累计平方和
+
+    返回：
+    - 各窗口的样本方差
+    """
+    count = ends - starts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = np.maximum(sum_squares, 0.0) / (count - 1)
+    suspect = (count > 1) & (np.abs(sum_squares) <= RECENTER_TOLERANCE * np.finfo(float).eps * scale)
+    for i in np.flatnonzero(suspect):
+        segment = x[starts[i]:ends[i]]
+        variance[i] = ((segment - segment.mean()) ** 2).sum() / (count[i] - 1)
+    return variance
+
+
+def _block_layout(values, length):
+    """
+    把净值补齐为 length 的整数倍（用最后一个值补齐，不影响有效窗口）并分块
+    """
+    n_blocks = -(-len(values) // length)
+    padded = np.full(n_blocks * length, values[-1])
+    padded[:len(values)] = values
+    return padded.reshape(n_blocks, length)
+
+
+def rolling_max_drawdown(values, length, starts):
+    """
+    每个长度为 length 的净值窗口内的最大回撤（负数）
+
+    参数：
+    - values: 净值数组
+    - length: 窗口包含的净值个数
+    - starts: 各窗口起点位置
+
+    返回：
+    - 与 starts 等长的最大回撤数组
+    """
+    blocks = _block_layout(values, length)
+
+    # 前缀：从块起点到当前位置的最高点、最低点和最低的 净值/此前最高点
+    prefix_max = np.maximum.accumulate(blocks, axis=1)
+    prefix_min = np.minimum.accumulate(blocks, axis=1)
+    prefix_ratio = np.minimum.accumulate(blocks / prefix_max, axis=1)
+
+    # 后缀：从当前位置到块终点。以当前位置为高点时，最低比值为此后最低点 / 当前净值
+    reversed_blocks = blocks[:, ::-1]
+    suffix_max = np.maximum.accumulate(reversed_blocks, axis=1)[:, ::-1]
+    suffix_min = np.minimum.accumulate(reversed_blocks, axis=1)[:, ::-1]
+    later_min = np.concatenate([suffix_min[:, 1:], np.full((len(blocks), 1), np.inf)], axis=1)
+    peak_ratio = np.minimum(later_min / blocks, 1.0)
+    suffix_ratio = np.minimum.accumulate(peak_ratio[:, ::-1], axis=1)[:, ::-1]
+
+    prefix_max, prefix_min, prefix_ratio = prefix_max.ravel(), prefix_min.ravel(), prefix_ratio.ravel()
+    suffix_max, suffix_ratio = suffix_max.ravel(), suffix_ratio.ravel()
+
+    ends = starts + length - 1
+    aligned = starts % length == 0
+    # 不与块对齐的窗口 = 起点所在块的后缀 + 下一块的前缀
+    ratio = np.minimum(np.minimum(suffix_ratio[starts], prefix_ratio[ends]), prefix_min[ends] / suffix_max[starts])
+    ratio = np.where(aligned, prefix_ratio[ends], ratio)
+    return ratio - 1
+
+
+def rolling_performance(portfolio_value, window=252, step=1, freq='D'):
+    """
+    滚动窗口绩效指标
+
+    参数：
+    - portfolio_value: 净值序列（Series，或取第一列的 DataFrame）
+    - window: 每个窗口包含的收益率个数（K线数）
+    - step: 相邻窗口的间隔，窗口以最后一根K线为基准向前对齐，最新的窗口总会包含在内
+    - freq: 数据频率，见 frequency 模块；为 None 时由日期推断
+
+    返回：
+    - DataFrame，以窗口最后一根K线的日期为索引，start 列为窗口起点日期，其余列见 COLUMNS
+    """
+    if isinstance(portfolio_value, pd.DataFrame):
+        portfolio_value = portfolio_value.iloc[:, 0]
+    portfolio_value = portfolio_value.dropna()
+    values = portfolio_value.to_numpy(dtype=float)
+    if window < 2:
+        raise ValueError("窗口至少需要两个收益率")
+    if len(values) <= window:
+        raise ValueError(f"净值序列长度 {len(values)} 不足以计算 {window} 根K线的滚动窗口")
+    annual_factor = get_annual_factor(freq, portfolio_value.index)
+
+    # 窗口 k 覆盖净值 [starts, ends]，即收益率 [starts, ends)
+    ends = np.arange(len(values) - 1, window - 1, -step)[::-1]
+    starts = ends - window
+    returns = values[1:] / values[:-1] - 1
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total_return = values[ends] / values[starts] - 1
+        annual_return = (1 + total_return) ** (annual_factor / window) - 1
+
+        # 先减去整体均值再累计，减小大数相减的误差
+        shift = returns.mean()
+        centered = returns - shift
+        s1 = _window_sums(centered, starts, ends)
+        s2 = _window_sums(centered * centered, starts, ends)
+        scale = np.concatenate([[0.0], np.cumsum(centered * centered)])[ends]
+        variance = _recentred_variance(returns, starts, ends, s2 - s1 * s1 / window, scale)
+        annual_volatility = np.sqrt(variance) * np.sqrt(annual_factor)
+
+        negative = returns < 0
+        negative_shift = returns[negative].mean() if negative.any() else 0.0
+        negative_centered = np.where(negative, returns - negative_shift, 0.0)
+        n_negative = _window_sums(negative.astype(float), starts, ends)
+        n1 = _window_sums(negative_centered, starts, ends)
+        n2 = _window_sums(negative_centered * negative_centered, starts, ends)
+        # 负收益按出现顺序排成子序列，窗口内的负收益是子序列中连续的一段
+        negative_positions = np.flatnonzero(negative)
+        negative_starts = np.searchsorted(negative_positions, starts)
+        negative_ends = np.searchsorted(negative_positions, ends)
+        negative_scale = np.concatenate([[0.0], np.cumsum(negative_centered * negative_centered)])[ends]
+        negative_var = _recentred_variance(returns[negative], negative_starts, negative_ends,
+                                           n2 - n1 * n1 / n_negative, negative_scale)
+        downside_std = np.where(n_negative > 1, np.sqrt(negative_var) * np.sqrt(annual_factor), np.nan)
+
+        max_drawdown = rolling_max_drawdown(values, window + 1, starts)
+
+        sharpe_ratio = annual_return / annual_volatility
+        sortino_ratio = annual_return / downside_std
+        calmar_ratio = annual_return / np.abs(max_drawdown)
+        win_rate = _window_sums((returns >= 0).astype(float), starts, ends) / window
+
+    index = portfolio_value.index
+    result = pd.DataFrame({
+        'start': index[starts],
+        'total_return': total_return,
+        'annual_return': annual_return,
+        'annual_volatility': annual_volatility,
+        'sharpe_ratio': sharpe_ratio,
+        'sortino_ratio': sortino_ratio,
+        'calmar_ratio': calmar_ratio,
+        'max_drawdown': max_drawdown,
+        'win_rate': win_rate,
+    }, index=index[ends])
+    result.index.name = 'date'
+    return result
@@ -0,0 +1,205 @@
+import inspect
+import threading
+from contextlib import contextmanager
+from itertools import product
+
+
+def vectorizable(batch, *params):
+    """
+    声明阶段中的参数可以批量计算，用作阶段函数的装饰器。
+
+    参数：
+    - batch: 批量版本的阶段函数，签名与阶段相同，但 params 中的参数传入取值列表，
+      返回字典 {(各参数取值,): 该组取值下阶段的输出}
+    - params: 可批量计算的参数名
+    """
+    def decorator(stage):
+        stage.batch = batch
+        stage.batch_params = params
+        return stage
+    return decorator
+
+
+class SignalPipeline():
+    """
+    分阶段的信号生成流程，用来代替 (target_assets, paths, **params) 形式的信号函数。
+
+    每个资产依次经过若干阶段：
+    - 第一个阶段签名为 stage(code, paths, **params)，通常负责读取数据、计算与参数无关的中间列；
+    - 之后每个阶段签名为 stage(prev, **params)，prev 为上一阶段的输出；
+    - 最后一个阶段返回 (daily_data, full_info)，即存入 results 和 full_info 的两个值。
+
+    各阶段只接收自己签名中声明的参数。在 cached() 上下文中，除最后一个阶段外的输出按
+    (阶段, 资产, 数据路径, 该阶段及之前的参数) 缓存，参数扫描时只需重新计算依赖当前参数的后续阶段。
+    因为输出会被多次复用，各阶段不能原地修改传入的 prev，需要修改时先 copy()。
+    """
+
+    def __init__(self, *stages, name=None):
+        if not stages:
+            raise ValueError("SignalPipeline 至少需要一个阶段")
+        self.stages = stages
+        self.__name__ = name or stages[-1].__name__
+        # 每个阶段接受的参数及默认值
+        self.stage_params = [self._stage_params(stage, 2 if i == 0 else 1) for i, stage in enumerate(stages)]
+        self._cache = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # 并行优化时会被发送到子进程，锁和中间结果缓存不随之复制
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stage_params(stage, n_positional):
+        signature = inspect.signature(stage)
+        params = list(signature.parameters.values())[n_positional:]
+        return {p.name: p.default for p in params}
+
+    @property
+    def param_names(self):
+        return [name for params in self.stage_params for name in params]
+
+    @property
+    def vectorizable_params(self):
+        return [name for stage in self.stages[:-1] for name in getattr(stage, 'batch_params', ())]
+
+    def _split_params(self, params):
+        unknown = set(params) - set(self.param_names)
+        if unknown:
+            raise TypeError(f"{self.__name__} 不接受参数：{sorted(unknown)}")
+        stage_kwargs = []
+        for defaults in self.stage_params:
+            kwargs = {}
+            for name, default in defaults.items():
+                if name in params:
+                    kwargs[name] = params[name]
+                elif default is not inspect.Parameter.empty:
+                    kwargs[name] = default
+            stage_kwargs.append(kwargs)
+        return stage_kwargs
+
+    def run_asset(self, code, paths, **params):
+        """
+        计算单个资产的信号。
+
+        返回：
+        - 最后一个阶段的输出 (daily_data, full_info)
+        """
+        return self._run(code, paths, self._split_params(params), len(self.stages))
+
+    def _run(self, code, paths, stage_kwargs, stop):
+        """
+        依次执行前 stop 个阶段，返回第 stop 个阶段的输出，能复用缓存时从缓存处继续
+        """
+        paths_key = tuple(sorted(paths.items()))
+
+        # 从后往前查找可以复用的阶段输出
+        start, output = 0, None
+        if self._cache is not None:
+            for i in range(min(stop, len(self.stages) - 1) - 1, -1, -1):
+                key = self._cache_key(i, code, paths_key, stage_kwargs)
+                with self._lock:
+                    if key in self._cache:
+                        output = self._cache[key]
+                        start = i + 1
+                        self.hits += 1
+                        break
+            else:
+                with self._lock:
+                    self.misses += 1
+
+        for i in range(start, stop):
+            if i == 0:
+                output = self.stages[0](code, paths, **stage_kwargs[0])
+            else:
+                output = self.stages[i](output, **stage_kwargs[i])
+            if self._cache is not None and i < len(self.stages) - 1:
+                with self._lock:
+                    self._cache[self._cache_key(i, code, paths_key, stage_kwargs)] = output
+        return output
+
+    def prefill(self, target_assets, paths, parameter_grid):
+        """
+        参数扫描前，对声明了 vectorizable 的阶段一次性计算网格中全部取值，结果写入中间结果缓存，
+        之后逐组参数调用时直接命中。需在 cached() 上下文中调用。
+
+        参数：
+        - target_assets: 资产列表
+        - paths: 数据路径字典
+        - parameter_grid: 参数网格，与 parameter_optimization 相同
+        """
+        if self._cache is None:
+            raise RuntimeError("prefill 需要在 cached() 上下文中调用")
+        grid = {name: list(values) for name, values in parameter_grid.items()}
+        paths_key = tuple(sorted(paths.items()))
+
+        for i, stage in enumerate(self.stages[:-1]):
+            batch_params = getattr(stage, 'batch_params', ())
+            if not any(name in grid for name in batch_params):
+                continue
+            # 本阶段及之前阶段中其余参数的每种取值组合，各做一次批量计算
+            other_names = [name for params in self.stage_params[:i + 1] for name in params
+                           if name in grid and name not in batch_params]
+            batch_values = {name: grid.get(name, [self.stage_params[i][name]]) for name in batch_params}
+            for other_values in product(*[grid[name] for name in other_names]):
+                params = dict(zip(other_names, other_values))
+                params.update({name: values[0] for name, values in batch_values.items()})
+                stage_kwargs = self._split_params(params)
+                batch_kwargs = dict(stage_kwargs[i], **batch_values)
+                for code in target_assets:
+                    if i == 0:
+                        outputs = stage.batch(code, paths, **batch_kwargs)
+                    else:
+                        outputs = stage.batch(self._run(code, paths, stage_kwargs, i), **batch_kwargs)
+                    for combo, output in outputs.items():
+                        stage_kwargs[i].update(zip(batch_params, combo))
+                        with self._lock:
+                            self._cache[self._cache_key(i, code, paths_key, stage_kwargs)] = output
+
+    @staticmethod
+    def _cache_key(i, code, paths_key, stage_kwargs):
+        params_key = tuple(tuple(sorted(kwargs.items())) for kwargs in stage_kwargs[:i + 1])
+        return (i, code, paths_key, params_key)
+
+    def __call__(self, target_assets, paths, **params):
+        #信号结果字典
+        results = {}
+        #全数据字典，包含计算指标用于检查
+        full_info = {}
+        for code in target_assets:
+            daily_data, info = self.run_asset(code, paths, **params)
+            results[code] = daily_data
+            full_info[code] = info
+        return results, full_info
+
+    @contextmanager
+    def cached(self):
+        """
+        在上下文中缓存中间阶段的输出，退出时清空，可嵌套使用
+        """
+        if self._cache is not None:
+            yield self
+            return
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            yield self
+        finally:
+            self.clear_cache()
+
+    def clear_cache(self):
+        self._cache = None
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        print(f"{self.__name__} 中间结果缓存：命中 {self.hits} 次，未命中 {self.misses} 次，命中率 {hit_rate:.2%}")
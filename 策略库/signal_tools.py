@@ -0,0 +1,203 @@
+"""
+向量化的信号构造工具，替代策略文件中逐根K线循环、逐元素写入 DataFrame 以及 apply(axis=1) 逐行回调的写法。
+与 indicator_engine 一致，参数传入一组取值时返回 (时间 x 取值) 的二维数组，便于参数扫描一次算出所有取值。
+
+信号规则用有序的 (条件, 取值) 列表表达，按 if/elif/else 的顺序编译为 np.select，例如
+    select_signal([((lips > teeth) & (teeth > jaw), 1),
+                   ((lips < teeth) & (teeth < jaw), -1)], default=0)
+"""
+import numpy as np
+
+
+def hold_signal(trigger, bars):
+    """
+    触发后保持信号 N 根K线：第 t 根K线在最近 bars 根K线（含当根）内出现过触发时为 True。
+    等价于
+        for i in range(len(df)):
+            if trigger[i] > 0:
+                for j in range(i, min(i + bars, len(df))):
+                    signal[j] = 1
+    也等价于 (trigger > 0).rolling(bars, min_periods=1).max()，用触发次数的累加和相减得到，与持有期长短无关。
+
+    参数：
+    - trigger: 触发序列，大于 0 视为触发，NaN 视为未触发
+    - bars: 持有的K线数（含触发当根），可以是单个整数或一组整数
+
+    返回：
+    - bars 为整数时为一维布尔数组，为一组整数时为 (时间 x 持有期) 的二维布尔数组，第 j 列对应 bars[j]
+    """
+    triggered = np.nan_to_num(np.asarray(trigger, dtype=float)) > 0
+    cum = np.concatenate([[0], np.cumsum(triggered)])
+    windows = np.atleast_1d(np.asarray(bars, dtype=int))
+    end = np.arange(1, len(triggered) + 1)[:, None]
+    start = np.clip(end - windows[None, :], 0, None)
+    held = (cum[end] - cum[start]) > 0
+    return held[:, 0] if np.ndim(bars) == 0 else held
+
+
+def hold_position(trigger, bars, on=1, off=-1):
+    """
+    hold_signal 的多空信号形式：持有期内为 on，其余为 off
+    """
+    return np.where(hold_signal(trigger, bars), on, off)
+
+
+def _run_counts(mask):
+    """
+    布尔序列的累加和（首位补 0），用于 O(1) 求任意区间内为 True 的个数
+    """
+    return np.concatenate([[0], np.cumsum(mask)])
+
+
+def fractal_mask(values, wing=2, kind='up'):
+    """
+    识别 Williams 分形的中心K线。向上分形：中心点最高，左右两侧各 wing 根K线逐级降低；向下分形相反。
+    wing=2 即经典的 5 根K线分形。
+    逐级单调等价于中心点左侧连续 wing 个同向差分、右侧连续 wing 个反向差分，用差分的累加和计数，与 wing 大小无关。
+
+    参数：
+    - values: 最高价（向上分形）或最低价（向下分形）序列，NaN 不构成分形
+    - wing: 每侧的K线数
+    - kind: 'up' 或 'down'
+
+    返回：
+    - 与 values 等长的布尔数组，分形中心K线为 True
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    step = np.diff(values)
+    if kind == 'up':
+        left, right = step > 0, step < 0
+    elif kind == 'down':
+        left, right = step < 0, step > 0
+    else:
+        raise ValueError(f"未知的分形方向：{kind}，可选 'up'、'down'")
+
+    mask = np.zeros(n, dtype=bool)
+    if wing < 1 or n < 2 * wing + 1:
+        return mask
+    # 中心 i 左侧的差分为 step[i-wing:i]，右侧为 step[i:i+wing]
+    left_count = _run_counts(left)
+    right_count = _run_counts(right)
+    centers = np.arange(wing, n - wing)
+    mask[centers] = ((left_count[centers] - left_count[centers - wing] == wing) &
+                     (right_count[centers + wing] - right_count[centers] == wing))
+    return mask
+
+
+def _forward_fill(values, positions, n):
+    """
+    在 positions 处放入 values，其余位置沿用此前最近的值，之前没有值的位置为 NaN
+    """
+    filled = np.full(n, np.nan)
+    filled[positions] = values
+    return carry_forward(filled)
+
+
+def fractal_levels(high, low, wing=2, lookback=1, causal=False):
+    """
+    分形价位：出现向上分形时记录此前 lookback 根K线（含中心）最高价的最高值，向下分形记录最低价的最低值，
+    之后沿用最近一次分形的价位。中心之前不足 lookback 根K线的分形不记录。
+
+    参数：
+    - high: 最高价序列
+    - low: 最低价序列
+    - wing: 分形每侧的K线数
+    - lookback: 记录价位时回看的K线数
+    - causal: 为 False 时价位记在分形中心K线上（需要右侧 wing 根K线，含未来信息，仅用于研究）；
+      为 True 时在右侧 wing 根K线走完、分形确认的那根K线上才记录，可直接用于回测
+
+    返回：
+    - (up_fractal_value, down_fractal_value)，与输入等长的浮点数组，尚无分形时为 NaN
+    """
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    n = len(high)
+    delay = wing if causal else 0
+    levels = []
+    for values, kind, reduce in ((high, 'up', np.fmax), (low, 'down', np.fmin)):
+        mask = fractal_mask(values, wing, kind)
+        mask[:lookback - 1] = False
+        centers = np.flatnonzero(mask)
+        if lookback > 1 and len(centers):
+            windows = np.lib.stride_tricks.sliding_window_view(values, lookback)
+            value = reduce.reduce(windows[centers - lookback + 1], axis=1)
+        else:
+            value = values[centers]
+        levels.append(_forward_fill(value, centers + delay, n))
+    return levels[0], levels[1]
+
+
+def select_signal(rules, default=0):
+    """
+    按顺序匹配规则生成信号，等价于逐行的 if/elif/else：第一个成立的条件决定取值，都不成立时为 default。
+
+    参数：
+    - rules: [(条件, 取值), ...]，条件为布尔数组或布尔 Series（NaN 参与的比较为 False），
+      取值为标量或等长数组；取值为 np.nan 表示该情况沿用上一周期信号，配合 carry_forward 使用
+    - default: 所有条件都不成立时的取值
+
+    返回：
+    - 信号数组
+    """
+    conditions = [np.asarray(condition, dtype=bool) for condition, _ in rules]
+    values = [np.asarray(value, dtype=float) if np.ndim(value) else value for _, value in rules]
+    return np.select(conditions, values, default)
+
+
+def sign_signal(values, threshold=0, above=1, below=-1):
+    """
+    大于阈值为 above，否则（含 NaN）为 below，等价于 apply(lambda x: above if x > threshold else below)
+    """
+    return np.where(np.asarray(values, dtype=float) > threshold, above, below)
+
+
+def carry_forward(signal, initial=np.nan):
+    """
+    NaN 沿用此前最近的非 NaN 值，开头没有可沿用的值时为 initial。
+    即“延续上一周期信号”，等价于 fillna(method='ffill').fillna(initial)
+    """
+    signal = np.asarray(signal, dtype=float)
+    last = np.where(~np.isnan(signal), np.arange(len(signal)), -1)
+    last = np.maximum.accumulate(last)
+    return np.where(last >= 0, signal[np.maximum(last, 0)], initial)
+
+
+def _current_and_previous(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    previous_a = np.concatenate([[np.nan], a[:-1]])
+    previous_b = np.concatenate([[np.nan], b[:-1]])
+    return a, b, previous_a, previous_b
+
+
+def cross_above(a, b, inclusive=False):
+    """
+    a 上穿 b：上一根K线 a <= b，当根 a > b（inclusive 为 True 时 a >= b），
+    等价于 (a.shift(1) <= b.shift(1)) & (a > b)。b 可以是常数，如零轴
+
+    返回：
+    - 布尔数组
+    """
+    a, b, previous_a, previous_b = _current_and_previous(a, b)
+    now = a >= b if inclusive else a > b
+    return (previous_a <= previous_b) & now
+
+
+def cross_below(a, b, inclusive=True):
+    """
+    a 下穿 b：上一根K线 a > b，当根 a <= b（inclusive 为 False 时 a < b），
+    等价于 (a.shift(1) > b.shift(1)) & (a <= b)。与 cross_above 的默认值一起，相等视为未上穿
+
+    返回：
+    - 布尔数组
+    """
+    a, b, previous_a, previous_b = _current_and_previous(a, b)
+    now = a <= b if inclusive else a < b
+    return (previous_a > previous_b) & now
+
+
+def crossover_signal(up, down):
+    """
+    上穿处为 1、下穿处为 -1，其余为 NaN，之后由 ffill / carry_forward 延续到下一次穿越
+    """
+    return select_signal([(up, 1), (down, -1)], default=np.nan)
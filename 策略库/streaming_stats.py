@@ -0,0 +1,169 @@
+"""
+可合并的流式统计量，用于分块、多进程的大规模模拟：各块只保留汇总信息，最后合并，内存与样本数无关。
+
+- TDigest：分位数草图。质心按 arcsin 刻度（k1 尺度函数）分桶压缩，尾部的质心更细，极端分位数更准；
+  压缩过程完全向量化（排序 + 分桶 + reduceat），合并两个草图就是把质心放在一起重新压缩。
+- StreamingMetric：单个指标的样本数、均值、方差（Chan 等人的并行合并公式）、最值、超过阈值的次数和分位数草图。
+"""
+import numpy as np
+
+
+# t-digest 的压缩参数，质心数约为其一半，越大分位数越准
+DEFAULT_COMPRESSION = 500
+
+
+class TDigest():
+    """
+    可合并的 t-digest 分位数草图
+    """
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        """
+        加入一批样本（调用方负责去掉 NaN）
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(values, np.ones(len(values)))
+
+    def merge(self, other):
+        """
+        合并另一个草图
+        """
+        if len(other.means) == 0:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(other.means, other.weights)
+
+    def _compress(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+
+        # 按质心中点的累计分位数映射到 k 刻度，同一整数 k 区间内的质心合并为一个
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(k)) + 1])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def _knots(self):
+        """
+        分位数插值节点：两端为最小、最大值，中间为各质心中点
+        """
+        cumulative = np.cumsum(self.weights)
+        centers = (cumulative - self.weights / 2) / cumulative[-1]
+        x = np.concatenate([[self.min], self.means, [self.max]])
+        p = np.concatenate([[0.0], centers, [1.0]])
+        return x, p
+
+    def quantile(self, q):
+        """
+        返回分位数，q 取值 0~1，可以是数组
+        """
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        x, p = self._knots()
+        return np.interp(q, p, x)
+
+    def cdf(self, x):
+        """
+        返回累积分布函数值，x 可以是数组
+        """
+        if len(self.means) == 0:
+            return np.full(np.shape(x), np.nan) if np.ndim(x) else np.nan
+        knots, p = self._knots()
+        return np.interp(x, knots, p)
+
+
+class StreamingMetric():
+    """
+    单个指标的流式统计量，各块分别 update 后用 merge 合并
+    """
+
+    def __init__(self, thresholds=(), compression=DEFAULT_COMPRESSION):
+        """
+        参数：
+        - thresholds: 需要统计“大于该值”次数的阈值
+        - compression: 分位数草图的压缩参数
+        """
+        self.total = 0          # 样本数，包含 NaN
+        self.n = 0              # 有效样本数
+        self.mean = 0.0
+        self.m2 = 0.0           # 离差平方和
+        self.exceed = {threshold: 0 for threshold in thresholds}
+        self.digest = TDigest(compression)
+
+    def _combine(self, n, mean, m2):
+        # Chan 等人的并行方差合并公式
+        if n == 0:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+
+    def update(self, values):
+        """
+        加入一批样本
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        self.total += len(values)
+        for threshold in self.exceed:
+            self.exceed[threshold] += int(np.count_nonzero(values > threshold))
+        values = values[~np.isnan(values)]
+        if len(values):
+            mean = values.mean()
+            self._combine(len(values), mean, float(np.sum((values - mean) ** 2)))
+            self.digest.update(values)
+
+    def merge(self, other):
+        """
+        合并另一块的统计量
+        """
+        self.total += other.total
+        for threshold, count in other.exceed.items():
+            self.exceed[threshold] = self.exceed.get(threshold, 0) + count
+        self._combine(other.n, other.mean, other.m2)
+        self.digest.merge(other.digest)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.m2 / (self.n - ddof)) if self.n > ddof else np.nan
+
+    def probability(self, threshold):
+        """
+        样本大于阈值的比例，分母包含 NaN，与 np.mean(values > threshold) 一致
+        """
+        return self.exceed[threshold] / self.total if self.total else np.nan
+
+    def quantile(self, q):
+        return self.digest.quantile(q)
+
+    def histogram(self, bins=50):
+        """
+        由分位数草图近似的直方图（密度），返回 (hist, edges)
+        """
+        lo, hi = self.digest.min, self.digest.max
+        if not hi > lo:
+            hi = lo + 1e-12
+        edges = np.linspace(lo, hi, bins + 1)
+        hist = np.diff(self.digest.cdf(edges)) / np.diff(edges)
+        return hist, edges
@@ -0,0 +1,30 @@
+"""
+测试公共设置：策略库中的模块以顶层模块方式导入，与策略脚本的运行方式一致
+"""
+import importlib.util
+import os
+import sys
+
+LIBRARY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if LIBRARY_DIR not in sys.path:
+    sys.path.insert(0, LIBRARY_DIR)
+
+
+def load_script(filename, module_name):
+    """
+    以模块方式载入策略脚本（运行部分在 __main__ 保护下不会执行），
+    并登记到 sys.modules，Backtrader 创建策略实例时需要按模块名找到策略类
+
+    参数：
+    - filename: 策略库中的脚本文件名
+    - module_name: 登记的模块名
+
+    返回：
+    - 模块对象
+    """
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(LIBRARY_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[module_name]
@@ -0,0 +1,41 @@
+"""
+参数优化中批量计算绩效指标的测试
+"""
+import numpy as np
+import pandas as pd
+
+from optimizer import _score
+
+# _score 只用到回测上下文中的基准（最后一项）
+CONTEXT = (None,) * 8 + (None,)
+
+
+def net_value(seed, n_bars=300):
+    """
+    日频合成净值序列
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2020-01-01', periods=n_bars)
+    return pd.DataFrame(np.cumprod(1 + rng.normal(0, 0.01, n_bars)), index=dates)
+
+
+def test_score_matches_single_curves():
+    batch = [(i, {'window_1': i}, net_value(i, 300 - 10 * i)) for i in range(4)]
+    for (index, params, pv), (out_index, entry) in zip(batch, _score(CONTEXT, batch)):
+        expected = _score(CONTEXT, [(index, params, pv)])[0][1]
+        assert out_index == index
+        pd.testing.assert_frame_equal(entry, expected, rtol=1e-12)
+
+
+def test_score_isolates_degenerate_curve():
+    batch = [(0, {'window_1': 5}, net_value(0)),
+             (1, {'window_1': 6}, net_value(1)),
+             (2, {'window_1': 7}, pd.DataFrame(dtype=float, index=pd.DatetimeIndex([]))),
+             (3, {'window_1': 8}, net_value(3))]
+    outputs = dict(_score(CONTEXT, batch))
+    assert outputs[2]['error'].notna().all()
+    for index in (0, 1, 3):
+        entry = outputs[index]
+        assert entry['error'].isna().all()
+        assert np.isfinite(entry['sharpe_ratio'].iloc[0])
+        assert entry['window_1'].iloc[0] == batch[index][1]['window_1']
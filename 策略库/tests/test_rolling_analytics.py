@@ -0,0 +1,44 @@
+"""
+滚动窗口绩效指标与逐个窗口调用 performance_analysis 的一致性测试，含整段空仓（收益率全为 0）的窗口
+"""
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analyzing_tools import Analyzing_Tools
+from rolling_analytics import rolling_performance
+
+
+def net_value():
+    """
+    合成净值：随机收益中夹有收益率全为 0 和连续相同负收益的区间
+    """
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0, 0.01, 300)
+    returns[100:160] = 0
+    returns[200:215] = -0.003
+    returns[215:260] = 0
+    values = np.cumprod(np.r_[1, 1 + returns]) * 1e7
+    return pd.Series(values, index=pd.bdate_range('2020-01-01', periods=len(values)))
+
+
+@pytest.mark.parametrize('window', [2, 10, 30])
+def test_rolling_matches_performance_analysis(window):
+    values = net_value()
+    result = rolling_performance(values, window=window)
+    tools = Analyzing_Tools()
+    columns = ['annual_return', 'annual_volatility', 'sharpe_ratio', 'sortino_ratio',
+               'calmar_ratio', 'max_drawdown', 'win_rate']
+    for end in result.index:
+        position = values.index.get_loc(end)
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = tools.performance_analysis(values.iloc[position - window:position + 1].to_frame(), freq='D')[-1]
+        expected = [float(np.asarray(metrics[name]).ravel()[0]) for name in columns]
+        np.testing.assert_allclose(result.loc[end, columns].to_numpy(dtype=float), expected, rtol=1e-7, atol=0)
+    # 整段空仓的窗口波动率为 0、夏普比率为 NaN
+    flat = result.loc[values.index[160]]
+    assert flat['annual_volatility'] == 0
+    assert np.isnan(flat['sharpe_ratio'])
@@ -0,0 +1,68 @@
+"""
+signal_tools 持有期信号与原逐行循环写法的等价性测试
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from signal_tools import hold_position, hold_signal
+
+
+def loop_position(trigger, bars):
+    """
+    满江红策略中原来的写法：触发后当根及之后共 bars 根K线置为 1，其余为 -1
+    """
+    signal = [-1] * len(trigger)
+    for i in range(len(trigger)):
+        if trigger[i] > 0:
+            for j in range(i, min(i + bars, len(trigger))):
+                signal[j] = 1
+    return np.array(signal)
+
+
+def rolling_hold(trigger, bars):
+    """
+    rolling 写法：最近 bars 根K线内出现过触发
+    """
+    triggered = pd.Series(np.asarray(trigger) > 0).astype(float)
+    return triggered.rolling(bars, min_periods=1).max().to_numpy() > 0
+
+
+def random_trigger(seed, n):
+    """
+    随机触发序列，含正数、零、负数和 NaN
+    """
+    rng = np.random.default_rng(seed)
+    trigger = rng.normal(-0.8, 1, n)
+    trigger[rng.random(n) < 0.1] = np.nan
+    trigger[rng.random(n) < 0.1] = 0.0
+    return trigger
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('bars', [1, 2, 5, 10, 60, 299, 300, 301, 1000])
+def test_hold_matches_loop_and_rolling(seed, bars):
+    trigger = random_trigger(seed, 300)
+    np.testing.assert_array_equal(hold_position(trigger, bars), loop_position(trigger, bars))
+    np.testing.assert_array_equal(hold_signal(trigger, bars), rolling_hold(trigger, bars))
+
+
+def test_hold_accepts_series_and_custom_values():
+    trigger = pd.Series(random_trigger(7, 50))
+    np.testing.assert_array_equal(hold_position(trigger, 3, on=1, off=0), np.where(loop_position(trigger, 3) == 1, 1, 0))
+
+
+def test_hold_list_of_bars_matches_each_column():
+    trigger = random_trigger(11, 200)
+    bars = [1, 3, 10, 200, 500]
+    held = hold_signal(trigger, bars)
+    assert held.shape == (200, len(bars))
+    for j, b in enumerate(bars):
+        np.testing.assert_array_equal(held[:, j], rolling_hold(trigger, b))
+        np.testing.assert_array_equal(hold_position(trigger, bars)[:, j], loop_position(trigger, b))
+
+
+@pytest.mark.parametrize('trigger', [[], [np.nan], [np.nan] * 5, [0.0] * 5, [1.0]])
+def test_hold_edge_inputs(trigger):
+    for bars in (1, 3):
+        np.testing.assert_array_equal(hold_position(trigger, bars), loop_position(trigger, bars))
@@ -0,0 +1,78 @@
+"""
+向量化回测引擎与 Backtrader（策略脚本中的 run_backtest）的一致性测试。
+使用确定性的合成数据：六个资产、交易日各有缺失、起始日期不同，覆盖多组资金、佣金、滑点和仓位设置。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import load_script
+from vector_backtest import vector_backtest
+
+ASSETS = ["000016.SH", "000300.SH", "000852.SH", "000905.SH", "399006.SZ", "399303.SZ"]
+
+# 净值序列允许的最大相对误差
+TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope='module')
+def ema_script():
+    """
+    载入 EMA 策略脚本中的策略类和 run_backtest，运行部分在 __main__ 保护下不会执行
+    """
+    return load_script('EMA策略1.0.py', 'ema_script')
+
+
+def synthetic_results(seed=0, n_bars=400):
+    """
+    生成六个资产的合成K线和信号：随机游走价格，每个资产随机缺失部分交易日，
+    第二个资产晚开始，信号为 1 / -1 / 0 的随机序列
+
+    返回：
+    - {资产: 含 open、high、low、close、volume、signal 列的 DataFrame}
+    """
+    rng = np.random.default_rng(seed)
+    calendar = pd.bdate_range('2020-01-01', periods=n_bars)
+    results = {}
+    for i, code in enumerate(ASSETS):
+        keep = rng.random(n_bars) > 0.05
+        if i == 1:
+            keep[:30] = False
+        dates = calendar[keep]
+        n = len(dates)
+        close = 1000 * (1 + i) * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+        open_ = close * np.exp(rng.normal(0, 0.005, n))
+        high = np.maximum(open_, close) * (1 + rng.random(n) * 0.01)
+        low = np.minimum(open_, close) * (1 - rng.random(n) * 0.01)
+        signal = rng.choice([1.0, -1.0, 0.0], size=n, p=[0.1, 0.1, 0.8])
+        results[code] = pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close,
+                                      'volume': rng.integers(1000, 10000, n).astype(float),
+                                      'signal': signal}, index=dates)
+    return results
+
+
+@pytest.mark.parametrize('cash, commission, slippage_perc, slippage_fixed, size_pct', [
+    (100000.0, 0.0002, 0.0005, None, 0.166),
+    (10000000.0, 0.0, 0.0, None, 0.166),
+    (50000.0, 0.001, 0.002, None, 0.3),
+    (100000.0, 0.0005, None, 0.5, 0.1),
+])
+@pytest.mark.parametrize('seed', [0, 1])
+def test_vector_backtest_matches_backtrader(ema_script, seed, cash, commission, slippage_perc, slippage_fixed, size_pct):
+    results = synthetic_results(seed)
+    strategy = ema_script.EMA_Strategy
+
+    strat = ema_script.run_backtest(strategy, ASSETS, results, cash, commission, slippage_perc,
+                                      slippage_fixed=slippage_fixed, size_pct=size_pct, debug='off')
+    vector = vector_backtest(strategy, ASSETS, results, cash, commission, slippage_perc,
+                             slippage_fixed=slippage_fixed, size_pct=size_pct)
+
+    expected = strat.get_net_value_series()
+    actual = vector.get_net_value_series()
+    assert actual.index.equals(expected.index)
+    diff = np.max(np.abs(actual.to_numpy() - expected.to_numpy()) / np.abs(expected.to_numpy()))
+    assert diff <= TOLERANCE, f"净值序列最大相对误差 {diff:.2e}"
+    assert vector.trade_counts == strat.trade_counts
+    # 合成数据需真正产生交易，否则比较没有意义
+    assert sum(vector.trade_counts.values()) > 0
+    assert expected.iloc[:, 0].nunique() > 1
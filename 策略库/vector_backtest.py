@@ -0,0 +1,189 @@
+"""
+向量化回测引擎，用于各策略文件中基于 signal 列的同一类规则：
+空仓且 signal == 1 时按 int(总资产 * size_pct / 收盘价) 买入，持仓且 signal == -1 时平仓。
+
+撮合规则与 run_backtest 中 Backtrader 的设置保持一致：
+- 信号在当根 K 线收盘后下单，下一根 K 线开盘成交（该资产无新 K 线时顺延）；
+- 百分比滑点（或固定滑点）作用于开盘价，超出当根最高/最低价时按最高/最低价成交；
+- 股票模式的百分比佣金；
+- 下单后先按下单时的收盘价预检资金（checksubmit），成交时资金不足则放弃（Margin）。
+
+价格、信号先对齐为 (时间 x 资产) 矩阵，逐根 K 线只做少量标量运算，不经过 Backtrader 的事件循环。
+"""
+import numpy as np
+import pandas as pd
+
+
+class VectorBacktestResult():
+    """
+    回测结果，接口与策略实例一致：value、dates 列表和 get_net_value_series()
+    """
+
+    def __init__(self, value, dates, trade_counts, positions):
+        self.value = value                  # 组合总净值
+        self.dates = dates                  # 日期序列
+        self.trade_counts = trade_counts    # 每个资产的交易次数
+        self.positions = positions          # 每根K线结束时各资产的持仓数量
+
+    def get_net_value_series(self):
+        """
+        返回净值序列，用于后续分析
+        """
+        return pd.DataFrame(self.value, index=self.dates)
+
+
+def _align(target_assets, strategy_results):
+    """
+    把各资产数据对齐到所有资产日期的并集上，缺失的 K 线沿用上一根的数值
+
+    返回：
+    - dates: 并集日期
+    - fields: {'open'|'high'|'low'|'close'|'signal': (时间 x 资产) 矩阵}
+    - has_bar: 该资产在该日期是否有新 K 线
+    """
+    frames = [strategy_results[code] for code in target_assets]
+    dates = frames[0].index
+    for frame in frames[1:]:
+        dates = dates.union(frame.index)
+
+    fields = {name: np.empty((len(dates), len(frames))) for name in ('open', 'high', 'low', 'close', 'signal')}
+    has_bar = np.zeros((len(dates), len(frames)), dtype=bool)
+    for i, frame in enumerate(frames):
+        pos = dates.get_indexer(frame.index)
+        has_bar[pos, i] = True
+        # 与 PandasDataPlusSignal 一致，signal 取最后一列
+        columns = {'open': frame['open'], 'high': frame['high'], 'low': frame['low'],
+                   'close': frame['close'], 'signal': frame.iloc[:, -1]}
+        for name, values in columns.items():
+            fields[name][:, i] = pd.Series(values.to_numpy(dtype=float), index=frame.index).reindex(dates).ffill().to_numpy()
+    return dates, fields, has_bar
+
+
+def _slipped_price(is_buy, popen, phigh, plow, slippage_perc, slippage_fixed):
+    """
+    与 Backtrader 的 slip_open=True、slip_match=True、slip_out=False 设置一致
+    """
+    if slippage_perc:
+        pslip = popen * (1 + slippage_perc) if is_buy else popen * (1 - slippage_perc)
+    elif slippage_fixed:
+        pslip = popen + slippage_fixed if is_buy else popen - slippage_fixed
+    else:
+        return popen
+    if is_buy:
+        return pslip if pslip <= phigh else phigh
+    return pslip if pslip >= plow else plow
+
+
+def vector_backtest(strategy, target_assets, strategy_results, cash=100000.0, commission=0.0002, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
+    """
+    向量化回测，参数与 run_backtest 相同，可直接替换 run_backtest 传给参数优化函数。
+
+    参数：
+    - strategy: 策略类，只读取其 size_pct 参数，交易规则固定为上述信号规则
+    - target_assets: 资产列表
+    - strategy_results: 信号函数返回的 {资产: 含 signal 列的 DataFrame}
+    - cash: 初始资金
+    - commission: 佣金
+    - slippage_perc: 滑点百分比
+    - slippage_fixed: 固定点滑点，slippage_perc 为 None 时生效
+    - kwargs: 策略参数，目前支持 size_pct
+
+    返回：
+    - VectorBacktestResult
+    """
+    size_pct = kwargs.get('size_pct', strategy.params.size_pct)
+    if slippage_perc is not None:
+        slippage_fixed = None
+
+    dates, fields, has_bar = _align(target_assets, strategy_results)
+    opens, highs, lows, closes, signals = (fields[name] for name in ('open', 'high', 'low', 'close', 'signal'))
+    n_assets = len(target_assets)
+
+    # 所有资产都有数据后策略才开始运行（Backtrader 的 prenext 阶段不交易也不记录净值）
+    started = np.cumsum(has_bar, axis=0).min(axis=1) > 0
+    # 净值日期取第一个资产最近一根K线的日期，与策略中 self.datas[0].datetime 一致
+    first_asset_bar = np.maximum.accumulate(np.where(has_bar[:, 0], np.arange(len(dates)), 0))
+
+    position = np.zeros(n_assets)
+    entry_price = np.zeros(n_assets)
+    trade_counts = {code: 0 for code in target_assets}
+    submitted = []   # 本根K线新下的订单，下一根K线预检资金：(资产, 数量, 下单价格)
+    pending = []     # 已通过预检、等待成交的订单
+
+    value, record_dates, positions = [], [], []
+    for t in range(len(dates)):
+        # 1. 预检上一根K线提交的订单：按下单价格模拟成交，资金不足的订单直接作废
+        check_cash = cash
+        for order in submitted:
+            i, size, created_price = order
+            check_cash -= size * created_price + abs(size) * commission * created_price
+            if check_cash >= 0.0:
+                pending.append(order)
+        submitted = []
+
+        # 2. 有新K线的资产按开盘价（含滑点）成交
+        still_pending = []
+        for order in pending:
+            i, size, created_price = order
+            # 只能在下单之后该资产的新K线上成交
+            if not has_bar[t, i]:
+                still_pending.append(order)
+                continue
+            is_buy = size > 0
+            price = _slipped_price(is_buy, opens[t, i], highs[t, i], lows[t, i], slippage_perc, slippage_fixed)
+            if is_buy:
+                new_cash = cash - abs(size) * price - abs(size) * commission * price
+                if new_cash < 0.0:
+                    continue    # 资金不足，订单作废
+                cash = new_cash
+                entry_price[i] = price
+            else:
+                closed = abs(size)
+                cash += closed * entry_price[i] + closed * (price - entry_price[i])
+                cash -= closed * commission * price
+            position[i] += size
+        pending = still_pending
+
+        if not started[t]:
+            continue
+
+        # 3. 记录净值，按当前收盘价计算
+        total_value = cash + float(np.dot(position, closes[t]))
+        value.append(total_value)
+        record_dates.append(dates[first_asset_bar[t]])
+        positions.append(position.copy())
+
+        # 4. 根据信号下单，订单按资产顺序提交
+        for i, code in enumerate(target_assets):
+            signal = signals[t, i]
+            if signal == 1 and position[i] == 0:
+                size = int(total_value * size_pct / closes[t, i])
+                if size:
+                    submitted.append((i, size, closes[t, i]))
+                trade_counts[code] += 1
+            elif signal == -1 and position[i] > 0:
+                submitted.append((i, -position[i], closes[t, i]))
+                trade_counts[code] += 1
+
+    positions = pd.DataFrame(positions, index=record_dates, columns=list(target_assets))
+    return VectorBacktestResult(value, record_dates, trade_counts, positions)
+
+
+def check_parity(strategy, target_assets, strategy_results, run_backtest_func, cash=100000.0, commission=0.0002, slippage_perc=0.0005, tolerance=1e-6, **kwargs):
+    """
+    分别用 Backtrader（run_backtest_func）和向量化引擎回测同一组信号，比较净值序列。
+
+    返回：
+    - 净值序列的最大相对误差，超过 tolerance 时打印提示
+    """
+    strat = run_backtest_func(strategy, target_assets, strategy_results, cash, commission, slippage_perc, **kwargs)
+    expected = strat.get_net_value_series()
+    actual = vector_backtest(strategy, target_assets, strategy_results, cash, commission, slippage_perc, **kwargs).get_net_value_series()
+
+    if len(expected) != len(actual) or not expected.index.equals(actual.index):
+        print(f"净值序列日期不一致：Backtrader {len(expected)} 条，向量化引擎 {len(actual)} 条")
+        return np.inf
+    diff = np.max(np.abs(actual.to_numpy() - expected.to_numpy()) / np.abs(expected.to_numpy()))
+    if diff > tolerance:
+        print(f"净值序列最大相对误差 {diff:.2e}，超过容差 {tolerance:.0e}")
+    return diff
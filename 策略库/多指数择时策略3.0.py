@@ -3,6 +3,10 @@ import pandas as pd
 import os
 import matplotlib.pyplot as plt
 import numpy as np
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from analyzing_tools import drawdown_episodes
+from frequency import get_annual_factor
 import empyrical as ep
 from bokeh.plotting import figure, show, output_file
 from bokeh.layouts import  gridplot, column
@@ -31,25 +35,7 @@ class DataLoader:
         returns = portfolio_value.pct_change().dropna()
 
         # 确定年化系数
-        if freq == 'D':
-            annual_factor = 252  # 你可以调整为252，如果更适合你的数据
-        elif freq == 'H' or freq == '1H':
-            annual_factor = 252 * 4  # 每天4小时
-        elif freq == '30m':
-            annual_factor = 252 * 4 * 2  # 每小时2个30分钟
-        elif freq == '15m':
-            annual_factor = 252 * 4 * 4  # 每小时4个15分钟
-        elif freq == '5m':
-            annual_factor = 252 * 4 * 12  # 每小时12个5分钟
-        elif freq == '1m':
-            annual_factor = 252 * 4 * 60  # 每小时60个1分钟
-        elif freq == '2H':
-            annual_factor = 252 * 2  # 每天12个2小时
-        elif freq == '4H':
-            annual_factor = 252 * 1  # 每天6个4小时
-
-        else:
-            raise ValueError("Unsupported frequency")
+        annual_factor = get_annual_factor(freq, portfolio_value.index)
 
         # 计算各项绩效指标
         total_return = ep.cum_returns_final(returns)  # 总收益率
@@ -84,18 +70,7 @@ class DataLoader:
         drawdown_ts = (cumulative_returns - running_max) / running_max
 
         # 计算最大恢复时间
-        max_time_to_recovery = 0
-        recovery_start = None
-
-        for date in drawdown_ts.index:
-            drawdown_value = drawdown_ts.get(date, None)  # 使用 .get() 安全访问
-            if drawdown_value is not None and drawdown_value < 0:
-                if recovery_start is None:
-                    recovery_start = date
-            elif recovery_start is not None:
-                recovery_time = (date - recovery_start).days
-                max_time_to_recovery = max(max_time_to_recovery, recovery_time)
-                recovery_start = None
+        max_time_to_recovery, episodes = drawdown_episodes(drawdown_ts)
 
         return portfolio_value, returns, drawdown_ts, {
             'total_return': total_return,
@@ -242,10 +217,11 @@ class DataLoader:
 
 
 # 定义您的两个策略
-class UDVDStrategy(bt.Strategy):
+class UDVDStrategy(NetValueMixin, bt.Strategy):
     params = (
         ('window', 34),  # 计算rolling mean的窗口期
         ('size_pct', 0.166),  # 每个币种的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'
     )
 
     def __init__(self):
@@ -254,9 +230,10 @@ class UDVDStrategy(bt.Strategy):
         self.udvd = {}           # UDVD指标
         self.orders = {}
         self.trade_counts = {}   # 用于管理每个币种的订单状态
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []    # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, fields=('Date', 'Asset', 'Position', 'Size', 'Cash', 'Value', 'UDVD',
+                                                    'Close', 'Volume', 'Trades', 'Signal'),
+                                      level=self.params.debug)    # 存储调试信息
 
         # 初始化每个数据集（即每个币种）的UDVD指标
         for d in self.datas:
@@ -275,8 +252,9 @@ class UDVDStrategy(bt.Strategy):
         total_value = self.broker.getvalue()
         self.value.append(total_value)
         self.dates.append(self.datas[0].datetime.datetime(0))
+        self.recorder.next_bar()
 
-        for d in self.datas:
+        for i, d in enumerate(self.datas):
             name = d._name
             position_size = self.getposition(d).size
             signal_type = 0  # 初始化为无信号
@@ -285,20 +263,24 @@ class UDVDStrategy(bt.Strategy):
             if self.orders[name] is None:
                 signal_type = self.generate_signals(d, position_size)
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': d.datetime.datetime(0),
-                'Asset': name,
-                'Position': position_size,
-                'Size': self.calculate_position_size(d),
-                'Cash': self.broker.getcash(),
-                'Value': self.broker.getvalue(),
-                'UDVD':self.udvd[name][0],
-                'Close': d.close[0],
-                'Volume': d.volume[0],
-                'Trades': self.trade_counts[name],  # 添加交易次数
-                'Signal': signal_type  # 添加买卖信号
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=d.datetime.datetime(0),
+                    Position=position_size,
+                    Size=self.calculate_position_size(d),
+                    Cash=self.broker.getcash(),
+                    Value=self.broker.getvalue(),
+                    UDVD=self.udvd[name][0],
+                    Close=d.close[0],
+                    Volume=d.volume[0],
+                    Trades=self.trade_counts[name],  # 添加交易次数
+                    Signal=signal_type  # 添加买卖信号
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=d.datetime.datetime(0), Position=position_size, Value=total_value,
+                                     Trades=self.trade_counts[name], Signal=signal_type)
 
     def generate_signals(self, data, position_size):
         """
@@ -344,17 +326,16 @@ class UDVDStrategy(bt.Strategy):
         """
         返回净值序列，用于后续分析
         """
-        return pd.Series(self.value, index=self.dates)
+        return self.net_value_series()
 
     def get_debug_df(self):
-        df=pd.DataFrame(self.debug_info)
-        df=df.set_index('Date',drop=True)
-        return df
+        return self.recorder.get_debug_df()
 
-class DonchianStrategy(bt.Strategy):
+class DonchianStrategy(NetValueMixin, bt.Strategy):
     params = (
         ('window', 46),  # 唐奇安通道的窗口大小，即过去多少天的最高和最低价
         ('size_pct', 0.166),  # 仓位大小百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'
     )
     def __init__(self):
         """
@@ -364,13 +345,15 @@ class DonchianStrategy(bt.Strategy):
         self.lowest = {}
         self.orders = {}          # 用于管理每个资产的订单状态
         self.trade_counts = {}    # 用于统计每个资产的交易次数
-        self.value = []           # 存储组合总净值
-        self.dates = []           # 存储日期序列
-        self.debug_info = []
+        self.init_net_value()    # 存储组合总净值和日期序列
+        # 存储调试信息
+        self.recorder = DebugRecorder(self, fields=('Date', 'Asset', 'Position', 'Size', 'Cash', 'Value', 'Highest',
+                                                    'Lowest', 'High', 'Low', 'Close', 'Volume', 'SMA25', 'SMA350',
+                                                    'Trades', 'Signal'),
+                                      level=self.params.debug)
         # 初始化每个资产的25日和350日移动平均线
         self.sma25 = {}
         self.sma350 = {}
-      # 存储调试信息
 
         for d in self.datas:
             name = d._name
@@ -389,8 +372,9 @@ class DonchianStrategy(bt.Strategy):
         total_value = self.broker.getvalue()
         self.value.append(total_value)
         self.dates.append(self.datas[0].datetime.datetime(0))
+        self.recorder.next_bar()
 
-        for d in self.datas:
+        for i, d in enumerate(self.datas):
             name = d._name
             position_size = self.getposition(d).size
             signal_type = 0  # 初始化为无信号
@@ -399,25 +383,29 @@ class DonchianStrategy(bt.Strategy):
             if self.orders[name] is None:
                 signal_type = self.generate_signals(d, position_size)
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': d.datetime.datetime(0),
-                'Asset': name,
-                'Position': position_size,
-                'Size': self.calculate_position_size(d),
-                'Cash': self.broker.getcash(),
-                'Value': self.broker.getvalue(),
-                'Highest': self.highest[name][0],
-                'Lowest': self.lowest[name][0],
-                'High': d.high[0],
-                'Low': d.low[0],
-                'Close': d.close[0],
-                'Volume': d.volume[0],                
-                'SMA25': self.sma25[name][0],
-                'SMA350': self.sma350[name][0],
-                'Trades': self.trade_counts[name],  # 添加交易次数
-                'Signal': signal_type  # 添加买卖信号
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=d.datetime.datetime(0),
+                    Position=position_size,
+                    Size=self.calculate_position_size(d),
+                    Cash=self.broker.getcash(),
+                    Value=self.broker.getvalue(),
+                    Highest=self.highest[name][0],
+                    Lowest=self.lowest[name][0],
+                    High=d.high[0],
+                    Low=d.low[0],
+                    Close=d.close[0],
+                    Volume=d.volume[0],
+                    SMA25=self.sma25[name][0],
+                    SMA350=self.sma350[name][0],
+                    Trades=self.trade_counts[name],  # 添加交易次数
+                    Signal=signal_type  # 添加买卖信号
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=d.datetime.datetime(0), Position=position_size, Value=total_value,
+                                     Trades=self.trade_counts[name], Signal=signal_type)
 
     def generate_signals(self, data, position_size):
         """
@@ -465,23 +453,19 @@ class DonchianStrategy(bt.Strategy):
         """
         返回净值序列，用于后续分析
         """
-        return pd.Series(self.value, index=self.dates)
+        return self.net_value_series()
 
     def get_debug_df(self):
-
-        df=pd.DataFrame(self.debug_info)
-
-        df=df.set_index('Date',drop=True)
-
-        return df
+        return self.recorder.get_debug_df()
 
 # 定义策略
-class BBS_Strategy(bt.Strategy):
+class BBS_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('window', 144),  
         ('short_period', 20),
         ('long_period',60),
         ('size_pct', 0.2),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'
     )
 
     def __init__(self):
@@ -491,9 +475,10 @@ class BBS_Strategy(bt.Strategy):
         self.diff = {}  # 信号
         self.orders = {}
         self.trade_counts = {}   # 用于管理每个资产的订单状态
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, fields=('Date', 'Asset', 'Position', 'Size', 'Cash', 'Value', 'Short_MA',
+                                                    'Long_MA', 'Close', 'Volume', 'Trades', 'Signal'),
+                                      level=self.params.debug)     # 存储调试信息
 
         # 初始化每个数据集（即每个资产）的自由流通换手率
         for d in self.datas:
@@ -523,8 +508,9 @@ class BBS_Strategy(bt.Strategy):
         total_value = self.broker.getvalue()
         self.value.append(total_value)
         self.dates.append(self.datas[0].datetime.datetime(0))
+        self.recorder.next_bar()
 
-        for d in self.datas:
+        for i, d in enumerate(self.datas):
             name = d._name
             position_size = self.getposition(d).size
             signal_type = 0  # 初始化为无信号
@@ -533,21 +519,25 @@ class BBS_Strategy(bt.Strategy):
             if self.orders[name] is None:
                 signal_type = self.generate_signals(d, position_size)
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': d.datetime.datetime(0),
-                'Asset': name,
-                'Position': position_size,
-                'Size': self.calculate_position_size(d),
-                'Cash': self.broker.getcash(),
-                'Value': self.broker.getvalue(),
-                'Short_MA': self.short_MA[name][0],  # 当前的自由流通换手率
-                'Long_MA': self.long_MA[name][0],
-                'Close': d.close[0],
-                'Volume': d.volume[0],
-                'Trades': self.trade_counts[name],  # 添加交易次数
-                'Signal': signal_type  # 添加买卖信号
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=d.datetime.datetime(0),
+                    Position=position_size,
+                    Size=self.calculate_position_size(d),
+                    Cash=self.broker.getcash(),
+                    Value=self.broker.getvalue(),
+                    Short_MA=self.short_MA[name][0],  # 当前的自由流通换手率
+                    Long_MA=self.long_MA[name][0],
+                    Close=d.close[0],
+                    Volume=d.volume[0],
+                    Trades=self.trade_counts[name],  # 添加交易次数
+                    Signal=signal_type  # 添加买卖信号
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=d.datetime.datetime(0), Position=position_size, Value=total_value,
+                                     Trades=self.trade_counts[name], Signal=signal_type)
 
     def generate_signals(self, data, position_size):
         """
@@ -593,15 +583,13 @@ class BBS_Strategy(bt.Strategy):
         """
         返回净值序列，用于后续分析
         """
-        return pd.Series(self.value, index=self.dates)
+        return self.net_value_series()
 
     def get_debug_df(self):
         """
         返回调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df = df.set_index('Date', drop=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 # 主函数
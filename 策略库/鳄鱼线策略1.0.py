@@ -3,6 +3,10 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars
+from signal_tools import select_signal
 
 # 定义鳄鱼线策略函数
 def alligator_strategy(target_assets, paths):
@@ -14,12 +18,9 @@ def alligator_strategy(target_assets, paths):
     #编写策略主体部分
     for code in target_assets:
         # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
-        hourly_data = pd.read_csv(os.path.join(paths['hourly'], f"{code}.csv"), index_col=[0])
-        hourly_data.index = pd.to_datetime(hourly_data.index)
-        mins_15_data = pd.read_csv(os.path.join(paths['min15'], f"{code}.csv"), index_col=[0])
-        mins_15_data.index = pd.to_datetime(mins_15_data.index)
+        daily_data = load_bars(code, 'daily', paths)
+        hourly_data = load_bars(code, 'hourly', paths)
+        mins_15_data = load_bars(code, 'min15', paths)
         mins_15_data = mins_15_data[~mins_15_data.index.duplicated(keep='first')]
 
         # 提取收盘价
@@ -40,15 +41,10 @@ def alligator_strategy(target_assets, paths):
         result.dropna(inplace=True)
 
         # 生成交易信号
-        def signal_generation(row):
-            if row['Lips'] > row['Teeth'] > row['Jaw']:
-                return 1  # 多头信号
-            elif row['Lips'] < row['Teeth'] < row['Jaw']:
-                return -1  # 空头信号
-            else:
-                return 0  # 无信号
-
-        result['signal'] = result.apply(signal_generation, axis=1)
+        result['signal'] = select_signal([
+            ((result['Lips'] > result['Teeth']) & (result['Teeth'] > result['Jaw']), 1),   # 多头信号
+            ((result['Lips'] < result['Teeth']) & (result['Teeth'] < result['Jaw']), -1),  # 空头信号
+        ], default=0)  # 无信号
 
 
         # 将信号合并回每日数据
@@ -70,17 +66,17 @@ class PandasDataPlusSignal(bt.feeds.PandasData):
     )
 
 # 策略类，包含调试信息和导出方法
-class Alligator_Strategy(bt.Strategy):
+class Alligator_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.999),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -92,8 +88,9 @@ class Alligator_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -109,22 +106,26 @@ class Alligator_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -145,19 +146,11 @@ class Alligator_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, cash=100000.0, commission=0.0006, slippage_perc=0.001, slippage_fixed=None, **kwargs):
@@ -187,37 +180,39 @@ def run_backtest(strategy, target_assets, cash=100000.0, commission=0.0006, slip
     strategies = cerebro.run()  # 运行回测
     return strategies[0]
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'E:\数据库\同花顺ETF跟踪指数量价数据\1d',
-    'hourly': r'E:\数据库\同花顺ETF跟踪指数量价数据\1h',
-    'min15': r'E:\数据库\同花顺ETF跟踪指数量价数据\15min',
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'E:\数据库\同花顺ETF跟踪指数量价数据\1d',
+        'hourly': r'E:\数据库\同花顺ETF跟踪指数量价数据\1h',
+        'min15': r'E:\数据库\同花顺ETF跟踪指数量价数据\15min',
+    }
 
-# 资产列表
-target_assets = ['399006.SZ']
+    # 资产列表
+    target_assets = ['399006.SZ']
 
 
-# 生成信号
-strategy_results,full_info = alligator_strategy(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = alligator_strategy(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(Alligator_Strategy,target_assets,1000000,0,0)
+    # 获取策略实例
+    strat = run_backtest(Alligator_Strategy,target_assets,1000000,0,0)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-AT.plot_results('399006.SZ',portfolio_value, drawdown_ts, returns, metrics)
+    # 获取净值序列
+    AT.plot_results('399006.SZ',portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
 
 
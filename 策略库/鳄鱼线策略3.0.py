@@ -3,9 +3,13 @@ import pandas as pd
 import backtrader as bt
 import matplotlib.pyplot as plt
 from analyzing_tools import Analyzing_Tools
+from debug_recorder import DebugRecorder
+from net_value import NetValueMixin
+from bar_store import load_bars
+from signal_tools import fractal_levels, select_signal, carry_forward
 import numpy as np
 
-def alligator_strategy_with_ao_and_fractal_macd(target_assets, paths):
+def alligator_strategy_with_ao_and_fractal_macd(target_assets, paths, fractal_wing=3, fractal_causal=False):
     # 信号结果字典
     results = {}
     # 全数据字典，包含计算指标用于检查
@@ -13,12 +17,9 @@ def alligator_strategy_with_ao_and_fractal_macd(target_assets, paths):
 
     for code in target_assets:
         # 读取数据
-        daily_data = pd.read_csv(os.path.join(paths['daily'], f"{code}.csv"), index_col=[0])
-        daily_data.index = pd.to_datetime(daily_data.index)
-        hourly_data = pd.read_csv(os.path.join(paths['hourly'], f"{code}.csv"), index_col=[0])
-        hourly_data.index = pd.to_datetime(hourly_data.index)
-        mins_15_data = pd.read_csv(os.path.join(paths['min15'], f"{code}.csv"), index_col=[0])
-        mins_15_data.index = pd.to_datetime(mins_15_data.index)
+        daily_data = load_bars(code, 'daily', paths)
+        hourly_data = load_bars(code, 'hourly', paths)
+        mins_15_data = load_bars(code, 'min15', paths)
         mins_15_data = mins_15_data[~mins_15_data.index.duplicated(keep='first')]
 
         # 提取收盘价
@@ -47,15 +48,10 @@ def alligator_strategy_with_ao_and_fractal_macd(target_assets, paths):
         result.dropna(inplace=True)
 
         # 生成交易信号
-        def signal_generation(row):
-            if row['Lips'] > row['Teeth'] > row['Jaw']:
-                return 1  # 多头信号
-            elif row['Lips'] < row['Teeth'] < row['Jaw']:
-                return -1  # 空头信号
-            else:
-                return 0  # 无信号
-
-        result['Alligator_signal'] = result.apply(signal_generation, axis=1)
+        result['Alligator_signal'] = select_signal([
+            ((result['Lips'] > result['Teeth']) & (result['Teeth'] > result['Jaw']), 1),   # 多头信号
+            ((result['Lips'] < result['Teeth']) & (result['Teeth'] < result['Jaw']), -1),  # 空头信号
+        ], default=0)  # 无信号
 
         #分形形态信号计算
         def identify_fractals_and_record_values(df):
@@ -64,51 +60,23 @@ def alligator_strategy_with_ao_and_fractal_macd(target_assets, paths):
             :param data: 包含时间序列数据的 DataFrame，需包含 'high', 'low', 'close' 列。
             :return: 包含 up_fractal_value 和 down_fractal_value 的 DataFrame。
             """
-            # 初始化两列用于记录分形值
+            # 向上分形：中间高点最高，且左右两侧各 fractal_wing 根K线逐级降低；向下分形相反
             data=df.copy()
-            data['up_fractal_value'] = None
-            data['down_fractal_value'] = None
-
-            # 遍历数据，识别分形并记录关键值
-            for i in range(4, len(data) - 4):  # 确保有足够的数据进行完整分形判断
-                # 向上分形：中间高点最高，且左右两侧逐级降低
-                if (data['high'][i] > data['high'][i - 1] and data['high'][i] > data['high'][i + 1] and  # 中间点高于左右
-                    data['high'][i - 1] > data['high'][i - 2] and data['high'][i + 1] > data['high'][i + 2] and  # 左右点高于更远点
-                    data['high'][i - 2] > data['high'][i - 3] and data['high'][i + 2] > data['high'][i + 3]):  # 更远点高于最远点
-                    # 记录过去 5 日的最高价的最高值
-                    data.loc[data.index[i], 'up_fractal_value'] = data['high'][i - 4:i + 1].max()
-
-                # 向下分形：中间低点最低，且左右两侧逐级升高
-                if (data['low'][i] < data['low'][i - 1] and data['low'][i] < data['low'][i + 1] and  # 中间点低于左右
-                    data['low'][i - 1] < data['low'][i - 2] and data['low'][i + 1] < data['low'][i + 2] and  # 左右点低于更远点
-                    data['low'][i - 2] < data['low'][i - 3] and data['low'][i + 2] < data['low'][i + 3]):  # 更远点低于最远点
-                    # 记录过去 5 日的最低价的最低值
-                    data.loc[data.index[i], 'down_fractal_value'] = data['low'][i - 4:i + 1].min()
-
-            # 向下填充分形值
-            data['up_fractal_value'].fillna(method='ffill', inplace=True)
-            data['down_fractal_value'].fillna(method='ffill', inplace=True)
+            data['up_fractal_value'], data['down_fractal_value'] = fractal_levels(
+                data['high'], data['low'], wing=fractal_wing, lookback=5, causal=fractal_causal)
 
             return data
         
         def calculate_fractal_signals(df):
             """
-            基于分形值计算交易信号，并在特定情况下保持上一周期的信号。
+            基于分形值计算交易信号。
             :param data: 包含 'close', 'up_fractal_value', 'down_fractal_value' 列的 DataFrame。
             :return: 包含 fractal_signal 的 DataFrame。
             """
-            # 初始化信号列，默认值为 0
             data=df.copy()
-            data['fractal_signal'] = 0
-
-            # 遍历数据，每一行根据条件更新信号
-            for i in range(1, len(data)):
-                if data['close'][i] > data['up_fractal_value'][i]:  # 收盘价高于最近的上分形的最高价，看多
-                    data.loc[data.index[i], 'fractal_signal'] = 1
-                elif data['close'][i] < data['down_fractal_value'][i]:  # 收盘价低于最近的下分形的最低价，看空
-                    data.loc[data.index[i], 'fractal_signal'] = -1
-                else:  # 其他情况，维持上一周期的信号
-                    data.loc[data.index[i], 'fractal_signal'] = 0
+            # 收盘价高于最近的上分形的最高价看多，低于最近的下分形的最低价看空，其他情况为 0
+            data['fractal_signal'] = np.select(
+                [data['close'] > data['up_fractal_value'], data['close'] < data['down_fractal_value']], [1, -1], 0)
 
             return data
    
@@ -155,44 +123,27 @@ def alligator_strategy_with_ao_and_fractal_macd(target_assets, paths):
         # 2. 计算能量柱
         df['macd_bar'] = (df['diff'] - df['dea']) * 2
 
-        # 添加macd信号列
-        def macd_generate_signal(row):
-            # 水上或零轴看多信号
-            if row['diff'] > row['dea'] and row['macd_bar'] >= 0:
-                return 1
-            # 水下或零轴看空信号
-            elif row['diff'] < row['dea'] and row['macd_bar'] <= 0:
-                return -1
-            # 无信号
-            else:
-                return 0
-
-        # 应用macd信号生成规则
-        df['MACD_signal'] = df.apply(macd_generate_signal, axis=1)
+        # 添加macd信号列：水上或零轴看多，水下或零轴看空，其余无信号
+        df['MACD_signal'] = select_signal([
+            ((df['diff'] > df['dea']) & (df['macd_bar'] >= 0), 1),
+            ((df['diff'] < df['dea']) & (df['macd_bar'] <= 0), -1),
+        ], default=0)
         
         macd_df=df[['MACD_signal']]
 
         result=pd.merge(result,macd_df,right_index=True,left_index=True)
         #计算最终信号
 
-        result['signal'] = 0
-        for i in range(len(result)):
-            long_condition = (result['Alligator_signal'][i] == 1 and 
-                            (result['MACD_signal'][i] == 1 or result['Fractal_signal'][i] == 1
-                             or result['AO_signal'][i] == 1)
-                             )
-            short_condition = (result['Alligator_signal'][i] == -1 or
-                            result['AO_signal'][i] == -1 or result['Fractal_signal'][i] == -1 or
-                            result['MACD_signal'][i]== -1)
-            
-            if long_condition and short_condition:  # 同时触发多空信号
-                result['signal'][i] = result['signal'][i - 1] if i > 0 else 0  # 延续上一周期信号
-            elif long_condition:
-                result['signal'][i] = 1  # 看多
-            elif short_condition:
-                result['signal'][i] = -1  # 看空
-            else:
-                result['signal'][i] = result['signal'][i - 1] if i > 0 else 0 # 延续上一周期信号
+        long_condition = ((result['Alligator_signal'] == 1) &
+                          ((result['MACD_signal'] == 1) | (result['Fractal_signal'] == 1) | (result['AO_signal'] == 1)))
+        short_condition = ((result['Alligator_signal'] == -1) | (result['AO_signal'] == -1) |
+                           (result['Fractal_signal'] == -1) | (result['MACD_signal'] == -1))
+        # 同时触发多空信号或都未触发时延续上一周期信号（np.nan），开头没有上一周期时为 0
+        result['signal'] = carry_forward(select_signal([
+            (long_condition & short_condition, np.nan),
+            (long_condition, 1),   # 看多
+            (short_condition, -1),  # 看空
+        ], default=np.nan), initial=0).astype(int)
 
         # 存储结果
         signal=result[['signal']]
@@ -210,17 +161,17 @@ class PandasDataPlussignal(bt.feeds.PandasData):
 
 
 # 策略类，包含调试信息和导出方法
-class Alligator_Strategy(bt.Strategy):
+class Alligator_Strategy(NetValueMixin, bt.Strategy):
     params = (
         ('size_pct',0.16),  # 每个资产的仓位百分比
+        ('debug', 'full'),  # 调试信息记录级别：'off'、'summary' 或 'full'，参数优化时为 'off'
     )
 
     def __init__(self):
         self.orders = {}         # 用于跟踪每个资产的订单状态
         self.trade_counts = {}   # 记录每个资产的交易次数
-        self.value = []          # 存储组合总净值
-        self.dates = []          # 存储日期序列
-        self.debug_info = []     # 存储调试信息
+        self.init_net_value()    # 存储组合总净值和日期序列
+        self.recorder = DebugRecorder(self, level=self.params.debug)   # 存储调试信息
 
         for data in self.datas:
             name = data._name
@@ -232,8 +183,9 @@ class Alligator_Strategy(bt.Strategy):
         self.value.append(total_value)
         current_date = self.datas[0].datetime.datetime(0)
         self.dates.append(current_date)
+        self.recorder.next_bar()
 
-        for data in self.datas:
+        for i, data in enumerate(self.datas):
             name = data._name
             position_size = self.getposition(data).size
             signal = data.signal[0]
@@ -249,22 +201,26 @@ class Alligator_Strategy(bt.Strategy):
                 self.trade_counts[name] += 1
 
 
-            # 存储调试信息
-            self.debug_info.append({
-                'Date': current_date,
-                'Asset': name,
-                'Position': position_size,
-                'Signal': signal,
-                'Size': self.calculate_position_size(data),
-                'Open':data.open[0],
-                'High':data.high[0],
-                'Low':data.low[0],
-                'Volume':data.volume[0],
-                'Close': data.close[0],
-                'Cash': self.broker.getcash(),
-                'Value': total_value,
-                'Trades': self.trade_counts[name],
-            })
+            # 存储调试信息，仓位和现金只在 full 级别计算
+            if self.recorder.full:
+                self.recorder.record(
+                    i,
+                    Date=current_date,
+                    Position=position_size,
+                    Signal=signal,
+                    Size=self.calculate_position_size(data),
+                    Open=data.open[0],
+                    High=data.high[0],
+                    Low=data.low[0],
+                    Volume=data.volume[0],
+                    Close=data.close[0],
+                    Cash=self.broker.getcash(),
+                    Value=total_value,
+                    Trades=self.trade_counts[name],
+                )
+            elif self.recorder.active:
+                self.recorder.record(i, Date=current_date, Position=position_size, Signal=signal,
+                                     Value=total_value, Trades=self.trade_counts[name])
 
 
     def calculate_position_size(self, data):
@@ -285,19 +241,11 @@ class Alligator_Strategy(bt.Strategy):
             name = order.data._name
             self.orders[name] = None
 
-    def get_net_value_series(self):
-        """
-        返回净值序列，用于后续分析
-        """
-        return pd.DataFrame(self.value, index=self.dates)
-
     def get_debug_df(self):
         """
         返回包含调试信息的DataFrame
         """
-        df = pd.DataFrame(self.debug_info)
-        df.set_index('Date', inplace=True)
-        return df
+        return self.recorder.get_debug_df()
 
 
 def run_backtest(strategy, target_assets, cash=100000.0, commission=0.0005, slippage_perc=0.0005, slippage_fixed=None, **kwargs):
@@ -327,56 +275,58 @@ def run_backtest(strategy, target_assets, cash=100000.0, commission=0.0005, slip
     strategies = cerebro.run()  # 运行回测
     return strategies[0]
 
-#加载分析工具
-AT=Analyzing_Tools()
+# 主函数
+if __name__ == '__main__':
+    #加载分析工具
+    AT=Analyzing_Tools()
 
 
-# 定义数据路径
-paths = {
-    'daily': r'D:\数据库\同花顺ETF跟踪指数量价数据\1d',
-    'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
-    'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
-    'pv_export':r"D:\量化交易构建\私募基金研究\股票策略研究\策略净值序列"
-}
+    # 定义数据路径
+    paths = {
+        'daily': r'D:\数据库\同花顺ETF跟踪指数量价数据\1d',
+        'hourly': r'D:\数据库\同花顺ETF跟踪指数量价数据\1h',
+        'min15': r'D:\数据库\同花顺ETF跟踪指数量价数据\15min',
+        'pv_export':r"D:\量化交易构建\私募基金研究\股票策略研究\策略净值序列"
+    }
 
-# # 资产列表
-target_assets = [
-    "000016.SH",
-    "000300.SH",
-    "000852.SH",
-    "000905.SH",
-    "399006.SZ",
-    "399303.SZ"
-]
+    # # 资产列表
+    target_assets = [
+        "000016.SH",
+        "000300.SH",
+        "000852.SH",
+        "000905.SH",
+        "399006.SZ",
+        "399303.SZ"
+    ]
 
 
 
-# 生成信号
-strategy_results,full_info = alligator_strategy_with_ao_and_fractal_macd(target_assets, paths)
+    # 生成信号
+    strategy_results,full_info = alligator_strategy_with_ao_and_fractal_macd(target_assets, paths)
 
 
-# 获取策略实例
-strat = run_backtest(Alligator_Strategy,target_assets,10000000,0.0005,0.0005)
+    # 获取策略实例
+    strat = run_backtest(Alligator_Strategy,target_assets,10000000,0.0005,0.0005)
 
-pv=strat.get_net_value_series()
+    pv=strat.get_net_value_series()
 
-strtegy_name='EMA'
+    strtegy_name='EMA'
 
-pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
+    pv.to_excel(paths["pv_export"]+'\\'+strtegy_name+'.xlsx')
 
 
-portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
+    portfolio_value, returns, drawdown_ts, metrics = AT.performance_analysis(pv, freq='D')
 
-# 获取净值序列
-index_price_path=paths['daily']
+    # 获取净值序列
+    index_price_path=paths['daily']
 
-AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
+    AT.plot_results('000906.SH',index_price_path,portfolio_value, drawdown_ts, returns, metrics)
 
-# 获取调试信息
-debug_df = strat.get_debug_df()
+    # 获取调试信息
+    debug_df = strat.get_debug_df()
 
-#蒙特卡洛模拟
-AT.monte_carlo_analysis(strat)
+    #蒙特卡洛模拟
+    AT.monte_carlo_analysis(strat)
 
 
 